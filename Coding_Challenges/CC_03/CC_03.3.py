@@ -10,133 +10,109 @@
 # and Winter (December, January, February).
 # 4. Calculate the anomaly for each value in the dataset relative to the mean for the entire time series.
 
+import os
+import sys
+import time
+
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-
-# I feel more comfortable working with Pandas
-df = pd.read_csv('co2-ppm-daily.csv', usecols=['date', 'value'])
-
-##### TASK 1
-
-# Create lists for the years
-all_years = []
-unique_years = []
-for i in range(len(df)):
-    year = df['date'][i].split('-')[0]
-    all_years.append(year)
-    if year not in unique_years:
-        unique_years.append(year)
-
-df['year'] = all_years
-
-# Calculate annual averages and print
-annual_avg_list = []
-for year in unique_years:
-    annual_sum = 0.0
-    annual_count = 0
-    annual_avg = 0.0
-    for i in range(len(df)):
-        y = int(df['date'][i].split('-')[0])
-        if y == int(year):
-            annual_sum += df['value'][i]
-            annual_count += 1
-
-    annual_avg = annual_sum / float(annual_count)
-    annual_avg_list.append(annual_avg)
-    print(str(year) + ': ' + str(annual_avg))
-
-#### TASK 2
-
-# MAXIMUM
-maximum = max(df['value'])
-print('Maximum CO2 value: ' + str(maximum))
-
-# MINIMUM
-minimum = min(df['value'])
-print('Minimum CO2 value: ' + str(minimum))
-
-# AVERAGE
-mean = sum(df['value']) / len(df['value'])
-print('Average CO2 value: ' + str(mean))
-
-#### TASK 3
-
-# First, create lists for all the months
-all_months = []
-unique_months = []
-for i in range(len(df)):
-    month = df['date'][i].split('-')[1]
-    all_months.append(month)
-    if month not in unique_months:
-        unique_months.append(month)
-
-df['month'] = all_months
-
-# Print unique months to know the order they appear in the list, need this for seasonal average calculation
-print(unique_months)
-
-# Calculate averages for each month
-month_avg_list = []
-for month in unique_months:
-    month_sum = 0.0
-    month_count = 0
-    month_avg = 0.0
-    for i in range(len(df)):
-        m = int(df['date'][i].split('-')[1])
-        if m == int(month):
-            month_sum += df['value'][i]
-            month_count += 1
-
-    month_avg = month_sum / float(month_count)
-    month_avg_list.append(month_avg)
-    print(str(month) + ': ' + str(month_avg))
-
-# Average the monthly averages for each season and print, note the order obtained from unique_months list
-winter_avg = (month_avg_list[7] + month_avg_list[8] + month_avg_list[9])/3
-spring_avg = (month_avg_list[0] + month_avg_list[1] + month_avg_list[2])/3
-summer_avg = (month_avg_list[10] + month_avg_list[3] + month_avg_list[4])/3
-fall_avg = (month_avg_list[5] + month_avg_list[11] + month_avg_list[6])/3
-print('winter average: ' + str(winter_avg))
-print('spring average: ' + str(spring_avg))
-print('summer average: ' + str(summer_avg))
-print('fall average: ' + str(fall_avg))
-
-#### TASK 4
-
-## I tried a few statistics tests for this part. It's been a while since I've tried this stuff
-## and wanted to see if I could do it in python
-
-# Calculates difference from the mean, aka anomaly
-anomalies = []
-for i in range(len(df)):
-    anomaly = df['value'][i] - mean
-    anomalies.append(anomaly)
-
-df['anomaly'] = anomalies
-
-# Calculates z-score for each value (how many standard deviations the value is from the mean)
-z_scores = []
-for i in range(len(df)):
-    z_score = np.abs((df['value'][i] - mean) / np.std(df['value']))
-    z_scores.append(z_score)
-
-df['z_score'] = z_scores
-
-# Determines outliers, if z-score is greater than 1.96, aka outside the 95% confidence interval
-# Outlier = 1 if outlier, 0 if not
-outlier =[]
-outlier_count = 0
-for i in range(len(df)):
-    if df['z_score'][i] > 1.96:
-        bin = 1
-        outlier.append(bin)
-        outlier_count += 1
+
+# Statistics are computed with grouped reductions over the parsed dates, see co2_stats.py
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from co2_stats import co2_statistics
+from co2_stream import stream_statistics, stream_anomalies
+from co2_incremental import IncrementalState, rolling_anomalies
+
+###### USER INPUTS ######
+input_files = ['co2-ppm-daily.csv']  # One csv, or one per station - shards are combined
+chunk_size = None   # Rows per chunk to stream files too large for memory (e.g. 1000000), None to load them at once
+processes = 1   # Number of shards to stream at once
+seasons = None  # Season table, e.g. {'Wet': [11, 12, 1, 2, 3, 4], 'Dry': [5, 6, 7, 8, 9, 10]} - None for meteorological
+incremental = False     # Only read the rows appended since the last run, keeping the running statistics in state_file
+state_file = 'co2_state.pkl'    # Delete it to start over
+rolling_window = None   # Days of the trailing window for rolling (detrended) anomalies, e.g. 365 - None to skip
+###### USER INPUTS ######
+
+##### Run the statistics - under a main guard, so the processes that stream shards in parallel can import this script
+##### without running it again
+if __name__ == '__main__':
+    start_time = time.time()
+
+    if incremental:
+        # Add the new rows of each file to the saved running statistics, writing their anomalies to co2_anomalies.csv
+        state = IncrementalState.load(state_file, seasons=seasons, window_days=rolling_window)
+        new_rows = outlier_count = 0
+        for path in input_files:
+            rows, outliers = state.update(path, 'co2_anomalies.csv')
+            new_rows += rows
+            outlier_count += outliers
+        state.save(state_file)
+        stats = state.accumulator.results()
+    elif chunk_size is None:
+        # I feel more comfortable working with Pandas - the files are put in date order for the rolling window
+        df = pd.concat([pd.read_csv(path, usecols=['date', 'value']) for path in input_files], ignore_index=True)
+        df = df.sort_values('date', kind='stable', ignore_index=True,
+                            key=lambda dates: pd.to_datetime(dates, format='ISO8601'))
+
+        # Dates are parsed once into years and months, then every task is a grouped reduction
+        stats = co2_statistics(df, seasons=seasons)
     else:
-        bin = 0
-        outlier.append(bin)
+        # Running statistics of each shard, read chunk by chunk and merged - the series is never loaded at once
+        stats = stream_statistics(input_files, chunksize=chunk_size, processes=processes, seasons=seasons).results()
+
+    ##### TASK 1
+
+    # Annual averages
+    for year, annual_avg in stats['annual']['mean'].items():
+        print(str(year) + ': ' + str(annual_avg))
+
+    #### TASK 2
+
+    # MAXIMUM
+    print('Maximum CO2 value: ' + str(stats['max']))
+
+    # MINIMUM
+    print('Minimum CO2 value: ' + str(stats['min']))
+
+    # AVERAGE
+    print('Average CO2 value: ' + str(stats['mean']))
 
-df['outlier'] = outlier
-print('Outlier count: ' + str(outlier_count))
+    #### TASK 3
 
-print(df)
\ No newline at end of file
+    # Averages for each month
+    for month, month_avg in stats['monthly']['mean'].items():
+        print('{0:02d}: {1}'.format(month, month_avg))
+
+    # Seasonal averages of the daily values - each month is matched to its season by calendar month through a lookup
+    # array
+    for season, season_avg in stats['seasonal']['mean'].items():
+        print(season.lower() + ' average: ' + str(season_avg))
+
+    # Average of each season of each year - December is in the winter of the next year
+    print(stats['seasonal_annual'])
+
+    #### TASK 4
+
+    ## I tried a few statistics tests for this part. It's been a while since I've tried this stuff
+    ## and wanted to see if I could do it in python
+
+    # Anomaly (difference from the mean), z-score (how many standard deviations the value is from the mean) and
+    # outliers, if z-score is greater than 1.96, aka outside the 95% confidence interval - Outlier = 1 if outlier,
+    # 0 if not
+    if incremental:
+        print('New rows: ' + str(new_rows) + ', new outlier count: ' + str(outlier_count))
+    elif chunk_size is None:
+        df = stats['values']
+        print('Outlier count: ' + str(df['outlier'].sum()))
+
+        # Anomaly from the mean of the trailing window, which takes out the long-term trend
+        if rolling_window:
+            df['roll_anomaly'], df['roll_z_score'], df['roll_outlier'] = rolling_anomalies(df['date'], df['value'],
+                                                                                             rolling_window)
+            print('Rolling outlier count: ' + str(df['roll_outlier'].sum()))
+        print(df)
+    else:
+        # Second streaming pass with the final mean and standard deviation, written to co2_anomalies.csv
+        outlier_count = stream_anomalies(input_files, 'co2_anomalies.csv', stats['mean'], stats['std'],
+                                         chunksize=chunk_size)
+        print('Outlier count: ' + str(outlier_count))
+    print('Run time: {0:.3f} s'.format(time.time() - start_time))
@@ -0,0 +1,194 @@
+########################
+# Incremental and rolling anomalies for CO2 series that are appended to (e.g. new days added to co2-ppm-daily.csv).
+#
+# Every run of CC_03.3 used to recompute every anomaly and z-score from scratch, even when only a few days were added.
+# IncrementalState keeps, between runs, in one state file:
+#
+#     1. the running statistics of everything read so far (a co2_stream.CO2Accumulator)
+#     2. the byte offset read up to in each csv, so the next run seeks past the rows it already has. Only complete
+#        lines are read - a line still being written is left for the next run
+#     3. the last window of values of each csv, for the rolling anomaly of its next rows
+#     4. the columns of each output csv it writes, which is started afresh by a new state
+#
+# A state saved with other fields, seasons or rolling window than asked for is started over, so changing them in
+# CC_03.3 takes effect on the next run.
+# A run reads the new rows in two streaming passes: the first adds them to the running statistics, the second writes
+# their anomaly, z-score and outlier flag against the updated mean and standard deviation.
+#
+# rolling_anomalies is the anomaly from the mean of the trailing window (e.g. 365 days) instead of the whole series,
+# which takes out the long-term trend. The window sums come from cumulative sums, so each row costs O(1) however long
+# the window is. The windows are found by searching the dates, so they must be in order - dates going backwards raise
+# a ValueError instead of giving wrong windows.
+########################
+
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from co2_stats import anomalies
+from co2_stream import CO2Accumulator
+
+
+def rolling_anomalies(dates, values, window_days=365, threshold=1.96):
+    """Return the anomaly from the mean of the trailing window_days (the window ends at each value and includes it),
+    the absolute z-score against the window's standard deviation and the outlier flag of every value. Dates must be
+    in order. Missing values are left out of the windows and get no anomaly."""
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return np.array([]), np.array([]), np.array([], dtype=np.int8)
+    dates = pd.DatetimeIndex(pd.to_datetime(dates, format='ISO8601'))
+    time = np.asarray((dates - dates[0]) / pd.Timedelta(days=1), dtype=float)
+    backwards = np.flatnonzero(np.diff(time) < 0)
+    if len(backwards):
+        raise ValueError('Dates must be in order for rolling anomalies - {0} comes after {1}'
+                         .format(dates[backwards[0] + 1].date(), dates[backwards[0]].date()))
+
+    # Values in (t - window_days, t] for every t - sums and counts of the window from the differences of cumulative
+    # sums of the values that are not missing, taken relative to the first of them so the sums of squares do not lose
+    # precision
+    start = np.searchsorted(time, time - window_days, side='right')
+    end = np.arange(1, len(values) + 1)
+    valid = ~np.isnan(values)
+    shift = values[valid][0] if valid.any() else 0.0
+    shifted = np.where(valid, values - shift, 0.0)
+    counts = np.r_[0, np.cumsum(valid)]
+    sums = np.r_[0, np.cumsum(shifted)]
+    squares = np.r_[0, np.cumsum(shifted ** 2)]
+    count = counts[end] - counts[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, (sums[end] - sums[start]) / np.maximum(count, 1), np.nan)
+        variance = np.maximum((squares[end] - squares[start]) / np.maximum(count, 1) - mean ** 2, 0)
+
+        anomaly = values - shift - mean
+        std = np.sqrt(variance)
+        z_score = np.where(std > 0, np.abs(anomaly / std), np.where(np.isnan(anomaly), np.nan, 0.0))
+    return anomaly, z_score, (z_score > threshold).astype(np.int8)
+
+
+class IncrementalState(object):
+    def __init__(self, date_field='date', value_field='value', seasons=None, window_days=None):
+        """Running statistics, byte offsets and the last rolling window of each file (if window_days) of appended csv
+        files."""
+        self.accumulator = CO2Accumulator(date_field, value_field, seasons)
+        self.offsets = {}
+        self.columns = {}
+        self.window_days = window_days
+        self.tails = {}
+        self.outputs = {}
+
+    def settings(self):
+        """The fields, seasons and rolling window the state was made with."""
+        return {'date_field': self.accumulator.date_field, 'value_field': self.accumulator.value_field,
+                'seasons': self.accumulator.seasons, 'window_days': self.window_days}
+
+    @staticmethod
+    def load(state_path, **kwargs):
+        """Load the state saved in state_path, or start a new one with kwargs if there is none or if it was saved
+        with other settings (date_field, value_field, seasons, window_days) than kwargs."""
+        state = IncrementalState(**kwargs)
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as state_file:
+                saved = pickle.load(state_file)
+            if saved.settings() == state.settings() and hasattr(saved, 'tails'):
+                return saved
+            print('{0} was saved with {1} - starting over with {2}'.format(state_path, saved.settings(),
+                                                                            state.settings()))
+        return state
+
+    def save(self, state_path):
+        """Save the state - written next to state_path and swapped in, so an interrupted save keeps the old state."""
+        temp_path = '{0}.{1}.tmp'.format(state_path, os.getpid())
+        with open(temp_path, 'wb') as state_file:
+            pickle.dump(self, state_file)
+        os.replace(temp_path, state_path)
+
+    def new_rows(self, path, offset, limit, block_bytes=64 * 1024 ** 2):
+        """Read the complete rows of path from byte offset up to byte limit, in blocks of about block_bytes. Yields
+        (dataframe of dates and values, offset after the block). A last line without a newline is still being written
+        and is left for the next update."""
+        key = os.path.abspath(path)
+        fields = [self.accumulator.date_field, self.accumulator.value_field]
+        with open(path, 'rb') as csv_file:
+            if offset == 0:
+                header = csv_file.readline()
+                if not header.endswith(b'\n'):
+                    return
+                self.columns[key] = header.decode().strip().split(',')
+                offset = csv_file.tell()
+            while offset < limit:
+                csv_file.seek(offset)
+                block = csv_file.read(min(block_bytes, limit - offset))
+                block = (block + csv_file.readline())[:limit - offset]
+                end = block.rfind(b'\n') + 1
+                if not end:
+                    return
+                offset += end
+                yield pd.read_csv(io.BytesIO(block[:end]), header=None, names=self.columns[key],
+                                  usecols=fields), offset
+
+    def update(self, path, out_path, threshold=1.96, block_bytes=64 * 1024 ** 2):
+        """Read the rows added to path since the last update, add them to the running statistics and append their
+        anomaly, z-score and outlier flag (and rolling anomaly if window_days) to the csv out_path. Returns (number
+        of new rows, number of new outliers). Save the state afterwards to keep the new offset."""
+        key = os.path.abspath(path)
+        start = self.offsets.get(key, 0)
+        limit = os.path.getsize(path)
+        if limit < start:
+            raise ValueError('{0} is shorter than when it was last read - delete the state file to start over'
+                             .format(path))
+
+        # First pass - running statistics of the new rows
+        end = start
+        for chunk, end in self.new_rows(path, start, limit, block_bytes):
+            self.accumulator.update(chunk)
+
+        # Second pass - anomalies of the same rows against the updated mean and standard deviation
+        total = self.accumulator.total
+        row_count = outlier_count = 0
+        for chunk, _ in self.new_rows(path, start, end, block_bytes):
+            values = chunk[self.accumulator.value_field].to_numpy(dtype=float)
+            anomaly, z_score, outlier = anomalies(values, total.mean, total.std, threshold)
+            chunk = chunk.assign(anomaly=anomaly, z_score=z_score, outlier=outlier)
+            if self.window_days:
+                chunk = self.rolling(chunk, key, threshold)
+            self.append(chunk, out_path)
+            row_count += len(chunk)
+            outlier_count += int(outlier.sum())
+        self.offsets[key] = end
+        return row_count, outlier_count
+
+    def append(self, chunk, out_path):
+        """Append a chunk of rows to the csv out_path. An output this state has not written to yet is started afresh,
+        and the header of an output it has written to must match the columns of chunk."""
+        key = os.path.abspath(out_path)
+        columns = list(chunk.columns)
+        if key not in self.outputs:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            self.outputs[key] = columns
+        elif os.path.exists(out_path):
+            with open(out_path) as out_file:
+                header = out_file.readline().strip().split(',')
+            if header != columns:
+                raise ValueError('The columns of {0} ({1}) do not match the columns written ({2}) - delete it and the '
+                                 'state file to start over'.format(out_path, header, columns))
+        chunk.to_csv(out_path, mode='a', header=not os.path.exists(out_path), index=False)
+
+    def rolling(self, chunk, key, threshold=1.96):
+        """Add the rolling anomaly, z-score and outlier flag of a chunk of new rows of the file key, using the last
+        window of the rows of that file before it, and keep the last window for its next chunk."""
+        date_field, value_field = self.accumulator.date_field, self.accumulator.value_field
+        tail = self.tails.get(key, pd.DataFrame({date_field: [], value_field: []}))
+        rows = pd.concat([tail, chunk[[date_field, value_field]]], ignore_index=True)
+        try:
+            anomaly, z_score, outlier = rolling_anomalies(rows[date_field], rows[value_field], self.window_days,
+                                                          threshold)
+        except ValueError as error:
+            raise ValueError('{0}: {1}'.format(key, error))
+        new = slice(len(tail), None)
+        time = pd.to_datetime(rows[date_field], format='ISO8601')
+        self.tails[key] = rows[time > time.iloc[-1] - pd.Timedelta(days=self.window_days)].reset_index(drop=True)
+        return chunk.assign(roll_anomaly=anomaly[new], roll_z_score=z_score[new], roll_outlier=outlier[new])
@@ -0,0 +1,135 @@
+########################
+# Vectorized statistics for the daily CO2 series of CC_03.3.
+#
+# CC_03.3 used to split every date string once per unique year and once per unique month, walking every row each time,
+# and recomputed np.std of the whole series for every row of the z-score loop - O(n^2). The dates are parsed once
+# here into integer year and month arrays, and every statistic is one grouped reduction over them:
+#
+#     1. Annual and monthly count, mean, minimum, maximum and standard deviation (np.bincount and
+#        np.minimum/maximum.reduceat) - missing values are left out, as in the streaming statistics of co2_stream.py
+#     2. Seasonal averages of the daily values, through month -> season and month -> season year lookup arrays made
+#        once from a season table. Seasons are matched by calendar month, not by the order the months appear in the
+#        file, December counts towards the winter of the next year, and any season table can be used
+#     3. Anomaly from the mean of the series, z-score and outlier flag for every value, with the mean and standard
+#        deviation computed once
+########################
+
+import numpy as np
+import pandas as pd
+
+# Meteorological seasons - each season's months in calendar order, starting with the first month of the season
+meteorological_seasons = {'Winter': [12, 1, 2], 'Spring': [3, 4, 5], 'Summer': [6, 7, 8], 'Autumn': [9, 10, 11]}
+
+
+def season_lookup(seasons=None):
+    """Make the lookup arrays of a season table (dictionary of season name -> months, default meteorological_seasons).
+    Returns (season names, season of each month, year offset of each month), the arrays indexed by month 1-12. Months
+    in no season are -1. A season running over the end of the year (e.g. December to February) belongs to the year it
+    ends in, so its months before January get a year offset of 1."""
+    seasons = meteorological_seasons if seasons is None else seasons
+    names = list(seasons)
+    season_of = np.full(13, -1)
+    year_offset = np.zeros(13, dtype=np.int64)
+    for i, months in enumerate(seasons.values()):
+        months = list(months)
+        if np.any(season_of[months] >= 0):
+            raise ValueError('A month is in more than one season: {0}'.format(seasons))
+        season_of[months] = i
+        # Months before the season wraps into January belong to the next year
+        wrap = next((j for j in range(1, len(months)) if months[j] < months[j - 1]), None)
+        if wrap is not None:
+            year_offset[months[:wrap]] = 1
+    return np.array(names), season_of, year_offset
+
+
+season_names, season_of_month, season_year_offset = season_lookup()
+
+
+def date_parts(dates):
+    """Parse dates ('YYYY-MM-DD' strings or timestamps) once. Returns integer (year, month) arrays."""
+    dates = pd.DatetimeIndex(pd.to_datetime(dates, format='ISO8601'))
+    return dates.year.to_numpy(dtype=np.int64), dates.month.to_numpy(dtype=np.int64)
+
+
+def group_stats(keys, values):
+    """Return the count, mean, minimum, maximum and standard deviation of values for each unique key, as a dataframe
+    indexed by key."""
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=float)
+    unique, group = np.unique(keys, return_inverse=True)
+    count = np.bincount(group, minlength=len(unique))
+    mean = np.bincount(group, weights=values, minlength=len(unique)) / np.maximum(count, 1)
+    m2 = np.bincount(group, weights=(values - mean[group]) ** 2, minlength=len(unique))
+
+    # Minimum and maximum of each group in one pass over the values sorted by group
+    order = np.argsort(group, kind='stable')
+    starts = np.r_[0, np.cumsum(count)[:-1]]
+    sorted_values = values[order]
+    minimum = np.minimum.reduceat(sorted_values, starts) if len(values) else np.array([])
+    maximum = np.maximum.reduceat(sorted_values, starts) if len(values) else np.array([])
+    return pd.DataFrame({'count': count, 'mean': mean, 'min': minimum, 'max': maximum,
+                         'std': np.sqrt(m2 / np.maximum(count, 1))}, index=pd.Index(unique, name='key'))
+
+
+def seasonal_stats(year, month, values, seasons=None, by_year=False):
+    """Count, mean, minimum, maximum and standard deviation of the values of each season of a season table (default
+    meteorological_seasons), in one grouped reduction. With by_year, each season of each year is its own group,
+    indexed by (season year, season) - December is in the winter of the next year. Values in months of no season are
+    left out."""
+    names, season_of, year_offset = season_lookup(seasons)
+    month = np.asarray(month)
+    season = season_of[month]
+    keep = season >= 0
+    season, values = season[keep], np.asarray(values, dtype=float)[keep]
+    if not by_year:
+        table = group_stats(season, values)
+        table.index = pd.Index(names[table.index], name='season')
+        return table
+
+    season_year = np.asarray(year)[keep] + year_offset[month[keep]]
+    table = group_stats(season_year * len(names) + season, values)
+    table.index = pd.MultiIndex.from_arrays([table.index // len(names), names[table.index % len(names)]],
+                                            names=['season_year', 'season'])
+    return table
+
+
+def anomalies(values, mean=None, std=None, threshold=1.96):
+    """Return the anomaly (difference from the mean), absolute z-score and outlier flag (1 if the z-score is over
+    threshold, 0 if not) of every value. The mean and standard deviation of values are used unless given."""
+    values = np.asarray(values, dtype=float)
+    mean = values.mean() if mean is None else mean
+    std = values.std() if std is None else std
+    anomaly = values - mean
+    z_score = np.abs(anomaly / std) if std > 0 else np.zeros(len(values))
+    return anomaly, z_score, (z_score > threshold).astype(np.int8)
+
+
+def co2_statistics(df, date_field='date', value_field='value', threshold=1.96, seasons=None):
+    """Compute every statistic of CC_03.3 for a dataframe of dated values. Returns a dictionary with the 'annual',
+    'monthly', 'seasonal' (all years) and 'seasonal_annual' (each season of each year) tables, the 'min', 'max',
+    'mean' and 'std' of the series and 'values', the dataframe with year, month, season, anomaly, z_score and outlier
+    columns added. seasons is a season table (default meteorological_seasons). Missing values are left out of the
+    statistics and get no anomaly."""
+    values = df[value_field].to_numpy(dtype=float)
+    year, month = date_parts(df[date_field])
+    names, season_of, year_offset = season_lookup(seasons)
+
+    # Statistics of the values that are not missing
+    valid = ~np.isnan(values)
+    valid_values, valid_year, valid_month = values[valid], year[valid], month[valid]
+    mean = valid_values.mean()
+    std = valid_values.std()
+    anomaly, z_score, outlier = anomalies(values, mean, std, threshold)
+
+    seasonal = seasonal_stats(valid_year, valid_month, valid_values, seasons)
+    seasonal_annual = seasonal_stats(valid_year, valid_month, valid_values, seasons, by_year=True)
+    annual = group_stats(valid_year, valid_values)
+    annual.index.name = 'year'
+    monthly = group_stats(valid_month, valid_values)
+    monthly.index.name = 'month'
+
+    season = season_of[month]
+    values_df = df.assign(year=year, month=month, season=np.where(season >= 0, names[season], None),
+                          season_year=year + year_offset[month], anomaly=anomaly, z_score=z_score, outlier=outlier)
+    return {'annual': annual, 'monthly': monthly, 'seasonal': seasonal, 'seasonal_annual': seasonal_annual,
+            'min': valid_values.min(), 'max': valid_values.max(), 'mean': mean, 'std': std, 'values': values_df}
@@ -0,0 +1,229 @@
+########################
+# Streaming statistics for CO2 series too large to load at once (multi-station, sub-daily archives).
+#
+# co2_stats.co2_statistics needs the whole series in memory and makes several passes over it. The accumulators here
+# read the csv files in chunks and keep only running statistics:
+#
+#     1. RunningStats keeps the count, mean, sum of squared deviations (M2), minimum and maximum of a series. Each chunk
+#        is summarized with numpy and folded in with the parallel (Chan et al.) form of Welford's update, which is
+#        numerically stable and lets two accumulators be merged exactly
+#     2. GroupedStats keeps one set of running statistics per key (year, month or season) in sorted arrays
+#     3. CO2Accumulator keeps the overall, annual, monthly, seasonal and per season year statistics of a series
+#
+# Accumulators are mergeable, so shards (e.g. one csv per station) are accumulated on separate processes and merged.
+# A second streaming pass then writes the anomaly, z-score and outlier flag of every value with the final mean and
+# standard deviation.
+########################
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from co2_stats import anomalies, date_parts, season_lookup
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Merge the count, mean and M2 (sum of squared deviations) of two sets of values (scalars or arrays)."""
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, mean_a + delta * count_b / np.maximum(count, 1), 0.0)
+        m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / np.maximum(count, 1)
+    return count, mean, m2
+
+
+class RunningStats(object):
+    def __init__(self):
+        """Running count, mean, M2, minimum and maximum of a series of values."""
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def std(self):
+        """Population standard deviation (as np.std)."""
+        return np.sqrt(self.m2 / self.count) if self.count else np.nan
+
+    def update(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return self
+        mean = values.mean()
+        self._combine(len(values), mean, np.sum((values - mean) ** 2), values.min(), values.max())
+        return self
+
+    def merge(self, other):
+        """Add the values of another RunningStats."""
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        self.count, self.mean, self.m2 = (float(value) for value in
+                                          merge_moments(self.count, self.mean, self.m2, count, mean, m2))
+        self.count = int(self.count)
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+
+class GroupedStats(object):
+    def __init__(self):
+        """Running statistics of values by key - sorted arrays of keys and their count, mean, M2, minimum and
+        maximum."""
+        self.keys = np.array([], dtype=np.int64)
+        self.count = np.array([], dtype=np.int64)
+        self.mean = np.array([])
+        self.m2 = np.array([])
+        self.min = np.array([])
+        self.max = np.array([])
+
+    def update(self, keys, values):
+        """Add an array of values with the key of each value."""
+        values = np.asarray(values, dtype=float)
+        unique, group = np.unique(np.asarray(keys), return_inverse=True)
+        count = np.bincount(group, minlength=len(unique))
+        mean = np.bincount(group, weights=values, minlength=len(unique)) / np.maximum(count, 1)
+        m2 = np.bincount(group, weights=(values - mean[group]) ** 2, minlength=len(unique))
+        minimum = np.full(len(unique), np.inf)
+        maximum = np.full(len(unique), -np.inf)
+        np.minimum.at(minimum, group, values)
+        np.maximum.at(maximum, group, values)
+        return self._combine(unique, count, mean, m2, minimum, maximum)
+
+    def merge(self, other):
+        """Add the values of another GroupedStats."""
+        return self._combine(other.keys, other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, keys, count, mean, m2, minimum, maximum):
+        # Line both sets of keys up on their union, with empty statistics for the keys one of them does not have
+        union = np.union1d(self.keys, keys)
+
+        def aligned(own_keys, array, fill):
+            out = np.full(len(union), fill, dtype=np.result_type(array, type(fill)))
+            out[np.searchsorted(union, own_keys)] = array
+            return out
+
+        count_a, count_b = aligned(self.keys, self.count, 0), aligned(keys, count, 0)
+        self.count, self.mean, self.m2 = merge_moments(count_a, aligned(self.keys, self.mean, 0.0),
+                                                       aligned(self.keys, self.m2, 0.0), count_b,
+                                                       aligned(keys, mean, 0.0), aligned(keys, m2, 0.0))
+        self.min = np.minimum(aligned(self.keys, self.min, np.inf), aligned(keys, minimum, np.inf))
+        self.max = np.maximum(aligned(self.keys, self.max, -np.inf), aligned(keys, maximum, -np.inf))
+        self.keys = union
+        return self
+
+    def table(self, name='key', labels=None):
+        """Return the count, mean, minimum, maximum and standard deviation of each key as a dataframe. labels
+        (an array indexed by key) names the keys."""
+        index = self.keys if labels is None else np.asarray(labels)[self.keys]
+        return pd.DataFrame({'count': self.count.astype(np.int64), 'mean': self.mean, 'min': self.min,
+                             'max': self.max, 'std': np.sqrt(self.m2 / np.maximum(self.count, 1))},
+                            index=pd.Index(index, name=name))
+
+
+class CO2Accumulator(object):
+    def __init__(self, date_field='date', value_field='value', seasons=None):
+        """Overall, annual, monthly and seasonal running statistics of a dated series. seasons is a season table
+        (default co2_stats.meteorological_seasons)."""
+        self.date_field = date_field
+        self.value_field = value_field
+        self.seasons = seasons
+        self.season_names, self.season_of, self.year_offset = season_lookup(seasons)
+        self.total = RunningStats()
+        self.annual = GroupedStats()
+        self.monthly = GroupedStats()
+        self.seasonal = GroupedStats()
+        self.seasonal_annual = GroupedStats()
+
+    def update(self, chunk):
+        """Add a dataframe of dated values (one chunk of a csv)."""
+        chunk = chunk.dropna(subset=[self.value_field])
+        values = chunk[self.value_field].to_numpy(dtype=float)
+        year, month = date_parts(chunk[self.date_field])
+        self.total.update(values)
+        self.annual.update(year, values)
+        self.monthly.update(month, values)
+
+        # Seasons by calendar month, each season of each year keyed as season year * number of seasons + season
+        season = self.season_of[month]
+        keep = season >= 0
+        self.seasonal.update(season[keep], values[keep])
+        season_year = year[keep] + self.year_offset[month[keep]]
+        self.seasonal_annual.update(season_year * len(self.season_names) + season[keep], values[keep])
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another CO2Accumulator (e.g. of another shard)."""
+        self.total.merge(other.total)
+        self.annual.merge(other.annual)
+        self.monthly.merge(other.monthly)
+        self.seasonal.merge(other.seasonal)
+        self.seasonal_annual.merge(other.seasonal_annual)
+        return self
+
+    def results(self):
+        """Return the statistics in the form of co2_stats.co2_statistics (without the 'values' dataframe)."""
+        seasonal_annual = self.seasonal_annual.table()
+        count = len(self.season_names)
+        seasonal_annual.index = pd.MultiIndex.from_arrays(
+            [self.seasonal_annual.keys // count, self.season_names[self.seasonal_annual.keys % count]],
+            names=['season_year', 'season'])
+        return {'annual': self.annual.table('year'), 'monthly': self.monthly.table('month'),
+                'seasonal': self.seasonal.table('season', self.season_names), 'seasonal_annual': seasonal_annual,
+                'min': self.total.min, 'max': self.total.max, 'mean': self.total.mean, 'std': self.total.std}
+
+
+def read_chunks(path, date_field='date', value_field='value', chunksize=1000000):
+    """Read the date and value columns of a csv in chunks of chunksize rows."""
+    return pd.read_csv(path, usecols=[date_field, value_field], chunksize=chunksize)
+
+
+def accumulate(args):
+    """Accumulate the statistics of one csv file, chunk by chunk. Returns a CO2Accumulator."""
+    path, date_field, value_field, chunksize, seasons = args
+    accumulator = CO2Accumulator(date_field, value_field, seasons)
+    for chunk in read_chunks(path, date_field, value_field, chunksize):
+        accumulator.update(chunk)
+    return accumulator
+
+
+def stream_statistics(paths, date_field='date', value_field='value', chunksize=1000000, processes=1, seasons=None):
+    """Accumulate the statistics of one csv or a list of csv shards, each read in chunks of chunksize rows, on a
+    pool of processes (one shard per process at a time). Returns the merged CO2Accumulator."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    jobs = [(path, date_field, value_field, chunksize, seasons) for path in paths]
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes > 1:
+        with Pool(processes) as pool:
+            shards = pool.map(accumulate, jobs, chunksize=1)
+    else:
+        shards = [accumulate(job) for job in jobs]
+
+    accumulator = CO2Accumulator(date_field, value_field, seasons)
+    for shard in shards:
+        accumulator.merge(shard)
+    return accumulator
+
+
+def stream_anomalies(paths, out_path, mean, std, date_field='date', value_field='value', threshold=1.96,
+                     chunksize=1000000):
+    """Second pass - write the dates and values of the csv shards to out_path with their anomaly, z-score and
+    outlier flag (from the given mean and standard deviation), chunk by chunk. Returns the number of outliers."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    outlier_count = 0
+    header = True
+    for path in paths:
+        for chunk in read_chunks(path, date_field, value_field, chunksize):
+            anomaly, z_score, outlier = anomalies(chunk[value_field].to_numpy(dtype=float), mean, std, threshold)
+            chunk = chunk.assign(anomaly=anomaly, z_score=z_score, outlier=outlier)
+            chunk.to_csv(out_path, mode='a', header=header, index=False)
+            header = False
+            outlier_count += int(outlier.sum())
+    return outlier_count
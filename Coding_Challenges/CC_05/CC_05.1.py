@@ -36,114 +36,54 @@
 
 
 # import packages
-import csv
-import pandas as pd
-import arcpy
+import os
+import sys
+
+# Geoprocessing backend - arcpy if it is installed, otherwise shapely/pyogrio (set GEOPROC_BACKEND to choose)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from geoproc import get_backend
+from geoproc.species import split_species
 
 ####### CHANGE PATH WHERE combined_species_clean.csv is located #######
 path = 'DATA/combined_species_clean.csv'
 
-# Create lists and dataframes to track longitudes (x) and latitudes (y) and convert to individual csv file
-goose_x = []
-goose_y = []
-goose_df = pd.DataFrame()
-cormorant_x = []
-cormorant_y = []
-cormorant_df = pd.DataFrame()
-
-# Open csv file to sort through each species
-with open(path) as data:
-    next(data)
-    for row in csv.reader(data):
-        if row[0] in 'Emperor Goose':
-            goose_x.append(row[3])
-            goose_y.append(row[2])
-        else:
-            cormorant_x.append(row[3])
-            cormorant_y.append(row[2])
+# Edit Species List - short name used for the output files: species name in the csv
+speciesList = {'Cormorant': 'Pelagic Cormorant', 'Goose': 'Emperor Goose'}
 
-# Convert lists into dataframe and make csv file using df.to_csv
-goose_df['x'] = goose_x
-goose_df['y'] = goose_y
-cormorant_df['x'] = cormorant_x
-cormorant_df['y'] = cormorant_y
+# Split the sightings of the listed species into longitude (x) and latitude (y) arrays, reading the csv once
+species = split_species(path, list(speciesList.values()))
+print('Species split: ' + ', '.join(name + ' (' + str(len(x)) + ' sightings)' for name, (x, y) in species.items()))
 
-goose_df.to_csv('DATA/Goose_solo.csv')
-print('Goose CSV created')
-cormorant_df.to_csv('DATA/Cormorant_solo.csv')
-print('Cormorant CSV created')
-
-# Initiate arcpy environment
-arcpy.env.overwriteOutput = True
-arcpy.env.workspace = r'C:\Users\OpenTron\Documents\NRS528\Coding Challenges\CC_05\DATA'
-arcpy.env.outputCoordinateSystem = arcpy.SpatialReference(4326)
+# Initiate geoprocessing backend
+backend = get_backend()
+workspace = 'DATA'
+spRef = 4326  # 4326 == WGS 1984
 
 # Process between each species dataset to create a heat map of sightings within a grid
-
-# Edit Species List, making sure the file names are called 'SPECIESNAME'_solo.csv
-speciesList = ['Cormorant', 'Goose']
-for item in speciesList:
+for item, name in speciesList.items():
     print('Started ' + item + ' processing')
-    in_Table = item +'_solo.csv'
-    x_coord = 'x'
-    y_coord = 'y'
-    z_coord = ""
-    out_layer = item
-    saved_Layer = item + '.shp'
-    spRef = arcpy.SpatialReference(4326)  # 4326 == WGS 1984
+    x, y = species[name]
+    if not len(x):
+        print('No sightings of ' + name + ' in ' + path + '...')
+        continue
 
-    # Create shapefile
-    lyr = arcpy.MakeXYEventLayer_management(in_Table, x_coord, y_coord, out_layer, spRef, z_coord)
-    arcpy.CopyFeatures_management(lyr, saved_Layer)
+    # Create points
+    points = backend.points_from_xy(x, y, spRef)
 
     # Calculate the extent
-    desc = arcpy.Describe(lyr)
-    Xmin = desc.extent.XMin
-    Ymin = desc.extent.YMin
-    Xmax = desc.extent.XMax
-    Ymax = desc.extent.YMax
+    Xmin, Ymin, Xmax, Ymax = backend.extent(points)
 
     # Create Fishnet using extent, change cell size if needed
     print('Creating Fishnet')
-    outFeatureClass = item + "_fishnet.shp"
-    originCoordinate = str(Xmin) + ' ' + str(Ymin)  # Left bottom of our point data
-    yAxisCoordinate = str(Xmin) + ' ' + str(Ymin + 1)  # +1 latitude to head north
-    cellSizeWidth = "1"  # 1 x1 degrees grid
-    cellSizeHeight = "1"
-    numRows = ""  # Leave blank, as we have set cellSize
-    numColumns = ""  # Leave blank, as we have set cellSize
-    oppositeCorner = str(Xmax) + ' ' + str(Ymax)  # i.e. max x and max y coordinate
-    labels = "NO_LABELS"
-    templateExtent = "#"  # No need to use, as we have set yAxisCoordinate and oppositeCorner
-    geometryType = "POLYGON"  # Create a polygon, could be POLYLINE
+    cellSizeWidth = 1  # 1 x1 degrees grid
+    cellSizeHeight = 1
+    fishnet = backend.create_fishnet((Xmin, Ymin, Xmax, Ymax), cellSizeWidth, cellSizeHeight, spRef)
 
-    arcpy.CreateFishnet_management(outFeatureClass, originCoordinate, yAxisCoordinate,
-                                   cellSizeWidth, cellSizeHeight, numRows, numColumns,
-                                   oppositeCorner, labels, templateExtent, geometryType)
-
-    # Spatial Join between species shapefile and fishnet
+    # Spatial Join between species points and fishnet
     print('Started Spatial Join')
-    target_features = item + "_fishnet.shp"
-    join_features = saved_Layer
-    out_feature_class = item + "_HeatMap.shp"
     join_operation = "JOIN_ONE_TO_ONE"
-    join_type = "KEEP_ALL"
-    field_mapping = ""
     match_option = "INTERSECT"
-    search_radius = ""
-    distance_field_name = ""
-
-    arcpy.SpatialJoin_analysis(target_features, join_features, out_feature_class,
-                               join_operation, join_type, field_mapping, match_option,
-                               search_radius, distance_field_name)
+    heatmap = backend.spatial_join(fishnet, points, join_operation, match_option)
+    backend.write(heatmap, os.path.join(workspace, item + "_HeatMap.shp"))
 
     print(item + ' heatmap created')
-
-    if arcpy.Exists(saved_Layer):
-        arcpy.Delete_management(saved_Layer)
-        print(item + ' shape file deleted')
-    if arcpy.Exists(item + "_fishnet.shp"):
-        arcpy.Delete_management(item + "_fishnet.shp")
-        print(item + ' fishnet deleted')
-
-print('All done')
\ No newline at end of file
@@ -8,7 +8,7 @@
 #     2. Percent Impervious Surface Area
 #     3. Percent Canopy Coverage (and Average Canopy Height)
 #     4. Percent Building Coverage
-#     5. Binary Bike Path
+#     5. Bike Paths (number of bike paths along each road and the length it shares with them)
 #     6. Proximity to Sweeper Parking Locations (ex. Fire Stations, Park and Rides)
 
 # These metrics are all significant in terms of pollutant accumulation, and therefore are important factors
@@ -29,81 +29,105 @@ import time
 # Track run time
 start_time = time.time()
 
-import arcpy
+import functools
 import os
-import pandas as pd
+import shutil
+import sys
+
+# Geoprocessing backend - arcpy if it is installed, otherwise shapely/pyogrio (set GEOPROC_BACKEND to choose)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from geoproc import get_backend
+from geoproc.runner import run_towns, merge_outputs
+from geoproc.extract_cache import ExtractCache
+from geoproc.attributes import AttributeAssembly
+from geoproc.stage_cache import StageCache
 
 ###### USER INPUTS ######
 input_directory = r"C:\Users\OpenTron\Documents\NRS528\Coding Challenges\CC_08\DATA"
 ###### USER INPUTS ######
 
-# Set up arcpy environment
-arcpy.env.overwriteOutput = True
-arcpy.env.workspace = input_directory
+# Rasters are read through memory-mapped copies in the extract cache folder, made once and shared by every town
+backend = get_backend(raster_cache=os.path.join(input_directory, 'extract_cache', 'rasters'))
 
-# Set up temporary and output directories
+# Set up temporary and output directories - each town gets its own temporary folder, so towns can run in parallel
 keep_temp_files = False  # Change to true if you want to keep temp files
-if not os.path.exists(os.path.join(input_directory, "temporary_files")):
-    os.mkdir(os.path.join(input_directory, "temporary_files"))
-if not os.path.exists(os.path.join(input_directory, "output_files")):
-    os.mkdir(os.path.join(input_directory, "output_files"))
-temp = 'temporary_files'
-output = 'output_files'
-
-def road_prioritization_tool(town):         #### RUN FUNCTION STARTING ON LINE 370
+processes = 4   # Number of towns to run at once
+output = os.path.join(input_directory, 'output_files')
+output_format = '.parquet'  # GeoParquet keeps full field names and loads statewide in one read - or '.shp'
+temp_directory = os.path.join(input_directory, 'temporary_files')
+
+# Statewide extracts, made once and shared by every town - each town only reads the features in its extent. They are
+# remade when the source files change. State maintained roads have jurisdiction of 2 or 3.
+cache = ExtractCache(os.path.join(input_directory, 'extract_cache'), backend, {
+    'State_Roads': (os.path.join(input_directory, 'Roads_RISPft.shp'), 'JURIS', [2, 3]),
+    'Residential': (os.path.join(input_directory, 'LULC_RISPft.shp'), 'Symb_cat', ['Residential']),
+    'Commercial': (os.path.join(input_directory, 'LULC_RISPft.shp'), 'Symb_cat', ['Commercial and Services']),
+    'Forested': (os.path.join(input_directory, 'LULC_RISPft.shp'), 'Symb_cat', ['Forest Land']),
+    'Impervious': (os.path.join(input_directory, 'Impervious_RISPft.shp'), None, None),
+    'Buildings': (os.path.join(input_directory, 'Buildings_RISPft.shp'), None, None)})
+
+# Results of every stage of a town, kept between runs - a stage is only run again when its parameters, its sources or
+# a stage before it change. The least recently used results are deleted past 4 GB.
+stages = StageCache(os.path.join(input_directory, 'stage_cache'), backend, max_size=4 * 1024 ** 3)
+
+# Statewide bike paths and sweeper parking locations (fire stations and park and rides)
+bike_path_file = os.path.join(input_directory, 'BikePaths_RISPft.shp')
+depot_files = {'FireStation': os.path.join(input_directory, 'FireStations.shp'),
+               'ParkAndRide': os.path.join(input_directory, 'ParkAndRides.shp')}
+
+@functools.lru_cache()
+def depot_index():
+    """Index of the sweeper parking locations statewide - built once in each process."""
+    return backend.facility_index([backend.read(path) for path in depot_files.values()], list(depot_files))
+
+@functools.lru_cache()
+def bike_path_index():
+    """Index of the bike paths statewide - built once in each process."""
+    return backend.line_overlap_index(backend.read(bike_path_file), tolerance=50, max_angle=20)
+
+def road_prioritization_tool(town):         #### RUN FUNCTION STARTING ON LINE 258
     town2 = town.replace(" ", "")
+    temp = os.path.join(temp_directory, town2)
+    os.makedirs(temp, exist_ok=True)
+    os.makedirs(output, exist_ok=True)
 
     #### Setting up study area, roads and buffer zones
     print('1. Setting Up Study Area, Roads, and Buffer Zones for ' + town)
 
-    in_feature = r'Municipalities_RISPft.shp'
-    out_feature = os.path.join(temp, 'Study_Area_' + town2 + '.shp')
-
-    where_clause = "NAME = '" + town + "'"
-    arcpy.analysis.Select(in_feature, out_feature, where_clause)
-
-    # Set extent base on study area
-    desc = arcpy.Describe(out_feature)
-    arcpy.env.extent = arcpy.Extent(desc.extent.XMin, desc.extent.YMin, desc.extent.XMax, desc.extent.YMax)
-
-    # Select state roads
-    in_feature = r'Roads_RISPft.shp'
-    out_feature = 'in_memory/State_Roads_' + town2
-    where_clause = "JURIS = 2 Or JURIS = 3"     # State maintained roads have jurisdiction of 2 or 3
-    arcpy.analysis.Select(in_feature, out_feature, where_clause)
-
-    # Clip to municipality borders
-    in_feature = 'in_memory/State_Roads_' + town2
-    clip_feature = os.path.join(temp, 'Study_Area_' + town2 + '.shp')
-    out_feature = 'in_memory/Roads_Clipped_' + town2
-    arcpy.analysis.Clip(in_feature, clip_feature, out_feature)
-
-    # Dissolve and format roads to have 0.1 mile segments
-    in_feature = 'in_memory/Roads_Clipped_' + town2
-    out_feature = 'in_memory/Roads_Dissolved_' + town2
-    arcpy.management.Dissolve(in_feature, out_feature)
-
-    # Generate points along line that are 0.1 miles apart
-    in_feature = 'in_memory/Roads_Dissolved_' + town2
-    out_feature = 'in_memory/Roads_Points_' + town2
-    distance = '0.1 miles'
-    arcpy.management.GeneratePointsAlongLines(in_feature, out_feature, 'DISTANCE', distance, Include_End_Points='END_POINTS')
-
-    # Split line at points - this will create your final roads dataset
-    in_feature = 'in_memory/Roads_Dissolved_' + town2
-    point_feature = 'in_memory/Roads_Points_' + town2
-    out_feature = os.path.join(temp,'Final_Roads_' + town2 +'.shp')
-    search_radius = '50 feet'
-    arcpy.management.SplitLineAtPoint(in_feature, point_feature, out_feature, search_radius)
-
-    # Create buffer zone around roads
-    in_feature = out_feature
-    out_feature = os.path.join(temp,'Buffer_Zones_' + town2 + '.shp')
-    buffer_distance = '250 Feet'    # Set desired buffer distance
-    sideType = "FULL"
-    endType = "ROUND"
-    dissolveType = "NONE"
-    arcpy.analysis.Buffer(in_feature, out_feature, buffer_distance, sideType, endType, dissolveType)
+    # Every stage returns its result and its key in the stage cache - the stages after it are keyed on it
+    municipalities = os.path.join(input_directory, 'Municipalities_RISPft.shp')
+    study_area, study_key = stages.run(
+        'study_area', lambda: backend.select(backend.read(municipalities), 'NAME', [town]),
+        sources=[municipalities], town=town)
+
+    # Only read the parts of the statewide layers within the study area extent
+    extent = backend.extent(study_area)
+
+    # Select state roads and clip to municipality borders
+    roads_clipped, roads_key = stages.run(
+        'roads', lambda: backend.clip(cache.read('State_Roads', bbox=extent), study_area),
+        inputs=[study_key, cache.entry('State_Roads')])
+
+    # Merge connected roads and cut them into 0.1 mile segments - this will create your final roads dataset. Every
+    # segment gets a stable SEG_ID that does not depend on the order of the roads
+    segment_length = 0.1 * 5280     # 0.1 miles in feet
+    final_roads, segments_key = stages.run(
+        'segments', lambda: backend.segment_lines(roads_clipped, segment_length),
+        inputs=[roads_key], segment_length=segment_length)
+
+    # Create buffer zone around roads - zones keep the SEG_ID of the road they buffer
+    buffer_distance = 250   # Set desired buffer distance (feet)
+    zoneField = 'SEG_ID'
+    buffer_zones, buffer_key = stages.run(
+        'buffer_zones', lambda: backend.buffer(final_roads, buffer_distance, 'ROUND'),
+        inputs=[segments_key], buffer_distance=buffer_distance)
+
+    # Metric tables are collected in memory by road segment and joined into the roads dataset once, at the end
+    metrics = AttributeAssembly(backend.table(final_roads, [zoneField]).reset_index())
+
+    if keep_temp_files:
+        backend.write(study_area, os.path.join(temp, 'Study_Area_' + town2 + '.shp'))
+        backend.write(buffer_zones, os.path.join(temp, 'Buffer_Zones_' + town2 + '.shp'))
 
     #### Land Usage
     print('2. Starting Land Use Calculations for ' + town)
@@ -111,55 +135,18 @@ def road_prioritization_tool(town):         #### RUN FUNCTION STARTING ON LINE 3
     land_use_list = ['Residential', 'Commercial', 'Forested']
     land_use_alias = ['PCT_RES', 'PCT_COM', 'PCT_FOR']
 
-    in_feature = 'LULC_RISPft.shp'
-
-    # Residential
-    out_feature = 'in_memory/Residential_LULC_' + town2
-    where_clause = "Symb_cat = 'Residential'"
-    arcpy.analysis.Select(in_feature, out_feature, where_clause)
-
-    # Commercial
-    out_feature = 'in_memory/Commercial_LULC_' + town2
-    where_clause = "Symb_cat = 'Commercial and Services'"
-    arcpy.analysis.Select(in_feature, out_feature, where_clause)
-
-    # Forested
-    out_feature = 'in_memory/Forested_LULC_' + town2
-    where_clause = "Symb_cat = 'Forest Land'"
-    arcpy.analysis.Select(in_feature, out_feature, where_clause)
-
-    # For loop to tabulate intersection between each land use and buffer zones, then join data into roads dataset
+    # For loop to tabulate intersection between each land use and buffer zones, then add it to the road metrics
     i = 0
     for item in land_use_list:
 
-        # Tabulate Intersection
-        inZoneData = os.path.join(temp,'Buffer_Zones_' + town2 + '.shp')
-        zoneField = 'FID'
-        inClassData = os.path.join('in_memory', str(item) + '_LULC_' + town2)
-        outTable = os.path.join('in_memory', str(item) + '_tabulate_' + town2)
-        arcpy.analysis.TabulateIntersection(inZoneData, zoneField, inClassData, outTable)
-
-        # Get list of field names of tabulate intersection table to use in join field
-        fldLst = arcpy.ListFields(outTable)
-        fldLst2 = []
-        for fld in fldLst:
-            fldLst2.append(fld.baseName)
-
-        # Alter 'PERCENTAGE' field to have more meaningful name (, through Add/Calculate field operation
-        in_table = os.path.join('in_memory', str(item) + '_tabulate_' + town2)
-        old_field = 'PERCENTAGE'
-        new_field = str(land_use_alias[i])
-        field_type = 'DOUBLE'
-        arcpy.management.AddField(in_table, new_field, field_type)
-        arcpy.management.CalculateField(in_table, new_field, '!' + old_field + '!', 'PYTHON3')
-
-        # Join Field
-        in_data = os.path.join(temp,'Final_Roads_' + town2 +'.shp')
-        in_field = 'FID'
-        join_table = os.path.join('in_memory', str(item) + '_tabulate_' + town2)
-        join_field = fldLst2[1]
-        field = str(land_use_alias[i])
-        arcpy.management.JoinField(in_data, in_field, join_table, join_field, field)
+        # Tabulate Intersection with the land use class extract
+        table, table_key = stages.run(
+            'tabulate', lambda: backend.tabulate_intersection(buffer_zones, zoneField, cache.read(item, bbox=extent)),
+            inputs=[buffer_key, cache.entry(item)], zone_field=zoneField)
+
+        # Rename 'PERCENTAGE' field to have more meaningful name, then add it to the road metrics
+        table = table.rename(columns={'PERCENTAGE': land_use_alias[i]})
+        metrics.add(table, zoneField, [land_use_alias[i]], key=zoneField)
 
         i += 1
 
@@ -167,197 +154,94 @@ def road_prioritization_tool(town):         #### RUN FUNCTION STARTING ON LINE 3
     print('3. Starting Impervious Surface Area Calculations for ' + town)
 
     # Tabulate Intersection of Impervious Surface Area
-    inZoneData = os.path.join(temp,'Buffer_Zones_' + town2 + '.shp')
-    zoneField = 'FID'
-    inClassData = 'Impervious_RISPft.shp'
-    out_table = 'in_memory/Impervious_table_' + town2
-    arcpy.analysis.TabulateIntersection(inZoneData, zoneField, inClassData, out_table)
-
-    # Alter 'PERCENTAGE' field to have more meaningful name (from land_use_alias list on line 68)
-    in_table = 'in_memory/Impervious_table_' + town2
-    old_field = 'PERCENTAGE'
-    new_field = 'PCT_IMP'
-    field_type = 'DOUBLE'
-    arcpy.management.AddField(in_table, new_field, field_type, '', '', '', new_field)
-    arcpy.management.CalculateField(in_table, new_field, '!' + old_field + '!', 'PYTHON3')
-
-    # Join Field
-    in_table = os.path.join(temp,'Final_Roads_' + town2 +'.shp')
-    in_field = 'FID'
-    join_table = 'in_memory/Impervious_table_' + town2
-    join_field = fldLst2[1]
-    field = 'PCT_IMP'
-    arcpy.management.JoinField(in_table, in_field, join_table, join_field, field)
+    table, table_key = stages.run(
+        'tabulate',
+        lambda: backend.tabulate_intersection(buffer_zones, zoneField, cache.read('Impervious', bbox=extent)),
+        inputs=[buffer_key, cache.entry('Impervious')], zone_field=zoneField)
+
+    # Rename 'PERCENTAGE' field to have more meaningful name, then add it to the road metrics
+    table = table.rename(columns={'PERCENTAGE': 'PCT_IMP'})
+    metrics.add(table, zoneField, ['PCT_IMP'], key=zoneField)
 
     #### Canopy Coverage
     print('4. Starting Canopy Coverage Calculations for ' + town)
 
-    # Set null all trees that are less than 8 feet (after playing around 8 seemed to be the magic number)
-    in_feature = os.path.join(input_directory,'Canopy_RISPft.tif')
-    FalseRaster = in_feature
-    whereClause = "VALUE < 8"
-    outsetnull = arcpy.sa.SetNull(in_feature, FalseRaster, whereClause)
-
-    # Execute RasterToPolygon
-    in_feature = outsetnull
-    out_feature = 'in_memory/Canopy_poly_' + town2
-    field = "VALUE"
-    arcpy.conversion.RasterToPolygon(in_feature, out_feature, "NO_SIMPLIFY", field)
-
-    # Tabulate Intersection of Canopy polygons
-    inZoneData = os.path.join(temp, 'Buffer_Zones_' + town2 + '.shp')
-    zoneField = 'FID'
-    inClassData = 'in_memory/Canopy_poly_' + town2
-    out_table = 'in_memory/Canopy_table_' + town2
-    arcpy.analysis.TabulateIntersection(inZoneData, zoneField, inClassData, out_table)
-
-    # Alter 'PERCENTAGE' field to have more meaningful name
-    in_table = 'in_memory/Canopy_table_' + town2
-    old_field = 'PERCENTAGE'
-    new_field = 'PCT_CANOPY'
-    field_type = 'DOUBLE'
-    arcpy.management.AddField(in_table, new_field, field_type, '', '', '', new_field)
-    arcpy.management.CalculateField(in_table, new_field, '!' + old_field + '!', 'PYTHON3')
-
-    # Join Field
-    in_table = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    in_field = 'FID'
-    join_table = 'in_memory/Canopy_table_' + town2
-    join_field = fldLst2[1]
-    field = 'PCT_CANOPY'
-    arcpy.management.JoinField(in_table, in_field, join_table, join_field, field)
-
-    # Use Zonal Statistics to take average tree height in each buffer zone
-    in_feature = os.path.join(temp, 'Buffer_Zones_' + town2 + '.shp')
-    zone_field = 'FID'
-    in_raster = outsetnull
-    out_table = 'in_memory/Buffer_Canopy_table_' + town2
-    ignore_nodata = 'DATA'
-    statistics_type = 'MEAN'
-    arcpy.sa.ZonalStatisticsAsTable(in_feature, zone_field, in_raster, out_table, ignore_nodata, statistics_type)
-
-    # Alter 'MEAN' field to have more meaningful name
-    in_table = 'in_memory/Buffer_Canopy_table_' + town2
-    old_field = 'MEAN'
-    new_field = 'AVG_CANOPY_HEIGHT'
-    field_type = 'DOUBLE'
-    arcpy.management.AddField(in_table, new_field, field_type, field_length=20)
-    arcpy.management.CalculateField(in_table, new_field, '!' + old_field + '!', 'PYTHON3')
-
-    # Join Field
-    in_table = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    in_field = 'FID'
-    join_table = 'in_memory/Buffer_Canopy_table_' + town2
-    join_field = fldLst2[1]
-    field = 'AVG_CANOPY_HEIGHT'
-    arcpy.management.JoinField(in_table, in_field, join_table, join_field, field)
+    # Percent of each buffer zone covered by trees of at least 8 feet (after playing around 8 seemed to be the magic
+    # number) and their average height, straight from the canopy raster in one pass
+    canopy_raster = os.path.join(input_directory, 'Canopy_RISPft.tif')
+    min_height = 8
+    table, table_key = stages.run(
+        'canopy', lambda: backend.zonal_threshold(buffer_zones, zoneField, canopy_raster, min_height),
+        inputs=[buffer_key], sources=[canopy_raster], zone_field=zoneField, min_height=min_height)
+
+    # Rename 'PERCENTAGE' and 'MEAN' fields to have more meaningful names, then add them to the road metrics
+    table = table.rename(columns={'PERCENTAGE': 'PCT_CANOPY', 'MEAN': 'AVG_CANOPY_HEIGHT'})
+    metrics.add(table, zoneField, ['PCT_CANOPY', 'AVG_CANOPY_HEIGHT'], key=zoneField)
 
     #### Building Density
     print('5. Starting Building Density Calculations for ' + town)
 
     # Tabulate Intersection of building polygons
-    inZoneData = os.path.join(temp, 'Buffer_Zones_' + town2 + '.shp')
-    zoneField = 'FID'
-    inClassData = 'Buildings_RISPft.shp'
-    out_table = 'in_memory/Buildings_table_' + town2
-    arcpy.analysis.TabulateIntersection(inZoneData, zoneField, inClassData, out_table)
-
-    # Alter 'PERCENTAGE' field to have more meaningful name
-    in_table = 'in_memory/Buildings_table_' + town2
-    old_field = 'PERCENTAGE'
-    new_field = 'PCT_BUILDING'
-    field_type = 'DOUBLE'
-    arcpy.management.AddField(in_table, new_field, field_type, field_length=20)
-    arcpy.management.CalculateField(in_table, new_field, '!' + old_field + '!', 'PYTHON3')
-
-    # Join Field
-    in_table = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    in_field = 'FID'
-    join_table = 'in_memory/Buildings_table_' + town2
-    join_field = fldLst2[1]
-    field = 'PCT_BUILDING'
-    arcpy.management.JoinField(in_table, in_field, join_table, join_field, field)
+    table, table_key = stages.run(
+        'tabulate',
+        lambda: backend.tabulate_intersection(buffer_zones, zoneField, cache.read('Buildings', bbox=extent)),
+        inputs=[buffer_key, cache.entry('Buildings')], zone_field=zoneField)
+
+    # Rename 'PERCENTAGE' field to have more meaningful name, then add it to the road metrics
+    table = table.rename(columns={'PERCENTAGE': 'PCT_BUILDING'})
+    metrics.add(table, zoneField, ['PCT_BUILDING'], key=zoneField)
 
     #### Bike Paths
     print('6. Starting Bike Path Calculations for ' + town)
 
-    # Snap Bike Paths to Roads
-    inFeature = 'BikePaths_RISPft.shp'
-    snap_feature = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    arcpy.edit.Snap(inFeature, [[snap_feature, "EDGE", "50 Feet"]])
-
-    # Make Feature Layer
-    in_feature = 'BikePaths_RISPft.shp'
-    out_feature = 'in_memory/BikePaths_snapped'
-    arcpy.management.MakeFeatureLayer(in_feature, out_feature)
-
-    # Spatial Join
-    in_feature = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    join_feature = 'in_memory/BikePaths_snapped'
-    out_feature = 'in_memory/BikePaths_SJ_' + town2
-    join_operation = 'JOIN_ONE_TO_MANY'
-    join_type = 'KEEP_ALL'
-    field_mapping = 'Count'
-    match_option = 'SHARE_A_LINE_SEGMENT_WITH'
-    arcpy.analysis.SpatialJoin(in_feature, join_feature, out_feature, join_operation=join_operation, join_type=join_type,
-                               field_mapping=field_mapping, match_option=match_option)
-
-    # Alter field to have more meaningful name
-    in_feature = 'in_memory/BikePaths_SJ_' + town2
-    old_field = 'Join_Count'
-    field_type = 'Short'
-    new_field = 'BikePath'
-    arcpy.management.AddField(in_feature, new_field, field_type, field_length=20)
-    arcpy.management.CalculateField(in_feature, new_field, '!' + old_field + '!', 'PYTHON3')
-
-    # Join field
-    in_table = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    in_field = 'FID'
-    join_table = 'in_memory/BikePaths_SJ_' + town2
-    join_field = fldLst2[1]
-    field = 'BikePath'
-    arcpy.management.JoinField(in_table, in_field, join_table, join_field, field)
+    # Length of each road segment running along a bike path (within 50 feet and 20 degrees of it), and the number of
+    # bike paths it runs along. The bike path dataset is only read, never edited
+    table, table_key = stages.run(
+        'bike_paths', lambda: backend.shared_length(final_roads, bike_path_index()),
+        inputs=[segments_key], sources=[bike_path_file], tolerance=50, max_angle=20)
+    table = table.rename(columns={'OVERLAP_COUNT': 'BikePath', 'SHARED_LEN': 'BIKE_LEN'})
+    metrics.add(table, 'IN_FID', ['BikePath', 'BIKE_LEN'])
 
     #### Sweeper Parking
     print('7. Determining Distance from Sweeper Stations ' + town)
 
-    # Fire Stations
-    in_feature = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    near_feature = 'FireStations.shp'
-    field_names = "NEAR_FID FIRE_ID;NEAR_DIST FIRE_DIST"
-    arcpy.analysis.Near(in_feature, near_feature, None, "NO_LOCATION", "NO_ANGLE", "PLANAR", field_names=field_names)
-
-    # Park and Rides
-    in_feature = os.path.join(temp, 'Final_Roads_' + town2 + '.shp')
-    near_feature = 'ParkAndRides.shp'
-    field_names = "NEAR_FID PaR_ID;NEAR_DIST PaR_DIST"
-    arcpy.analysis.Near(in_feature, near_feature, None, "NO_LOCATION", "NO_ANGLE", "PLANAR", field_names=field_names)
+    # One statewide index of fire stations and park and rides, queried with every road segment at once (only built
+    # if a result is not in the stage cache). Distances are to the road segment itself
+    table, table_key = stages.run(
+        'depots', lambda: backend.near_facilities(final_roads, depot_index(), types=['FireStation']),
+        inputs=[segments_key], sources=list(depot_files.values()), types=['FireStation'])
+    table = table.rename(columns={'NEAR_FID': 'FIRE_ID', 'NEAR_DIST': 'FIRE_DIST'})
+    metrics.add(table, 'IN_FID', ['FIRE_ID', 'FIRE_DIST'])
+
+    table, table_key = stages.run(
+        'depots', lambda: backend.near_facilities(final_roads, depot_index(), types=['ParkAndRide']),
+        inputs=[segments_key], sources=list(depot_files.values()), types=['ParkAndRide'])
+    table = table.rename(columns={'NEAR_FID': 'PaR_ID', 'NEAR_DIST': 'PaR_DIST'})
+    metrics.add(table, 'IN_FID', ['PaR_ID', 'PaR_DIST'])
+
+    # Nearest sweeper parking location of any type
+    table, table_key = stages.run(
+        'depots', lambda: backend.near_facilities(final_roads, depot_index()),
+        inputs=[segments_key], sources=list(depot_files.values()), types=None)
+    table = table.rename(columns={'NEAR_TYPE': 'DEPOT_TYPE', 'NEAR_DIST': 'DEPOT_DIST'})
+    metrics.add(table, 'IN_FID', ['DEPOT_TYPE', 'DEPOT_DIST'])
 
     #### Post Processing
 
-    # Copy into Output Folder
-    arcpy.management.CopyFeatures(os.path.join(temp, 'Final_Roads_' + town2 + '.shp'), os.path.join(output,'Final_Roads_' + town2 + '.shp'))
+    # Join every metric into the roads dataset at once, then write into Output Folder
+    table = metrics.frame()
+    final_roads = backend.join_field(final_roads, zoneField, table, zoneField, metrics.fields)
+    output_roads = backend.write(final_roads, os.path.join(output, 'Final_Roads_' + town2 + output_format))
 
-    # Delete Temporary Folder
+    # Delete this town's Temporary Folder
     if keep_temp_files == False:
-        arcpy.Delete_management(os.path.join(input_directory, "temporary_files"))
+        shutil.rmtree(temp, ignore_errors=True)
 
     # Print Table As Dataframe
-    def table_to_data_frame(in_table, input_fields=None, where_clause=None):
-        """Function will convert an arcgis table into a pandas dataframe with an object ID index, and the selected
-        input fields using an arcpy.da.SearchCursor."""
-        OIDFieldName = arcpy.Describe(in_table).OIDFieldName
-        if input_fields:
-            final_fields = [OIDFieldName] + input_fields
-        else:
-            final_fields = [field.name for field in arcpy.ListFields(in_table)]
-        data = [row for row in arcpy.da.SearchCursor(in_table, final_fields, where_clause=where_clause)]
-        fc_dataframe = pd.DataFrame(data, columns=final_fields)
-        fc_dataframe = fc_dataframe.set_index(OIDFieldName, drop=True)
-
-        return fc_dataframe
-
-    print("...All Done. Output Feature Class Length: " + str(len(table_to_data_frame(os.path.join(output,'Final_Roads_' + town2 +'.shp')))))
+    print("...All Done. Output Feature Class Length: " + str(len(table)))
+    backend.clear()
+
+    return output_roads
 
 study_area = ['CUMBERLAND', 'WOONSOCKET', 'NORTH SMITHFIELD', 'BURRILLVILLE', 'GLOCESTER',
               'PAWTUCKET', 'NORTH PROVIDENCE', 'PROVIDENCE', 'EAST PROVIDENCE',
@@ -367,52 +251,16 @@ study_area = ['CUMBERLAND', 'WOONSOCKET', 'NORTH SMITHFIELD', 'BURRILLVILLE', 'G
               'CHARLESTOWN', 'WESTERLY', 'NEW SHOREHAM', 'LINCOLN', 'SMITHFIELD', 'CENTRAL FALLS',
               'JOHNSTON', 'SCITUATE', 'CRANSTON', 'BARRINGTON']
 
-##### Uncomment 1 line to run road prioritization tool --- only works for one town at a time for some reason... not sure why
-
-for i in study_area:
-    road_prioritization_tool(i)
-
-
-# road_prioritization_tool("WOONSOCKET")
-# road_prioritization_tool("NORTH SMITHFIELD")
-# road_prioritization_tool("BURRILLVILLE")
-# road_prioritization_tool("GLOCESTER")
-# road_prioritization_tool("PAWTUCKET")
-# road_prioritization_tool("NORTH PROVIDENCE")
-# road_prioritization_tool("PROVIDENCE")
-# road_prioritization_tool("EAST PROVIDENCE")
-# road_prioritization_tool("FOSTER")
-# road_prioritization_tool("WARWICK")
-# road_prioritization_tool("WARREN")
-# road_prioritization_tool("WEST WARWICK")
-# road_prioritization_tool("COVENTRY")
-# road_prioritization_tool("BRISTOL")
-# road_prioritization_tool("TIVERTON")
-# road_prioritization_tool("PORTSMOUTH")
-# road_prioritization_tool("EAST GREENWICH")
-# road_prioritization_tool("WEST GREENWICH")
-# road_prioritization_tool("NORTH KINGSTOWN")
-# road_prioritization_tool("EXETER")
-# road_prioritization_tool("JAMESTOWN")
-# road_prioritization_tool("RICHMOND")
-# road_prioritization_tool("LITTLE COMPTON")
-# road_prioritization_tool("MIDDLETOWN")
-# road_prioritization_tool("HOPKINTON")
-# road_prioritization_tool("SOUTH KINGSTOWN")
-# road_prioritization_tool("NEWPORT")
-# road_prioritization_tool("NARRAGANSETT")
-# road_prioritization_tool("CHARLESTOWN")
-# road_prioritization_tool("WESTERLY")
-# road_prioritization_tool("NEW SHOREHAM")
-# road_prioritization_tool("LINCOLN")
-# road_prioritization_tool("SMITHFIELD")
-# road_prioritization_tool("CENTRAL FALLS")
-# road_prioritization_tool("JOHNSTON")
-# road_prioritization_tool("SCITUATE")
-# road_prioritization_tool("CRANSTON")
-# road_prioritization_tool("BARRINGTON")
-
-elapsed = time.time() - start_time
-elapsed = time.strftime("%M:%S.{}".format(str(elapsed % 1)[2:])[:8], time.gmtime(elapsed))
-print("--- Run time (MM:SS) for: " + elapsed + " ---")
+##### Run road prioritization tool for every town in study_area (edit the list to run fewer towns), 'processes' towns
+##### at a time, then merge the Final_Roads outputs into one statewide layer
+if __name__ == '__main__':
+    cache.prepare()
+    outputs = run_towns(road_prioritization_tool, study_area, processes)
+    if outputs:
+        merge_outputs(backend, outputs, os.path.join(output, 'Final_Roads_Statewide' + output_format))
+    if keep_temp_files == False:
+        shutil.rmtree(temp_directory, ignore_errors=True)
 
+    elapsed = time.time() - start_time
+    elapsed = time.strftime("%M:%S.{}".format(str(elapsed % 1)[2:])[:8], time.gmtime(elapsed))
+    print("--- Run time (MM:SS) for: " + elapsed + " ---")
@@ -15,15 +15,34 @@
 # patterns for an area of RI that you find interesting.
 
 
-import arcpy
+# The NDVI used to be computed with arcpy's Raster Calculator, which loads every band whole. It is now computed strip
+# by strip with geoproc.raster_io.map_blocks, which reads the bands with the same RasterReader (and cache) as the
+# Midterm canopy metrics, so memory stays at one strip of each band however big the scene is, and no ArcGIS license
+# is needed.
+
+import glob
 import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from geoproc.raster_io import map_blocks
 
 #### CHANGE INPUT DIRECTORY ####
 input_directory = r'C:\Users\OpenTron\Documents\NRS528\Coding Challenges\CC_10\DATA'
+raster_cache = None     # Folder for memory-mapped copies of the bands, reused by later runs - None to read the TIFs
 
 os.chdir(input_directory)
-arcpy.env.workspace = os.curdir
-arcpy.env.overwriteOutput = True
+
+
+def ndvi(vis, nir):
+    """NDVI of a block of the red (vis) and near-infrared (nir) bands - cells where either band is NoData, or both
+    are 0, are NoData."""
+    vis = vis.astype('float32')
+    nir = nir.astype('float32')
+    return (nir - vis) / np.ma.masked_equal(nir + vis, 0)
+
 
 # List folders in directory
 list_folders = os.listdir(os.curdir)
@@ -35,23 +54,18 @@ print('Processing the following folders...', list_folders)
 # Loop through each folder
 for folder in list_folders:
     print('... Starting month ' + folder)
-    os.chdir(folder)
-
-    # List all rasters in folder and loop through it
-    rasters_tif = arcpy.ListRasters("*", "TIF")
-    raster_list = []
-    raster_name_list = []
-    for raster in rasters_tif:
-        if raster.split('.')[0][-2:] in 'B4':
-            raster_list.append(raster)
-            raster_name_list.append('VIS')
-        if raster.split('.')[0][-2:] in 'B5':
-            raster_list.append(raster)
-            raster_name_list.append('NIR')
-
-    # Raster Calculator tool
-    output_raster = arcpy.ia.RasterCalculator(raster_list, raster_name_list, "(NIR-VIS)/(NIR+VIS)")
-    os.chdir('../')
-    output_raster.save(folder + '_NDVI.tif')
+
+    # List all rasters in folder and find band 4 (VIS) and band 5 (NIR)
+    rasters_tif = glob.glob(os.path.join(folder, '*.TIF')) + glob.glob(os.path.join(folder, '*.tif'))
+    bands = {}
+    for raster in sorted(set(rasters_tif)):
+        band = os.path.splitext(os.path.basename(raster))[0].upper()
+        if band.endswith('B4'):
+            bands['VIS'] = raster
+        if band.endswith('B5'):
+            bands['NIR'] = raster
+
+    # Raster Calculator, (NIR-VIS)/(NIR+VIS), one strip at a time
+    map_blocks(ndvi, [bands['VIS'], bands['NIR']], folder + '_NDVI.tif', cache_folder=raster_cache)
 
 print('All Done!')
@@ -0,0 +1,69 @@
+########################
+# Parameter sweep (batch scenario) mode for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# Tuning slope_threshold, QFACT1, the three QFACT3 values and REM_EFF used to mean rerunning the whole tool, cursor
+# reads included, once per combination. run_batch takes the roads and rainfall once and evaluates a list of parameter
+# sets together: each block of parameter sets is one broadcast simulation over a (parameter sets x roads) array (see
+# passt_engine.simulate_roads), and blocks can optionally be spread over a process pool. The result is one summary
+# table with the PASST metrics per road per parameter set.
+########################
+
+import itertools
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from passt_engine import dominant_qfact3, simulate_roads
+
+parameter_fields = ['slope_threshold', 'QFACT1', 'QFACT3_res', 'QFACT3_com', 'QFACT3_for', 'REM_EFF']
+metric_fields = ['P_WOff_0', 'P_WOff_1', 'P_Swept_1', 'Sw_Events', 'WOff_Diff']
+
+
+def parameter_grid(**values):
+    """Return every combination of the given parameter values as a list of parameter sets, e.g.
+    parameter_grid(slope_threshold=[0.05, 0.1], QFACT1=[100], QFACT3_res=[7], QFACT3_com=[4], QFACT3_for=[10],
+    REM_EFF=[0.7, 0.85]) gives 4 parameter sets."""
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*[values[name] for name in names])]
+
+
+def run_block(args):
+    """Simulate one block of parameter sets for all roads, returning metric arrays of shape (sets, roads)."""
+    length, pct_res, pct_com, pct_for, rain_in, parameter_sets = args
+    params = {field: np.array([p[field] for p in parameter_sets], dtype=float)[:, np.newaxis]
+              for field in parameter_fields}
+    QFACT3 = dominant_qfact3(pct_res, pct_com, pct_for, params['QFACT3_res'], params['QFACT3_com'],
+                             params['QFACT3_for'])
+    return simulate_roads(length, QFACT3, rain_in, params['slope_threshold'], params['QFACT1'], params['REM_EFF'])
+
+
+def run_batch(road_ids, length, pct_res, pct_com, pct_for, rain_in, parameter_sets, id_field='FID', processes=1,
+              max_cells=500000):
+    """Evaluate every parameter set for every road and return one long summary table.
+
+    Parameter sets are simulated in blocks of at most max_cells (parameter sets x roads) values to bound memory.
+    With processes > 1 the blocks are spread over a process pool."""
+    length = np.asarray(length, dtype=float)
+    pct_res = np.asarray(pct_res, dtype=float)
+    pct_com = np.asarray(pct_com, dtype=float)
+    pct_for = np.asarray(pct_for, dtype=float)
+    n_roads = len(length)
+    sets_per_block = max(1, max_cells // max(n_roads, 1))
+    blocks = [(length, pct_res, pct_com, pct_for, rain_in, parameter_sets[i:i + sets_per_block])
+              for i in range(0, len(parameter_sets), sets_per_block)]
+
+    if processes > 1 and len(blocks) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(run_block, blocks)
+    else:
+        results = [run_block(block) for block in blocks]
+
+    # One row per road per parameter set
+    summary = pd.DataFrame({'Set_ID': np.repeat(np.arange(len(parameter_sets)), n_roads)})
+    for field in parameter_fields:
+        summary[field] = np.repeat([p[field] for p in parameter_sets], n_roads)
+    summary[id_field] = np.tile(np.asarray(road_ids), len(parameter_sets))
+    for field in metric_fields:
+        summary[field] = np.concatenate([result[field].reshape(-1) for result in results])
+    return summary
@@ -0,0 +1,299 @@
+########################
+# Simulation engine for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# The buildup/washoff/sweeping model used to live inside PASST.execute as a Python loop over every road and then
+# every day. This module holds the same model in two forms, neither of which needs arcpy:
+#
+#     1. simulate_road_loop - the original scalar loop for a single road (kept as the reference implementation)
+#     2. simulate_roads - a NumPy engine that steps ALL roads forward one day at a time as arrays
+#
+# Both give the same daily values and per-road totals, including the rounding to 2 decimals that the tool has
+# always applied to each day's values. Run this file directly to benchmark one against the other.
+########################
+
+import math
+import time
+
+import numpy as np
+
+# Number of days used to calculate the slope of the pollution accumulation function
+num_slope_pts = 3
+
+# Daily record names, in the order they are reported by the engine
+scenario0_fields = ['Poll_0', 'Poll_Washoff0', 'D0']
+scenario1_fields = ['Poll_1', 'Poll_Swept1', 'Poll_Washoff1', 'Slope1', 'D1']
+
+
+def rain_to_inches(rain_mm):
+    """Convert daily precipitation from millimeters (meteostat 'prcp') to inches rounded to 2 decimals."""
+    return [round(float(day) * 0.03937008, 2) for day in rain_mm]
+
+
+def round2(values):
+    """Round an array to 2 decimals exactly like Python's round(value, 2).
+
+    np.round scales by 100 and rounds half to even, which can disagree with round() when the scaled value sits
+    right on a .5 boundary. Those few values are re-rounded with round() so that the engine matches the loop."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.asarray(np.round(values, 2))
+    scaled = values * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(float(value), 2) for value in values[near_tie]]
+    return rounded
+
+
+def dominant_qfact3(pct_res, pct_com, pct_for, QFACT3_res, QFACT3_com, QFACT3_for):
+    """Return QFACT3 (days to reach buildup limit) for each road, dependent on its dominant land use."""
+    pct_res = np.asarray(pct_res, dtype=float)
+    pct_com = np.asarray(pct_com, dtype=float)
+    pct_for = np.asarray(pct_for, dtype=float)
+    is_res = (pct_res >= pct_com) & (pct_res >= pct_for)
+    is_com = (pct_com >= pct_res) & (pct_com >= pct_for)
+    return np.where(is_res, QFACT3_res, np.where(is_com, QFACT3_com, QFACT3_for)).astype(float)
+
+
+def simulate_road_loop(length, QFACT3, rain_in, slope_threshold, QFACT1, REM_EFF):
+    """Track pollution for a single road with the original day-by-day Python loop.
+
+    Returns a dictionary of daily lists keyed by the scenario0_fields and scenario1_fields names."""
+    # Pollution tracking variables
+    Poll_0 = []  # Track Pollution with rain - Scenario 0 (no sweeping)
+    Poll_1 = []  # Track Pollution with rain and sweeping - Scenario 1
+    Poll_washoff0 = []  # Track Pollution washoff from rain - Scenario 0
+    Poll_washoff1 = []  # Track Pollution washoff from rain - Scenario 1
+    Poll_swept1 = []  # Track Pollution swept - Scenario 1
+
+    # Track days for pollutant accumulation functions - days reset if sweeping or rain occurs
+    d0_list = []  # Track dry/no sweep days - Scenario 0
+    d0 = 0
+    d1_list = []  # Track dry/no sweep days - Scenario 1
+    d1 = 0
+    slope1_list = []  # Track slope of pollutant build up - Scenario 1
+
+    for day in range(len(rain_in)):
+
+        #### Track Scenario 0 Pollution - with rain; no sweeping
+        Poll_0d = ((QFACT1 * d0) / (QFACT3 + d0)) * length
+
+        # Washoff function
+        if rain_in[day] > 0.5:
+            Poff_0d = 0.9 * Poll_0d
+        elif rain_in[day] > 0.2:
+            Poff_0d = 0.5 * Poll_0d
+        else:
+            Poff_0d = 0
+
+        # Subtract pollution washed off and reset day counter
+        if Poff_0d > 0:
+            Poll_0d = Poll_0d - Poff_0d
+            d0 = (Poll_0d * QFACT3) / (QFACT1 * length - Poll_0d) + 1
+        else:
+            d0 += 1
+            d0 = math.trunc(d0)
+
+        Poll_0.append(round(Poll_0d, 2))
+        Poll_washoff0.append(round(Poff_0d, 2))
+        d0 = round(d0, 2)
+        d0_list.append(d0)
+
+        #### Track Scenario 1 Pollution - with sweeping and rain
+        Poll_1d = ((QFACT1 * d1) / (QFACT3 + d1)) * length
+
+        # Washoff function
+        if rain_in[day] > 0.5:
+            Poff_1d = 0.9 * Poll_1d
+        elif rain_in[day] > 0.2:
+            Poff_1d = 0.5 * Poll_1d
+        else:
+            Poff_1d = 0
+
+        # Sweeping function
+        if day > 2:
+            # slope = (y2 - y1) / (x2 - x1)
+            slope1 = (Poll_1d - Poll_1[day - num_slope_pts]) / num_slope_pts
+            if rain_in[day] > 0:
+                Pswept_1d = 0
+            elif slope_threshold * QFACT1 > slope1 > 2:
+                Pswept_1d = REM_EFF * Poll_1d
+            else:
+                Pswept_1d = 0
+        else:
+            slope1 = 0
+            Pswept_1d = 0
+
+        # Subtract pollution washed off
+        if Poff_1d > 0:
+            Poll_1d = Poll_1d - Poff_1d
+
+        # Subtract pollution swept off and reset day counter
+        if Pswept_1d > 0:
+            Poll_1d = Poll_1d - Pswept_1d
+            d1 = (Poll_1d * QFACT3) / (QFACT1 * length - Poll_1d) + 1
+        elif Poff_1d > 0:
+            d1 = (Poll_1d * QFACT3) / (QFACT1 * length - Poll_1d) + 1
+        else:
+            d1 += 1
+            d1 = math.trunc(d1)
+
+        Poll_1.append(round(Poll_1d, 2))
+        Poll_swept1.append(round(Pswept_1d, 2))
+        Poll_washoff1.append(round(Poff_1d, 2))
+        d1 = round(d1, 2)
+        d1_list.append(d1)
+        slope1_list.append(round(slope1, 2))
+
+    return {'Poll_0': Poll_0, 'Poll_Washoff0': Poll_washoff0, 'D0': d0_list,
+            'Poll_1': Poll_1, 'Poll_Swept1': Poll_swept1, 'Poll_Washoff1': Poll_washoff1,
+            'Slope1': slope1_list, 'D1': d1_list}
+
+
+def summarize_loop(daily):
+    """Calculate the per-road metrics from the daily lists returned by simulate_road_loop."""
+    sum_washoff_0 = 0
+    for value in daily['Poll_Washoff0']:
+        sum_washoff_0 += value
+    sum_washoff_1 = 0
+    for value in daily['Poll_Washoff1']:
+        sum_washoff_1 += value
+    sum_swept_1 = 0
+    for value in daily['Poll_Swept1']:
+        sum_swept_1 += value
+    sum_washoff_0 = round(sum_washoff_0, 2)
+    sum_washoff_1 = round(sum_washoff_1, 2)
+    return {'P_WOff_0': sum_washoff_0,
+            'P_WOff_1': sum_washoff_1,
+            'P_Swept_1': round(sum_swept_1, 2),
+            'Sw_Events': len([value for value in daily['Poll_Swept1'] if value > 0]),
+            'WOff_Diff': round((sum_washoff_1 - sum_washoff_0) / sum_washoff_0 * 100, 2)}
+
+
+def simulate_roads(length, QFACT3, rain_in, slope_threshold, QFACT1, REM_EFF, on_day=None, sweep_days=None):
+    """Track pollution for every road at once, stepping all roads forward one day at a time as arrays.
+
+    length and QFACT3 hold one value per road. They, and the scalar parameters, may be any NumPy-broadcastable
+    shape (e.g. (n_sets, n_roads) to evaluate several parameter sets together); rain_in is indexed by day first and
+    each day's rainfall must broadcast against the roads as well. on_day(day, values) is called after every day with
+    a dictionary of the rounded daily arrays keyed by the scenario0_fields and scenario1_fields names.
+
+    sweep_days optionally replaces the slope-based sweeping rule with a fixed schedule: a boolean array indexed by
+    day first (broadcast against the roads like rain_in) marking the days each road is swept in Scenario 1. As with
+    the slope rule, roads are not swept on days with rain.
+
+    Returns a dictionary of per-road metric arrays: P_WOff_0, P_WOff_1, P_Swept_1, Sw_Events and WOff_Diff."""
+    rain_in = np.asarray(rain_in, dtype=float)
+    length = np.asarray(length, dtype=float)
+    QFACT3 = np.asarray(QFACT3, dtype=float)
+    QFACT1 = np.asarray(QFACT1, dtype=float)
+    slope_threshold = np.asarray(slope_threshold, dtype=float)
+    REM_EFF = np.asarray(REM_EFF, dtype=float)
+    shape = np.broadcast_shapes(length.shape, QFACT3.shape, QFACT1.shape, slope_threshold.shape,
+                                REM_EFF.shape, rain_in.shape[1:])
+    if sweep_days is not None:
+        sweep_days = np.asarray(sweep_days, dtype=bool)
+        shape = np.broadcast_shapes(shape, sweep_days.shape[1:])
+    limit = np.broadcast_to(QFACT1 * length, shape)
+    QFACT3 = np.broadcast_to(QFACT3, shape)
+    sweep_limit = slope_threshold * QFACT1
+
+    d0 = np.zeros(shape)
+    d1 = np.zeros(shape)
+    recent_poll_1 = np.zeros((num_slope_pts,) + shape)  # Poll_1 of the last num_slope_pts days (ring buffer)
+    sum_washoff_0 = np.zeros(shape)
+    sum_washoff_1 = np.zeros(shape)
+    sum_swept_1 = np.zeros(shape)
+    sweep_events_1 = np.zeros(shape, dtype=int)
+
+    for day in range(len(rain_in)):
+        rain = rain_in[day]
+        washoff_rate = np.where(rain > 0.5, 0.9, np.where(rain > 0.2, 0.5, 0.0))
+
+        #### Track Scenario 0 Pollution - with rain; no sweeping
+        Poll_0d = (QFACT1 * d0) / (QFACT3 + d0) * length
+        Poff_0d = washoff_rate * Poll_0d
+        washed_0 = Poff_0d > 0
+        Poll_0d = Poll_0d - Poff_0d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d0 = np.where(washed_0, (Poll_0d * QFACT3) / (limit - Poll_0d) + 1, np.trunc(d0 + 1))
+        d0 = round2(d0)
+
+        #### Track Scenario 1 Pollution - with sweeping and rain
+        Poll_1d = (QFACT1 * d1) / (QFACT3 + d1) * length
+        Poff_1d = washoff_rate * Poll_1d
+        if day > 2:
+            slope1 = (Poll_1d - recent_poll_1[day % num_slope_pts]) / num_slope_pts
+        else:
+            slope1 = np.zeros(shape)
+        if sweep_days is not None:
+            sweep = ~(rain > 0) & sweep_days[day]
+        elif day > 2:
+            sweep = ~(rain > 0) & (sweep_limit > slope1) & (slope1 > 2)
+        else:
+            sweep = False
+        Pswept_1d = np.where(sweep, REM_EFF * Poll_1d, 0.0)
+        Poll_1d = Poll_1d - Poff_1d - Pswept_1d
+        reset_1 = (Pswept_1d > 0) | (Poff_1d > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d1 = np.where(reset_1, (Poll_1d * QFACT3) / (limit - Poll_1d) + 1, np.trunc(d1 + 1))
+        d1 = round2(d1)
+
+        Poll_0d = round2(Poll_0d)
+        Poff_0d = round2(Poff_0d)
+        Poll_1d = round2(Poll_1d)
+        Pswept_1d = round2(Pswept_1d)
+        Poff_1d = round2(Poff_1d)
+        recent_poll_1[day % num_slope_pts] = Poll_1d
+
+        # Running totals are added day by day so they match the loop's sums to the last bit
+        sum_washoff_0 += Poff_0d
+        sum_washoff_1 += Poff_1d
+        sum_swept_1 += Pswept_1d
+        sweep_events_1 += Pswept_1d > 0
+
+        if on_day is not None:
+            on_day(day, {'Poll_0': Poll_0d, 'Poll_Washoff0': Poff_0d, 'D0': d0,
+                         'Poll_1': Poll_1d, 'Poll_Swept1': Pswept_1d, 'Poll_Washoff1': Poff_1d,
+                         'Slope1': round2(slope1), 'D1': d1})
+
+    sum_washoff_0 = round2(sum_washoff_0)
+    sum_washoff_1 = round2(sum_washoff_1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_diff = round2((sum_washoff_1 - sum_washoff_0) / sum_washoff_0 * 100)
+
+    return {'P_WOff_0': sum_washoff_0,
+            'P_WOff_1': sum_washoff_1,
+            'P_Swept_1': round2(sum_swept_1),
+            'Sw_Events': sweep_events_1,
+            'WOff_Diff': pct_diff}
+
+
+def main():
+    # Benchmark the engine against the original loop with synthetic roads and rainfall
+    n_roads = 2000
+    n_days = 3 * 365
+    rng = np.random.default_rng(528)
+    length = np.round(rng.uniform(0.05, 0.15, n_roads), 2)
+    QFACT3 = rng.choice([7.0, 4.0, 10.0], n_roads)
+    rain_in = rain_to_inches(np.where(rng.random(n_days) < 0.3, rng.gamma(0.8, 10, n_days), 0.0))
+
+    start_time = time.time()
+    loop_totals = [summarize_loop(simulate_road_loop(float(length[i]), float(QFACT3[i]), rain_in, 0.1, 100, 0.85))
+                   for i in range(n_roads)]
+    loop_time = time.time() - start_time
+
+    start_time = time.time()
+    totals = simulate_roads(length, QFACT3, rain_in, 0.1, 100, 0.85)
+    engine_time = time.time() - start_time
+
+    for field in totals:
+        loop_values = np.array([road[field] for road in loop_totals], dtype=float)
+        if not np.array_equal(loop_values, totals[field], equal_nan=True):
+            print('Mismatch in ' + field)
+
+    print('{0} roads x {1} days'.format(n_roads, n_days))
+    print('    - Loop: {0:.2f} seconds'.format(loop_time))
+    print('    - Engine: {0:.2f} seconds ({1:.0f}x faster)'.format(engine_time, loop_time / engine_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+########################
+# Monte Carlo rainfall ensemble mode for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# PASST only sees the single observed rainfall series. For planning, the buildup/washoff/sweeping model is run here
+# across hundreds to thousands of synthetic rainfall realizations, generated from the observed record by either:
+#
+#     1. YearResampler - each simulated year is a whole historical year picked at random (keeps seasonality and
+#        the day-to-day structure of real storms)
+#     2. MarkovRainfall - a two-state (wet/dry) Markov chain fitted per calendar month, with wet-day amounts drawn
+#        from that month's observed wet days
+#
+# Realizations are simulated in blocks: each block is one (realizations x roads) array simulation (see
+# passt_engine.simulate_roads), blocks can be spread over a process pool, and only the per-realization totals are
+# kept, so memory does not grow with the length of the simulation. run_ensemble reports percentile bands of the
+# washoff reduction per road.
+########################
+
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from passt_engine import round2, simulate_roads
+
+
+def calendar_slots(dates):
+    """Return the day of a leap year (0-365) for each date, so that the same month and day share a slot."""
+    dates = pd.DatetimeIndex(dates)
+    return pd.DatetimeIndex(pd.to_datetime({'year': 2000, 'month': dates.month, 'day': dates.day})).dayofyear - 1
+
+
+class YearResampler(object):
+    def __init__(self, rain_mm, dates):
+        """Generate rainfall by resampling whole years of an observed daily series (mm). Only complete years of the
+        record are used."""
+        observed = pd.Series(np.asarray(rain_mm, dtype=float), index=pd.DatetimeIndex(dates))
+        years = [days for year, days in observed.groupby(observed.index.year) if len(days) >= 365]
+        if not years:
+            raise ValueError('At least one complete year of rainfall is needed to resample years')
+
+        # One row of 366 calendar slots per historical year - Feb 29 repeats Feb 28 in non-leap years
+        self.years = np.full((len(years), 366), np.nan)
+        for i, days in enumerate(years):
+            self.years[i, calendar_slots(days.index)] = days.to_numpy()
+            if not days.index.is_leap_year[0]:
+                self.years[i, 59] = self.years[i, 58]
+
+    def generate(self, dates, n_realizations, rng):
+        """Return an array of daily rainfall (mm) with shape (days, realizations) for the simulation dates."""
+        dates = pd.DatetimeIndex(dates)
+        year_index = dates.year - dates.year[0]
+        picks = rng.integers(0, len(self.years), size=(year_index[-1] + 1, n_realizations))
+        return self.years[picks[year_index], np.asarray(calendar_slots(dates))[:, np.newaxis]]
+
+
+class MarkovRainfall(object):
+    def __init__(self, rain_mm, dates, wet_threshold=0.1):
+        """Fit a two-state Markov chain for wet (rain >= wet_threshold mm) and dry days for each calendar month of an
+        observed daily series (mm)."""
+        rain_mm = np.asarray(rain_mm, dtype=float)
+        months = pd.DatetimeIndex(dates).month.to_numpy() - 1
+        wet = rain_mm >= wet_threshold
+        valid = ~np.isnan(rain_mm)
+
+        # Transitions are counted on pairs of consecutive observed days, by the month of the second day
+        pairs = valid[:-1] & valid[1:]
+        prev_wet = wet[:-1][pairs]
+        now_wet = wet[1:][pairs]
+        pair_months = months[1:][pairs]
+        self.p_wet_after_dry = np.zeros(12)
+        self.p_wet_after_wet = np.zeros(12)
+        self.wet_amounts = []
+        for month in range(12):
+            in_month = pair_months == month
+            after_dry = in_month & ~prev_wet
+            after_wet = in_month & prev_wet
+            if after_dry.any():
+                self.p_wet_after_dry[month] = now_wet[after_dry].mean()
+            if after_wet.any():
+                self.p_wet_after_wet[month] = now_wet[after_wet].mean()
+            self.wet_amounts.append(rain_mm[wet & valid & (months == month)])
+
+    def generate(self, dates, n_realizations, rng):
+        """Return an array of daily rainfall (mm) with shape (days, realizations) for the simulation dates."""
+        months = pd.DatetimeIndex(dates).month.to_numpy() - 1
+        rain = np.zeros((len(months), n_realizations))
+        is_wet = np.zeros(n_realizations, dtype=bool)
+        for day, month in enumerate(months):
+            p_wet = np.where(is_wet, self.p_wet_after_wet[month], self.p_wet_after_dry[month])
+            is_wet = rng.random(n_realizations) < p_wet
+            if is_wet.any() and len(self.wet_amounts[month]):
+                rain[day, is_wet] = rng.choice(self.wet_amounts[month], is_wet.sum())
+        return rain
+
+
+def run_block(args):
+    """Simulate one block of rainfall realizations for all roads, returning metric arrays of shape
+    (realizations, roads)."""
+    generator, dates, n_realizations, seed, length, QFACT3, slope_threshold, QFACT1, REM_EFF = args
+    rain_mm = generator.generate(dates, n_realizations, np.random.default_rng(seed))
+    rain_in = round2(rain_mm * 0.03937008)[:, :, np.newaxis]
+    totals = simulate_roads(length, QFACT3, rain_in, slope_threshold, QFACT1, REM_EFF)
+    return {'P_WOff_0': totals['P_WOff_0'].astype(np.float32),
+            'P_WOff_1': totals['P_WOff_1'].astype(np.float32),
+            'WOff_Diff': totals['WOff_Diff'].astype(np.float32)}
+
+
+def run_ensemble(road_ids, length, QFACT3, generator, dates, slope_threshold, QFACT1, REM_EFF, n_realizations=1000,
+                 block_size=50, percentiles=(5, 25, 50, 75, 95), seed=None, id_field='FID', processes=1):
+    """Run the PASST model for every road across n_realizations synthetic rainfall series over the simulation dates.
+
+    Returns one row per road with the mean and percentile bands (e.g. WOff_Diff_P5) of the percent difference in
+    washoff between Scenario 0 and 1 (WOff_Diff) and of the washoff removed by sweeping in pounds (WOff_Reduced)."""
+    length = np.asarray(length, dtype=float)
+    QFACT3 = np.asarray(QFACT3, dtype=float)
+    block_sizes = [min(block_size, n_realizations - i) for i in range(0, n_realizations, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(block_sizes))
+    blocks = [(generator, dates, size, block_seed, length, QFACT3, slope_threshold, QFACT1, REM_EFF)
+              for size, block_seed in zip(block_sizes, seeds)]
+
+    if processes > 1 and len(blocks) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(run_block, blocks)
+    else:
+        results = [run_block(block) for block in blocks]
+
+    woff_diff = np.concatenate([result['WOff_Diff'] for result in results])
+    woff_reduced = np.concatenate([result['P_WOff_0'] - result['P_WOff_1'] for result in results])
+
+    summary = pd.DataFrame({id_field: np.asarray(road_ids)})
+    for name, values in [('WOff_Diff', woff_diff), ('WOff_Reduced', woff_reduced)]:
+        summary[name + '_Mean'] = np.nanmean(values, axis=0)
+        bands = np.nanpercentile(values, percentiles, axis=0)
+        for percentile, band in zip(percentiles, bands):
+            summary['{0}_P{1}'.format(name, percentile)] = band
+    return summary
@@ -0,0 +1,69 @@
+########################
+# Land use class percentages for the Land Use Calculator tool.
+#
+# The Land Use Calculator used to run one Select and one TabulateIntersection per land use class over the same buffer
+# zones, then one AddField/CalculateField round per class. It now runs a single TabulateIntersection with the
+# land use class (Symb_cat) as the class field, and pivot_class_percentages turns the resulting (zone, class,
+# percentage) rows into one percentage column per class - for any number of classes.
+#
+# land_use_percentages runs the whole calculation through a geoprocessing backend (see geoproc), so it runs with
+# arcpy in the toolbox and with shapely/pyogrio anywhere else.
+########################
+
+import re
+
+import pandas as pd
+
+# Output field for each land use class used by PASST
+land_use_fields = {'Residential': 'PCT_RES',
+                   'Commercial and Services': 'PCT_COM',
+                   'Forest Land': 'PCT_FOR'}
+
+
+def class_field_name(land_use_class):
+    """Return the output field for a land use class, e.g. 'Residential' -> 'PCT_RES' and 'Water' -> 'PCT_WATER'.
+    Other classes get PCT_ and the first 6 letters of the class name, to fit shapefile field names."""
+    if land_use_class in land_use_fields:
+        return land_use_fields[land_use_class]
+    return 'PCT_' + re.sub('[^A-Za-z0-9]', '', land_use_class).upper()[:6]
+
+
+def class_field_names(classes):
+    """Return a dictionary of land use class -> output field for classes, with no two classes on the same field:
+    a class whose field is taken gets a number in its last characters, e.g. 'Wetlands' -> 'PCT_WETLAN' and
+    'Wetland Forest' -> 'PCT_WETLA1'."""
+    fields = {}
+    for land_use_class in classes:
+        field = class_field_name(land_use_class)
+        number = 1
+        while field in fields.values():
+            suffix = str(number)
+            field = class_field_name(land_use_class)[:10 - len(suffix)] + suffix
+            number += 1
+        fields[land_use_class] = field
+    return fields
+
+
+def pivot_class_percentages(rows, zone_ids, classes):
+    """Turn (zone, class, percentage) rows into a dictionary of output field -> percentages in zone_ids order.
+
+    Zones with no area of a class get 0."""
+    classes = list(dict.fromkeys(classes))
+    fields = class_field_names(classes)
+    table = pd.DataFrame(list(rows), columns=['zone', 'land_use_class', 'percentage'])
+    table = table.pivot_table(index='zone', columns='land_use_class', values='percentage', aggfunc='sum')
+    table = table.reindex(index=list(zone_ids), columns=classes).fillna(0)
+    return {fields[land_use_class]: table[land_use_class].tolist() for land_use_class in classes}
+
+
+def land_use_percentages(backend, roads, land_use, buffer_dist, classes):
+    """Buffer every road by buffer_dist and return (road IDs, dictionary of output field -> percentage of each land
+    use class in the buffer zone of each road) using a geoprocessing backend."""
+    road_ids = backend.table(roads, []).index.tolist()
+    buffer_zones = backend.buffer(roads, buffer_dist, 'ROUND')
+    land_use_layer = backend.select(land_use, 'Symb_cat', classes)
+
+    # Zones are identified by ORIG_FID, the ID of the road they buffer
+    table = backend.tabulate_intersection(buffer_zones, 'ORIG_FID', land_use_layer, 'Symb_cat')
+    rows = table[['ORIG_FID', 'Symb_cat', 'PERCENTAGE']].itertuples(index=False)
+    return road_ids, pivot_class_percentages(rows, road_ids, classes)
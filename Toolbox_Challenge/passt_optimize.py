@@ -0,0 +1,127 @@
+########################
+# Sweep schedule optimizer for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# PASST sweeps a road whenever the slope of its pollution accumulation falls under the slope threshold. This module
+# answers a different question: given N sweeps per month (one sweep = one road swept on one day), which roads should
+# be swept on which days to remove the most pollution before it washes off?
+#
+# optimize_schedule is a greedy search on marginal gain with a priority queue (lazy greedy):
+#
+#     1. For each road, find the dry day whose sweep reduces the road's Scenario 1 washoff the most
+#     2. Repeatedly accept the sweep with the largest reduction, then find the road's next best day given the sweeps
+#        it already has. Sweeps in months that are already full are re-evaluated when they reach the top of the queue.
+#
+# Roads do not interact, so gains are evaluated once per mile for each QFACT3 value and schedule and then scaled by
+# road length. This is an approximation: the model is linear in road length except that the engine rounds each day's
+# pollution to 2 decimals, so a scaled gain is off by up to a few hundredths of a pound per road (about 0.02-0.04 lb
+# over 3 years with the default parameters, against gains of about 1-20 lb). All candidate days for a schedule are
+# evaluated in one call to passt_engine.simulate_roads, with one column per candidate day, and a schedule's gains are
+# kept for every day, so months filling up only hides days instead of evaluating the schedule again.
+#
+# The run time is set by the number of distinct (QFACT3, schedule) pairs the search reaches, each costing one
+# simulation over the whole period - it grows with the sweeps per road and the number of months more than with the
+# number of roads (3000 roads, 3 years and 1000 sweeps per month evaluate about 1500 schedules).
+########################
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from passt_engine import simulate_roads
+
+
+class ScheduleGains(object):
+    def __init__(self, rain_in, months, QFACT1, REM_EFF):
+        """Evaluate the washoff reduction of sweeping one more day, per mile of road, with memoization."""
+        self.rain_in = np.asarray(rain_in, dtype=float)
+        self.dry = ~(self.rain_in > 0)
+        self.months = months
+        self.QFACT1 = QFACT1
+        self.REM_EFF = REM_EFF
+        self.cache = {}
+        self.open_days = {}
+        self.evaluations = 0
+
+    def day_gains(self, QFACT3, schedule, open_days):
+        """Return the gain per mile of adding each day to schedule - -inf for rainy days and days already swept, and
+        NaN for days outside open_days that have not been evaluated yet."""
+        key = (QFACT3, schedule)
+        if key not in self.cache:
+            gains = np.where(self.dry, np.nan, -np.inf)
+            gains[list(schedule)] = -np.inf
+            self.cache[key] = gains
+        gains = self.cache[key]
+
+        # Only the open days not evaluated yet - months only fill up, so a schedule's days are evaluated once
+        candidates = np.flatnonzero(np.isnan(gains) & open_days)
+        if candidates.size:
+            # Column 0 is the current schedule, column i + 1 adds candidates[i]
+            sweep_days = np.zeros((len(self.rain_in), candidates.size + 1), dtype=bool)
+            sweep_days[list(schedule), :] = True
+            sweep_days[candidates, np.arange(1, candidates.size + 1)] = True
+            totals = simulate_roads(1.0, QFACT3, self.rain_in[:, np.newaxis], 0, self.QFACT1, self.REM_EFF,
+                                    sweep_days=sweep_days)
+            self.evaluations += 1
+            gains[candidates] = totals['P_WOff_1'][0] - totals['P_WOff_1'][1:]
+        return gains
+
+    def best_day(self, QFACT3, schedule, full_months):
+        """Return (gain per mile, day) of the best day to add to schedule, skipping full months and rainy days."""
+        if full_months not in self.open_days:
+            self.open_days[full_months] = ~np.isin(self.months, list(full_months))
+        open_days = self.open_days[full_months]
+        gains = np.where(open_days, self.day_gains(QFACT3, schedule, open_days), -np.inf)
+        best = np.argmax(gains)
+        if gains[best] == -np.inf:
+            return 0.0, None
+        return gains[best], int(best)
+
+
+def optimize_schedule(road_ids, length, QFACT3, rain_in, dates, QFACT1, REM_EFF, sweeps_per_month,
+                      id_field='FID'):
+    """Choose up to sweeps_per_month sweeps (road, day) in each calendar month to minimize total washoff.
+
+    Returns the schedule as a dataframe with one row per sweep (road ID and date), and the sweep_days array
+    (days x roads) that can be passed to passt_engine.simulate_roads to evaluate it."""
+    length = np.asarray(length, dtype=float)
+    QFACT3 = np.asarray(QFACT3, dtype=float)
+    dates = pd.DatetimeIndex(dates)
+    months = np.asarray(dates.year * 12 + dates.month - 1)
+    used = dict.fromkeys(np.unique(months).tolist(), 0)
+    full_months = frozenset(month for month in used if sweeps_per_month <= 0)
+    gains = ScheduleGains(rain_in, months, QFACT1, REM_EFF)
+
+    # Priority queue of each road's best next sweep, largest washoff reduction first
+    schedules = [() for road in range(len(length))]
+    queue = []
+    for road in range(len(length)):
+        gain, day = gains.best_day(QFACT3[road], schedules[road], full_months)
+        if day is not None and gain > 0:
+            heapq.heappush(queue, (-gain * length[road], road, day))
+
+    while queue and len(full_months) < len(used):
+        gain, road, day = heapq.heappop(queue)
+        if months[day] in full_months:
+            # The month filled up since this sweep was queued - find the road's best day in the months left
+            gain, day = gains.best_day(QFACT3[road], schedules[road], full_months)
+            if day is not None and gain > 0:
+                heapq.heappush(queue, (-gain * length[road], road, day))
+            continue
+
+        # Accept the sweep and queue the road's next best sweep
+        schedules[road] = tuple(sorted(schedules[road] + (day,)))
+        used[months[day]] += 1
+        if used[months[day]] >= sweeps_per_month:
+            full_months = full_months | {months[day]}
+        gain, day = gains.best_day(QFACT3[road], schedules[road], full_months)
+        if day is not None and gain > 0:
+            heapq.heappush(queue, (-gain * length[road], road, day))
+
+    sweep_days = np.zeros((len(dates), len(length)), dtype=bool)
+    for road, schedule in enumerate(schedules):
+        sweep_days[list(schedule), road] = True
+    sweep_day, sweep_road = np.nonzero(sweep_days)
+    schedule = pd.DataFrame({id_field: np.asarray(road_ids)[sweep_road],
+                             'Date': dates[sweep_day].strftime('%Y-%m-%d')})
+    return schedule, sweep_days
@@ -0,0 +1,133 @@
+########################
+# Rainfall sources and an offline rainfall cache for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# PASST used to call meteostat for the same point on every run, which needs the network and pays the fetch latency on
+# every parameter tweak. Rainfall now comes from a "source" - any function source(start, end) that returns the daily
+# precipitation (mm) as a pandas Series indexed by date - and can be kept in a RainfallCache on disk:
+#
+#     1. meteostat_source - daily precipitation for a point from the meteostat API (the original behavior)
+#     2. csv_source - daily precipitation from a csv file, for running fully offline
+#     3. array_source - daily precipitation from arrays of dates and values
+#
+# The cache stores one memory-mapped .npy file per station/point with one float32 value per day since 1/1/1900, so a
+# run only reads the days it asks for. Days that have not been fetched yet are marked with -1 and are filled from
+# the source on the first run that needs them. Days the source has no value for are stored as NaN, except for the
+# last recheck_days days (e.g. days meteostat has not published yet), which stay unfetched and are asked for again on
+# later runs until the source has them.
+########################
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+epoch = datetime(1900, 1, 1)
+not_fetched = -1.0
+grow_days = 3650  # Cache files grow in steps of ~10 years to avoid rewriting them on every run
+recheck_days = 30   # Missing days this recent may still be published, so they are fetched again on the next run
+
+
+def meteostat_source(lat, lon):
+    """Return a source that fetches daily precipitation for a point from the meteostat API."""
+    def fetch(start, end):
+        import meteostat
+        data = meteostat.Daily(meteostat.Point(lat=lat, lon=lon), start, end).fetch()
+        return data['prcp']
+    return fetch
+
+
+def array_source(dates, prcp):
+    """Return a source that serves daily precipitation (mm) from arrays of dates and values."""
+    series = pd.Series(np.asarray(prcp, dtype=float), index=pd.DatetimeIndex(dates)).sort_index()
+
+    def fetch(start, end):
+        return series[start:end]
+    return fetch
+
+
+def csv_source(path, date_field='time', prcp_field='prcp'):
+    """Return a source that serves daily precipitation (mm) from a csv file, e.g. a saved meteostat table."""
+    data = pd.read_csv(path, usecols=[date_field, prcp_field], parse_dates=[date_field])
+    return array_source(data[date_field], data[prcp_field])
+
+
+def point_key(lat, lon):
+    """Cache key for a point, e.g. '41.7260_-71.4304'."""
+    return '{0:.4f}_{1:.4f}'.format(lat, lon)
+
+
+class RainfallCache(object):
+    def __init__(self, folder, recheck_days=recheck_days):
+        """Cache of daily precipitation, stored as one file per station/point key in folder. Days the source has no
+        value for within recheck_days of today are not stored, so they are fetched again."""
+        self.folder = folder
+        self.recheck_days = recheck_days
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def path(self, key):
+        return os.path.join(self.folder, 'prcp_' + key + '.npy')
+
+    def open(self, key, n_days):
+        """Open the cache file for key as a writable memory map holding at least n_days days."""
+        path = self.path(key)
+        if os.path.exists(path):
+            store = np.load(path, mmap_mode='r+')
+            if len(store) >= n_days:
+                return store
+            old = np.array(store)
+            del store
+        else:
+            old = np.zeros(0, dtype=np.float32)
+
+        # Grow the file, keeping what has been fetched so far
+        n_days = (n_days // grow_days + 1) * grow_days
+        store = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32, shape=(n_days,))
+        store[:] = not_fetched
+        store[:len(old)] = old
+        store.flush()
+        del store
+        os.replace(path + '.tmp', path)
+        return np.load(path, mmap_mode='r+')
+
+    def get(self, key, start, end, source):
+        """Return the daily precipitation (mm) for key from start to end, fetching only the missing days. Days without
+        a value are NaN."""
+        first = (start - epoch).days
+        last = (end - epoch).days
+        if first < 0:
+            raise ValueError('Rainfall cache starts on ' + epoch.strftime('%m/%d/%Y'))
+        store = self.open(key, last + 1)
+
+        # Fill each run of consecutive missing days with one call to the source
+        missing = np.flatnonzero(store[first:last + 1] == not_fetched) + first
+        if missing.size:
+            recheck = pd.Timestamp(datetime.now().date() - timedelta(days=self.recheck_days))
+            runs = np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1)
+            for run in runs:
+                run_dates = pd.date_range(epoch + timedelta(days=int(run[0])), periods=len(run))
+                fetched = source(run_dates[0].to_pydatetime(), run_dates[-1].to_pydatetime())
+                fetched = fetched.reindex(run_dates).to_numpy(dtype=np.float32)
+
+                # Recent days without a value are left unfetched, to be asked for again
+                fetched[np.isnan(fetched) & (run_dates >= recheck)] = not_fetched
+                store[run[0]:run[-1] + 1] = fetched
+            store.flush()
+
+        values = np.array(store[first:last + 1], dtype=float)
+        values[values == not_fetched] = np.nan
+        del store
+        return pd.Series(values, index=pd.date_range(start, end), name='prcp')
+
+
+def get_rainfall(start, end, source, cache=None, key=None):
+    """Return a dataframe with the daily precipitation (mm) in a 'prcp' column for every day from start to end.
+
+    If a cache and key are given the days are read from the cache, and only days it does not hold yet are fetched
+    from the source."""
+    if cache is not None and key is not None:
+        prcp = cache.get(key, start, end, source)
+    else:
+        prcp = source(start, end).reindex(pd.date_range(start, end))
+    return pd.DataFrame({'prcp': prcp.to_numpy(dtype=float)}, index=pd.date_range(start, end, name='time'))
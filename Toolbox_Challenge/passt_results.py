@@ -0,0 +1,67 @@
+########################
+# Streaming results writer for the Pollution Accumulation and Street Sweeping Tool (PASST).
+#
+# PASST used to rebuild the Scenario tables from the full daily lists and rewrite them with to_csv on every simulated
+# day, and each road overwrote the tables of the road before it. ResultsWriter instead keeps every road's time series
+# in one long-format table (one row per road per day, keyed by road ID and date) and appends it to the csv in blocks
+# of days, so the cost of writing is linear in the length of the simulation and memory use stays bounded.
+########################
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ResultsWriter(object):
+    def __init__(self, path, road_ids, dates, fields, id_field='FID', chunk_days=100):
+        """Open a long-format csv table at path for the given road IDs, simulation dates and daily value fields.
+
+        Daily values are buffered and appended to the csv every chunk_days days."""
+        self.path = path
+        self.road_ids = np.asarray(road_ids)
+        self.dates = pd.DatetimeIndex(dates)
+        self.fields = list(fields)
+        self.id_field = id_field
+        self.chunk_days = chunk_days
+        self.block_days = []
+        self.block_values = {field: [] for field in self.fields}
+        self.rows_written = 0
+        self.header_written = False
+
+        # Start a fresh table - blocks are appended from here on
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write_day(self, day, values):
+        """Buffer the values of one simulated day (one array per field, one value per road)."""
+        self.block_days.append(day)
+        for field in self.fields:
+            self.block_values[field].append(np.asarray(values[field]).reshape(-1))
+        if len(self.block_days) >= self.chunk_days:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered days to the csv as one block of rows."""
+        if not self.block_days:
+            return
+        n_roads = len(self.road_ids)
+        block = pd.DataFrame({self.id_field: np.tile(self.road_ids, len(self.block_days)),
+                              'Date': np.repeat(self.dates[self.block_days].strftime('%Y-%m-%d'), n_roads)})
+        for field in self.fields:
+            block[field] = np.concatenate(self.block_values[field])
+        block.to_csv(self.path, mode='a', header=not self.header_written, index=False)
+
+        self.header_written = True
+        self.rows_written += len(block)
+        self.block_days = []
+        self.block_values = {field: [] for field in self.fields}
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,67 @@
+########################
+# Keyed write-back of per-feature results for the Land Use Calculator and PASST tools.
+#
+# Both tools used to write their results back by popping values off the front of Python lists inside an
+# UpdateCursor. That is O(n^2) in the number of roads and silently assumes the cursor visits the rows in the same
+# order the values were collected in. write_results instead matches every value to its row by ID:
+#
+#     1. Bulk path - if none of the result fields exist yet, the results are built as a NumPy structured array and
+#        joined onto the table in one call with arcpy.da.ExtendTable (no per-row cursor calls)
+#     2. Cursor path - otherwise (e.g. when rerunning a tool on its own output) a dictionary of ID -> values is built
+#        and the rows are updated in a single UpdateCursor pass
+########################
+
+import numpy as np
+
+from geoproc.parquet import is_parquet, update_parquet
+
+# Name of the ID field in the structured array - ExtendTable joins it to the table's ID field and does not add it
+join_field = 'JOIN_ID'
+
+
+def results_array(ids, columns, dtypes=None):
+    """Return a NumPy structured array with a JOIN_ID field holding ids and one field per column.
+
+    columns is a dictionary of field name -> values in the same order as ids. dtypes optionally maps field names to
+    NumPy types (default float64)."""
+    dtypes = dtypes or {}
+    ids = np.asarray(ids)
+    array = np.zeros(len(ids), dtype=[(join_field, ids.dtype)] +
+                     [(field, dtypes.get(field, np.float64)) for field in columns])
+    array[join_field] = ids
+    for field, values in columns.items():
+        array[field] = values
+    return array
+
+
+def keyed_values(ids, columns):
+    """Return a dictionary of id -> list of the column values for that id."""
+    fields = list(columns)
+    return {key: [columns[field][i] for field in fields] for i, key in enumerate(ids)}
+
+
+def write_results(in_table, id_field, ids, columns, dtypes=None, bulk=True):
+    """Write per-feature results into in_table, matching each value to its row through id_field.
+
+    Rows whose ID is not in ids are left unchanged. Returns the number of rows written. in_table can also be a
+    GeoParquet file, whose columns are rewritten with geoproc.parquet.update_parquet."""
+    if is_parquet(in_table):
+        return update_parquet(in_table, id_field, ids, columns)
+
+    import arcpy
+
+    fields = list(columns)
+    existing = [field.name.upper() for field in arcpy.ListFields(in_table)]
+    if bulk and not any(field.upper() in existing for field in fields):
+        arcpy.da.ExtendTable(in_table, id_field, results_array(ids, columns, dtypes), join_field, append_only=False)
+        return len(ids)
+
+    lookup = keyed_values(ids, columns)
+    count = 0
+    with arcpy.da.UpdateCursor(in_table, [id_field] + fields) as cursor:
+        for row in cursor:
+            values = lookup.get(row[0])
+            if values is not None:
+                cursor.updateRow([row[0]] + values)
+                count += 1
+    return count
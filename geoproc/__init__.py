@@ -0,0 +1,32 @@
+########################
+# Geoprocessing backends for the road prioritization tool, the Land Use Calculator and the species heatmaps.
+#
+# The scripts in this repository were written against arcpy, so they only ran on a machine with ArcGIS Pro. The
+# geoprocessing steps they use (Select, Clip, Dissolve, Buffer, GeneratePointsAlongLines, SplitLineAtPoint, Snap,
+# TabulateIntersection, ZonalStatisticsAsTable, Near, SpatialJoin, CreateFishnet, ...) are now methods of a backend
+# object, with two implementations:
+#
+#     1. ShapelyBackend - shapely/pyogrio/NumPy (rasterio for rasters), runs on Linux and in any number of processes
+#     2. ArcpyBackend - the original ArcGIS tools
+#
+# get_backend() returns the backend named by its argument or the GEOPROC_BACKEND environment variable, and
+# otherwise arcpy if it is installed and shapely if not.
+########################
+
+import importlib
+import importlib.util
+import os
+
+backends = {'arcpy': ('geoproc.arcpy_backend', 'ArcpyBackend'),
+            'shapely': ('geoproc.shapely_backend', 'ShapelyBackend')}
+
+
+def get_backend(name=None, **kwargs):
+    """Return a geoprocessing backend - 'arcpy' or 'shapely'."""
+    name = name or os.environ.get('GEOPROC_BACKEND')
+    if name is None:
+        name = 'arcpy' if importlib.util.find_spec('arcpy') is not None else 'shapely'
+    if name not in backends:
+        raise ValueError('Unknown geoprocessing backend: {0} (expected one of {1})'.format(name, ', '.join(backends)))
+    module, class_name = backends[name]
+    return getattr(importlib.import_module(module), class_name)(**kwargs)
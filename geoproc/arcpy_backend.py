@@ -0,0 +1,335 @@
+########################
+# Geoprocessing backend built on arcpy - the same operations as geoproc.shapely_backend, run with ArcGIS tools.
+#
+# Layers are dataset paths. Every operation writes its result to a uniquely named dataset in the memory workspace
+# (in_memory by default) instead of changing its input - Snap runs on a copy and Near is run as GenerateNearTable -
+# and tables come back as pandas dataframes, so scripts can switch between the two backends without other changes.
+# The one exception is join_field, which adds the fields to the layer in place like JoinField does.
+########################
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from geoproc.parquet import is_parquet, read_parquet, write_parquet
+
+
+class ArcpyBackend(object):
+    name = 'arcpy'
+
+    def __init__(self, workspace='in_memory', raster_cache=None):
+        """raster_cache is accepted for compatibility with ShapelyBackend - ArcGIS manages its own raster cache."""
+        import arcpy
+
+        self.arcpy = arcpy
+        self.workspace = workspace
+        arcpy.env.overwriteOutput = True
+        self.counter = 0
+
+    def _name(self, prefix):
+        """Return a new dataset name in the workspace."""
+        self.counter += 1
+        return '{0}/{1}_{2}'.format(self.workspace, prefix, self.counter)
+
+    def _frame(self, in_table):
+        """Return a table as a dataframe, without its object ID field."""
+        fields = [field.name for field in self.arcpy.ListFields(in_table) if field.type not in ('OID', 'Geometry')]
+        return pd.DataFrame(self.arcpy.da.TableToNumPyArray(in_table, fields, null_value=np.nan))
+
+    #### Input / output
+
+    def read(self, path, bbox=None):
+        """Return the dataset, optionally as a layer of only the features intersecting bbox (xmin, ymin, xmax,
+        ymax). GeoParquet files are read into the memory workspace."""
+        if is_parquet(path):
+            return self._from_parquet(path, bbox)
+        if bbox is None:
+            return path
+        arcpy = self.arcpy
+        xmin, ymin, xmax, ymax = bbox
+        corners = arcpy.Array([arcpy.Point(xmin, ymin), arcpy.Point(xmin, ymax), arcpy.Point(xmax, ymax),
+                               arcpy.Point(xmax, ymin)])
+        extent = arcpy.Polygon(corners, arcpy.Describe(path).spatialReference)
+        out_feature = self._name('read')
+        layer = out_feature.split('/')[-1] + '_layer'
+        arcpy.management.MakeFeatureLayer(path, layer)
+        arcpy.management.SelectLayerByLocation(layer, 'INTERSECT', extent)
+        arcpy.management.CopyFeatures(layer, out_feature)
+        return out_feature
+
+    def write(self, layer, path):
+        if is_parquet(path):
+            return self._to_parquet(layer, path)
+        self.arcpy.management.CopyFeatures(layer, path)
+        return path
+
+    def _from_parquet(self, path, bbox=None):
+        """Copy the features of a GeoParquet file (optionally only those intersecting bbox) into the memory
+        workspace."""
+        arcpy = self.arcpy
+        wkb, attributes, crs = read_parquet(path, bbox=bbox)
+        shapes = [arcpy.FromWKB(bytearray(geometry)) for geometry in wkb]
+        spatial_reference = arcpy.SpatialReference()
+        if crs:
+            spatial_reference.loadFromString(crs)
+        out_feature = self._name('parquet')
+        arcpy.management.CreateFeatureclass(self.workspace, out_feature.split('/')[-1],
+                                            shapes[0].type.upper() if shapes else 'POLYLINE',
+                                            spatial_reference=spatial_reference)
+        for field, dtype in attributes.dtypes.items():
+            field_type = 'DOUBLE' if dtype.kind == 'f' else 'LONG' if dtype.kind in 'iub' else 'TEXT'
+            arcpy.management.AddField(out_feature, field, field_type)
+        with arcpy.da.InsertCursor(out_feature, ['SHAPE@'] + list(attributes.columns)) as cursor:
+            for shape, row in zip(shapes, attributes.itertuples(index=False)):
+                cursor.insertRow([shape] + [None if pd.isna(value) else value for value in row])
+        return out_feature
+
+    def _to_parquet(self, layer, path):
+        """Write a dataset to a GeoParquet file."""
+        arcpy = self.arcpy
+        fields = [field.name for field in arcpy.ListFields(layer) if field.type not in ('OID', 'Geometry')]
+        rows = [row for row in arcpy.da.SearchCursor(layer, ['SHAPE@WKB', 'SHAPE@'] + fields)]
+        bounds = [(row[1].extent.XMin, row[1].extent.YMin, row[1].extent.XMax, row[1].extent.YMax) for row in rows]
+        # arcpy gives the WKB of lines and polygons as multi types
+        types = {'point': 'Point', 'multipoint': 'MultiPoint', 'polyline': 'MultiLineString', 'polygon': 'MultiPolygon'}
+        attributes = pd.DataFrame([row[2:] for row in rows], columns=fields)
+        return write_parquet(path, [bytes(row[0]) for row in rows], bounds, attributes,
+                             arcpy.Describe(layer).spatialReference.exportToString(),
+                             sorted(set(types[row[1].type] for row in rows)))
+
+    def cache_path(self, folder, name):
+        """Return the path of a feature class called name in a file geodatabase (cache.gdb) in folder."""
+        if not self.arcpy.Exists(os.path.join(folder, 'cache.gdb')):
+            self.arcpy.management.CreateFileGDB(folder, 'cache.gdb')
+        return os.path.join(folder, 'cache.gdb', name)
+
+    def exists(self, path):
+        return self.arcpy.Exists(path)
+
+    def delete(self, path):
+        if self.arcpy.Exists(path):
+            self.arcpy.management.Delete(path)
+
+    def copy(self, layer):
+        """Copy a dataset into the memory workspace, e.g. before editing it with join_field."""
+        out_feature = self._name('copy')
+        self.arcpy.management.CopyFeatures(layer, out_feature)
+        return out_feature
+
+    def table(self, layer, fields=None):
+        """Return the attributes of a layer as a dataframe indexed by object ID."""
+        arcpy = self.arcpy
+        OIDFieldName = arcpy.Describe(layer).OIDFieldName
+        if fields is not None:
+            final_fields = [OIDFieldName] + list(fields)
+        else:
+            final_fields = [field.name for field in arcpy.ListFields(layer) if field.type != 'Geometry']
+        data = [row for row in arcpy.da.SearchCursor(layer, final_fields)]
+        return pd.DataFrame(data, columns=final_fields).set_index(OIDFieldName, drop=True)
+
+    def count(self, layer):
+        return int(self.arcpy.management.GetCount(layer)[0])
+
+    def extent(self, layer):
+        extent = self.arcpy.Describe(layer).extent
+        return extent.XMin, extent.YMin, extent.XMax, extent.YMax
+
+    def id_field(self, layer):
+        return self.arcpy.Describe(layer).OIDFieldName
+
+    def clear(self):
+        """Delete the intermediate datasets in the memory workspace."""
+        self.arcpy.management.Delete(self.workspace)
+
+    #### Feature operations
+
+    def select(self, layer, field, values):
+        values = ["'" + value.replace("'", "''") + "'" if isinstance(value, str) else str(value) for value in values]
+        where_clause = '{0} IN ({1})'.format(self.arcpy.AddFieldDelimiters(layer, field), ', '.join(values))
+        out_feature = self._name('select')
+        self.arcpy.analysis.Select(layer, out_feature, where_clause)
+        return out_feature
+
+    def clip(self, layer, clip_layer):
+        out_feature = self._name('clip')
+        self.arcpy.analysis.Clip(layer, clip_layer, out_feature)
+        return out_feature
+
+    def dissolve(self, layer):
+        out_feature = self._name('dissolve')
+        self.arcpy.management.Dissolve(layer, out_feature)
+        return out_feature
+
+    def buffer(self, layer, distance, end_type='ROUND'):
+        out_feature = self._name('buffer')
+        self.arcpy.analysis.Buffer(layer, out_feature, str(distance), 'FULL', end_type, 'NONE')
+        return out_feature
+
+    def generate_points_along_lines(self, layer, distance, include_end_points=True):
+        out_feature = self._name('points')
+        self.arcpy.management.GeneratePointsAlongLines(
+            layer, out_feature, 'DISTANCE', str(distance),
+            Include_End_Points='END_POINTS' if include_end_points else 'NO_END_POINTS')
+        return out_feature
+
+    def split_line_at_point(self, layer, points, search_radius):
+        out_feature = self._name('split')
+        self.arcpy.management.SplitLineAtPoint(layer, points, out_feature, str(search_radius))
+        return out_feature
+
+    def segment_lines(self, layer, length):
+        # Dissolve, points every length along the lines and split the lines at them, then give every segment its
+        # SEG_ID from its end points and length (FROM_M and TO_M are only made by the shapely backend)
+        from geoproc.segment import segment_id
+
+        arcpy = self.arcpy
+        dissolved = self.dissolve(layer)
+        points = self.generate_points_along_lines(dissolved, length, include_end_points=True)
+        out_feature = self.split_line_at_point(dissolved, points, 1)
+        arcpy.management.AddField(out_feature, 'SEG_ID', 'TEXT', field_length=16)
+        with arcpy.da.UpdateCursor(out_feature, ['SHAPE@', 'SEG_ID']) as cursor:
+            for shape, seg_id in cursor:
+                cursor.updateRow([shape, segment_id(shape.firstPoint.X, shape.firstPoint.Y, shape.lastPoint.X,
+                                                    shape.lastPoint.Y, shape.length)])
+        return out_feature
+
+    def snap(self, layer, snap_layer, distance):
+        out_feature = self._name('snap')
+        self.arcpy.management.CopyFeatures(layer, out_feature)
+        self.arcpy.edit.Snap(out_feature, [[snap_layer, 'EDGE', str(distance)]])
+        return out_feature
+
+    #### Overlay and proximity tables
+
+    def tabulate_intersection(self, zones, zone_field, classes, class_field=None):
+        out_table = self._name('tabulate')
+        self.arcpy.analysis.TabulateIntersection(zones, zone_field, classes, out_table, class_field or None)
+        table = self._frame(out_table)
+        return table.rename(columns={table.columns[0]: zone_field})
+
+    def spatial_join(self, target, join, join_operation='JOIN_ONE_TO_ONE', match_option='INTERSECT'):
+        out_feature = self._name('spatial_join')
+        self.arcpy.analysis.SpatialJoin(target, join, out_feature, join_operation=join_operation,
+                                        join_type='KEEP_ALL', match_option=match_option)
+        return out_feature
+
+    def near(self, layer, near_layer):
+        out_table = self._name('near')
+        self.arcpy.analysis.GenerateNearTable(layer, near_layer, out_table, closest='CLOSEST')
+        return self._frame(out_table)[['IN_FID', 'NEAR_FID', 'NEAR_DIST']]
+
+    def facility_index(self, layers, types):
+        return dict(zip(types, layers))
+
+    def near_facilities(self, layer, index, k=1, types=None):
+        # GenerateNearTable against the layers of the wanted types at once, NEAR_FC mapped back to the type names
+        names = list(types or index)
+        near_layers = [index[name] for name in names]
+        out_table = self._name('near')
+        self.arcpy.analysis.GenerateNearTable(layer, near_layers, out_table, closest='CLOSEST' if k == 1 else 'ALL',
+                                              closest_count=k)
+        table = self._frame(out_table)
+        if 'NEAR_RANK' not in table:
+            table['NEAR_RANK'] = 1
+        if 'NEAR_FC' in table:
+            table['NEAR_TYPE'] = table['NEAR_FC'].map({str(index[name]): name for name in names})
+        else:
+            table['NEAR_TYPE'] = names[0]
+        return table[['IN_FID', 'NEAR_RANK', 'NEAR_FID', 'NEAR_TYPE', 'NEAR_DIST']]
+
+    def line_overlap_index(self, layer, tolerance=50, max_angle=20):
+        return layer, tolerance
+
+    def shared_length(self, layer, index):
+        # Snap a copy of the indexed lines to the features and Intersect them as lines, which gives the shared parts.
+        # The angle between the lines is not checked here
+        arcpy = self.arcpy
+        lines, tolerance = index
+        snapped = self.snap(lines, layer, tolerance)
+        shared = self._name('shared')
+        arcpy.analysis.Intersect([layer, snapped], shared, 'ONLY_FID', output_type='LINE')
+        in_field, line_field = ['FID_' + os.path.splitext(os.path.basename(str(dataset)))[0]
+                                for dataset in (layer, snapped)]
+        pairs = pd.DataFrame([row for row in arcpy.da.SearchCursor(shared, [in_field, line_field])],
+                             columns=['IN_FID', 'LINE_FID'])
+
+        # Dissolve per feature, so parts shared with several lines are only counted once
+        dissolved = self._name('dissolve')
+        arcpy.management.Dissolve(shared, dissolved, in_field)
+        lengths = {fid: length for fid, length in arcpy.da.SearchCursor(dissolved, [in_field, 'SHAPE@LENGTH'])}
+        table = pd.DataFrame({'IN_FID': [row[0] for row in arcpy.da.SearchCursor(layer, ['OID@'])]})
+        table['SHARED_LEN'] = table['IN_FID'].map(lengths).fillna(0.0)
+        counts = pairs.drop_duplicates().groupby('IN_FID').size()
+        table['OVERLAP_COUNT'] = table['IN_FID'].map(counts).fillna(0).astype(int)
+        return table
+
+    def join_field(self, layer, key_field, table, table_key, fields):
+        join_table = self._name('join')
+        records = table[[table_key] + list(fields)].to_records(index=False)
+        # Text fields must be fixed width unicode for NumPyArrayToTable
+        records = records.astype([(name, 'U254' if records.dtype[name] == object else records.dtype[name])
+                                  for name in records.dtype.names])
+        self.arcpy.da.NumPyArrayToTable(records, join_table)
+        self.arcpy.management.JoinField(layer, key_field, join_table, table_key, list(fields))
+        return layer
+
+    def merge(self, layers, source_field=None, sources=None):
+        arcpy = self.arcpy
+        out_feature = self._name('merge')
+        arcpy.management.Merge(layers, out_feature, add_source='ADD_SOURCE_INFO' if source_field else 'NO_SOURCE_INFO')
+        if source_field:
+            # MERGE_SRC holds the input dataset of each feature - replace it with the matching source name
+            names = dict(zip([str(layer) for layer in layers], sources))
+            arcpy.management.AddField(out_feature, source_field, 'TEXT')
+            with arcpy.da.UpdateCursor(out_feature, ['MERGE_SRC', source_field]) as cursor:
+                for row in cursor:
+                    cursor.updateRow([row[0], names.get(row[0], row[0])])
+            arcpy.management.DeleteField(out_feature, 'MERGE_SRC')
+        return out_feature
+
+    #### Creating features
+
+    def points_from_xy(self, x, y, crs=None):
+        array = np.rec.fromarrays([np.asarray(x, dtype=float), np.asarray(y, dtype=float)], names='X,Y')
+        out_feature = self._name('points')
+        self.arcpy.da.NumPyArrayToFeatureClass(array, out_feature, ('X', 'Y'),
+                                               self.arcpy.SpatialReference(crs) if crs is not None else None)
+        return out_feature
+
+    def create_fishnet(self, extent, cell_width, cell_height, crs=None):
+        arcpy = self.arcpy
+        xmin, ymin, xmax, ymax = extent
+        out_feature = self._name('fishnet')
+        arcpy.management.CreateFishnet(out_feature, '{0} {1}'.format(xmin, ymin), '{0} {1}'.format(xmin, ymin + 1),
+                                       cell_width, cell_height, '', '', '{0} {1}'.format(xmax, ymax), 'NO_LABELS',
+                                       '#', 'POLYGON')
+        if crs is not None:
+            arcpy.management.DefineProjection(out_feature, arcpy.SpatialReference(crs))
+        return out_feature
+
+    #### Rasters
+
+    def _set_null(self, raster, min_value):
+        if min_value is None:
+            return raster
+        return self.arcpy.sa.SetNull(raster, raster, 'VALUE < {0}'.format(min_value))
+
+    def raster_to_polygon(self, raster, min_value=None, bbox=None):
+        arcpy = self.arcpy
+        out_feature = self._name('raster_poly')
+        with arcpy.EnvManager(extent=' '.join(str(value) for value in bbox) if bbox else None):
+            arcpy.conversion.RasterToPolygon(self._set_null(raster, min_value), out_feature, 'NO_SIMPLIFY', 'VALUE')
+        return out_feature
+
+    def zonal_statistics_as_table(self, zones, zone_field, raster, statistic='MEAN', min_value=None):
+        out_table = self._name('zonal')
+        self.arcpy.sa.ZonalStatisticsAsTable(zones, zone_field, self._set_null(raster, min_value), out_table, 'DATA',
+                                             statistic)
+        return self._frame(out_table)[[zone_field, 'COUNT', 'AREA', statistic]]
+
+    def zonal_threshold(self, zones, zone_field, raster, min_value):
+        table = self.zonal_statistics_as_table(zones, zone_field, raster, 'MEAN', min_value)
+        zone_areas = {row[0]: row[1] for row in self.arcpy.da.SearchCursor(zones, [zone_field, 'SHAPE@AREA'])}
+        table['PERCENTAGE'] = table['AREA'] / table[zone_field].map(zone_areas) * 100
+        return table[[zone_field, 'COUNT', 'AREA', 'PERCENTAGE', 'MEAN']]
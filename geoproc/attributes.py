@@ -0,0 +1,40 @@
+########################
+# In-memory attribute assembly for the road metrics of road_prioritization_tool.
+#
+# Every metric used to be joined onto the roads as soon as it was computed - AddField, CalculateField and JoinField,
+# a full rewrite of the roads table per metric. AttributeAssembly collects the metric tables instead, matched to the
+# road segments with one vectorized index lookup per table, so the roads are joined to all the metrics once at the
+# end. frame() is the combined table as a dataframe, for scoring the roads without reading the output back.
+########################
+
+import numpy as np
+import pandas as pd
+
+
+class AttributeAssembly(object):
+    def __init__(self, keys):
+        """Collect fields for the features in keys, a dataframe with one row per feature and the key fields the
+        tables will be matched on (e.g. the feature ID and SEG_ID)."""
+        self.keys = keys.reset_index(drop=True)
+        self.columns = {}
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def add(self, table, table_key, fields, key=None, fill=np.nan):
+        """Add fields of a dataframe, matched on table[table_key] = keys[key] (default: the first key field).
+        Features with no match get fill."""
+        key = key or self.keys.columns[0]
+        table = table.drop_duplicates(table_key)
+        position = pd.Index(table[table_key]).get_indexer(self.keys[key])
+        found = position >= 0
+        for field in fields:
+            values = table[field].to_numpy()
+            column = np.full(len(self.keys), fill, dtype=np.result_type(values, fill))
+            column[found] = values[position[found]]
+            self.columns[field] = column
+
+    def frame(self):
+        """Return the key fields and every field added, one row per feature."""
+        return pd.concat([self.keys, pd.DataFrame(self.columns)], axis=1)
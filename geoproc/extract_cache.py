@@ -0,0 +1,97 @@
+########################
+# Cache of statewide layer extracts shared by every town of a road_prioritization_tool run.
+#
+# Every town used to Select the three land use classes out of the whole statewide LULC_RISPft.shp again, and read
+# Impervious_RISPft.shp and Buildings_RISPft.shp in full. ExtractCache makes each extract (a layer, or the features
+# of a layer with a field value in a list) once and stores it in a spatially indexed dataset - a GeoPackage for the
+# shapely backend, a file geodatabase feature class for arcpy - so a town only reads the features in its bounding box.
+#
+# A manifest (manifest.json in the cache folder) records the source fingerprint each extract was made from: the size
+# and modification time of the source files, or a SHA-1 of their content with check='hash'. An extract is rebuilt
+# when its source or its selection changes.
+########################
+
+import glob
+import hashlib
+import json
+import os
+
+
+def source_files(path):
+    """Return the files that make up a dataset - a shapefile and its sidecar files, or the file itself."""
+    if path.lower().endswith('.shp'):
+        return sorted(glob.glob(os.path.splitext(path)[0] + '.*'))
+    return [path]
+
+
+def fingerprint(path, check='mtime'):
+    """Return a fingerprint of a dataset's files: their sizes and modification times, or a SHA-1 of their content
+    with check='hash'."""
+    if check == 'hash':
+        digest = hashlib.sha1()
+        for file in source_files(path):
+            with open(file, 'rb') as data:
+                for block in iter(lambda: data.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+    return [[os.path.basename(file), os.path.getsize(file), os.stat(file).st_mtime_ns] for file in source_files(path)]
+
+
+class ExtractCache(object):
+    def __init__(self, folder, backend, extracts, check='mtime'):
+        """Cache of extracts in folder. extracts is a dictionary of name -> (source path, field, values); use None
+        for field and values to cache the whole layer."""
+        self.folder = folder
+        self.backend = backend
+        self.extracts = extracts
+        self.check = check
+        self.manifest_path = os.path.join(folder, 'manifest.json')
+        self.hashes = {}
+
+    def _manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as manifest:
+            return json.load(manifest)
+
+    def _fingerprint(self, source):
+        if self.check != 'hash':
+            return fingerprint(source)
+        # Only hash the content again when the sizes or modification times change
+        key = json.dumps(fingerprint(source))
+        if key not in self.hashes:
+            self.hashes[key] = fingerprint(source, 'hash')
+        return self.hashes[key]
+
+    def entry(self, name):
+        """Return what the extract called name is made from - its source, selection and source fingerprint."""
+        source, field, values = self.extracts[name]
+        return {'source': os.path.abspath(source), 'field': field, 'values': list(values) if values else None,
+                'fingerprint': self._fingerprint(source)}
+
+    def prepare(self, names=None):
+        """Make every extract (or the ones in names) that is missing or out of date, and return their paths. Run this
+        once before starting parallel towns, so the workers only read."""
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = self._manifest()
+        paths = {}
+        for name in names or self.extracts:
+            entry = self.entry(name)
+            path = self.backend.cache_path(self.folder, name)
+            if manifest.get(name) != entry or not self.backend.exists(path):
+                source, field, values = self.extracts[name]
+                layer = self.backend.read(source)
+                if field is not None:
+                    layer = self.backend.select(layer, field, values)
+                self.backend.delete(path)
+                self.backend.write(layer, path)
+                manifest[name] = entry
+                with open(self.manifest_path, 'w') as out:
+                    json.dump(manifest, out, indent=1)
+            paths[name] = path
+        return paths
+
+    def read(self, name, bbox=None):
+        """Return the features of an extract, optionally only those intersecting bbox (xmin, ymin, xmax, ymax)."""
+        path = self.prepare([name])[name]
+        return self.backend.read(path, bbox=bbox)
@@ -0,0 +1,71 @@
+########################
+# Nearest facility engine for the sweeper parking step of CC_08.
+#
+# Sweeper parking used to be one Near run per facility layer and per town (FireStations.shp, then ParkAndRides.shp),
+# each building its own index over the facilities. FacilityIndex puts the facilities of every type statewide in one
+# STRtree, built once, and answers the queries of all road segments of a town in a batch:
+#
+#     1. Every segment is searched within a radius, first the radius that holds about k facilities on average
+#     2. A segment with at least k facilities (of the wanted types) within the radius has its k nearest among them;
+#        the radius is doubled for the other segments only, until it covers every facility
+#
+# Distances are to the true geometry of each segment (not its midpoint or vertices), and a query can ask for the k
+# nearest of some facility types or of any type.
+########################
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+class FacilityIndex(object):
+    def __init__(self, points, ids, types):
+        """Index facility points with their IDs and types (e.g. 'FireStation'), one entry per point."""
+        self.points = np.asarray(points, dtype=object)
+        self.ids = np.asarray(ids)
+        self.types = np.asarray(types)
+        self.tree = shapely.STRtree(self.points)
+        self.bounds = shapely.total_bounds(self.points) if len(self.points) else np.zeros(4)
+        self.area = max((self.bounds[2] - self.bounds[0]) * (self.bounds[3] - self.bounds[1]), 1.0)
+
+    def nearest(self, geometries, k=1, types=None):
+        """Return the k nearest facilities (of types, or of any type) to each geometry, as a dataframe with
+        IN_INDEX (position of the geometry), NEAR_RANK (1 = nearest), NEAR_FID, NEAR_TYPE and NEAR_DIST."""
+        geometries = np.asarray(geometries, dtype=object)
+        wanted = np.ones(len(self.points), dtype=bool) if types is None else np.isin(self.types, list(types))
+        k = min(k, int(wanted.sum()))
+        columns = ['IN_INDEX', 'NEAR_RANK', 'NEAR_FID', 'NEAR_TYPE', 'NEAR_DIST']
+        if k == 0 or not len(geometries):
+            return pd.DataFrame({column: [] for column in columns})
+
+        # No geometry is further from any facility than the diagonal of their combined extent
+        bounds = shapely.total_bounds(geometries)
+        diagonal = np.hypot(max(bounds[2], self.bounds[2]) - min(bounds[0], self.bounds[0]),
+                            max(bounds[3], self.bounds[3]) - min(bounds[1], self.bounds[1]))
+        radius = np.sqrt(self.area * k / wanted.sum())
+        todo = np.arange(len(geometries))
+        in_parts, near_parts, dist_parts = [], [], []
+        while len(todo):
+            last = radius >= diagonal
+            in_index, near_index = self.tree.query(geometries[todo], predicate='dwithin', distance=radius)
+            keep = wanted[near_index]
+            in_index, near_index = todo[in_index[keep]], near_index[keep]
+            found = np.bincount(in_index, minlength=len(geometries))[todo]
+            done = np.isin(in_index, todo[found >= k]) if not last else np.ones(len(in_index), dtype=bool)
+            in_parts.append(in_index[done])
+            near_parts.append(near_index[done])
+            dist_parts.append(shapely.distance(geometries[in_index[done]], self.points[near_index[done]]))
+            todo = todo[found < k] if not last else todo[:0]
+            radius *= 2
+
+        # k nearest of each geometry, by distance then facility ID
+        in_index = np.concatenate(in_parts)
+        near_index = np.concatenate(near_parts)
+        distance = np.concatenate(dist_parts)
+        order = np.lexsort((self.ids[near_index], distance, in_index))
+        in_index, near_index, distance = in_index[order], near_index[order], distance[order]
+        rank = np.arange(len(in_index)) - np.searchsorted(in_index, in_index)
+        keep = rank < k
+        return pd.DataFrame({'IN_INDEX': in_index[keep], 'NEAR_RANK': rank[keep] + 1,
+                             'NEAR_FID': self.ids[near_index[keep]], 'NEAR_TYPE': self.types[near_index[keep]],
+                             'NEAR_DIST': distance[keep]})
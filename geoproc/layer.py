@@ -0,0 +1,92 @@
+########################
+# In-memory feature layers for the shapely geoprocessing backend.
+#
+# A Layer is an array of shapely geometries plus a pandas DataFrame of attributes with one row per geometry. Feature
+# IDs work like shapefile FIDs: the ID of a feature is its row position (0, 1, 2, ...), unless the attributes have a
+# field of that name. Layers are read from and written to any OGR format (shapefile, GeoPackage, ...) with pyogrio,
+# and to GeoParquet with geoproc.parquet.
+########################
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from geoproc.parquet import is_parquet, read_parquet, write_parquet
+
+# OGR geometry type names by shapely type ID
+geometry_types = {0: 'Point', 1: 'LineString', 3: 'Polygon', 4: 'MultiPoint', 5: 'MultiLineString', 6: 'MultiPolygon'}
+
+# Names that refer to the row position of a feature when the layer has no field of that name
+id_fields = ('FID', 'OID', 'OBJECTID')
+
+
+class Layer(object):
+    def __init__(self, geometry, attributes=None, crs=None):
+        """A set of features held in memory: shapely geometries, a DataFrame of attributes with one row per geometry
+        and the coordinate system (WKT or 'EPSG:xxxx')."""
+        self.geometry = np.asarray(geometry, dtype=object)
+        if attributes is None:
+            attributes = pd.DataFrame(index=np.arange(len(self.geometry)))
+        self.attributes = attributes.reset_index(drop=True)
+        self.crs = crs
+
+    def __len__(self):
+        return len(self.geometry)
+
+    def take(self, index):
+        """Return a new layer with the features at index (positions or a boolean mask)."""
+        index = np.flatnonzero(index) if np.asarray(index).dtype == bool else np.asarray(index, dtype=int)
+        return Layer(self.geometry[index], self.attributes.iloc[index], self.crs)
+
+    def values(self, field):
+        """Return the values of field as an array - the row positions for FID/OID/OBJECTID if it is not a field."""
+        if field not in self.attributes and field in id_fields:
+            return np.arange(len(self))
+        return self.attributes[field].to_numpy()
+
+    def bounds(self):
+        """Return (xmin, ymin, xmax, ymax) of all features."""
+        return tuple(shapely.total_bounds(self.geometry).tolist())
+
+
+def geometry_type(geometry):
+    """Return the OGR geometry type name for an array of geometries - the multi type if single and multi types are
+    mixed."""
+    type_ids = set(shapely.get_type_id(geometry[~shapely.is_missing(geometry)]).tolist())
+    if len(type_ids) == 1:
+        return geometry_types.get(type_ids.pop(), 'Unknown')
+    for single, multi in [(0, 4), (1, 5), (3, 6)]:
+        if type_ids and type_ids <= {single, multi}:
+            return geometry_types[multi]
+    return 'Unknown'
+
+
+def read_layer(path, bbox=None, where=None, columns=None):
+    """Read a vector dataset into a Layer, optionally only the features intersecting bbox (xmin, ymin, xmax, ymax)
+    and/or matching an SQL where clause. GeoParquet files take a dictionary of field -> values as where instead."""
+    if is_parquet(path):
+        wkb, attributes, crs = read_parquet(path, bbox=bbox, filters=where, columns=columns)
+        return Layer(shapely.from_wkb(wkb), attributes, crs)
+
+    from pyogrio.raw import read
+
+    meta, fids, geometry, field_data = read(path, bbox=bbox, where=where, columns=columns)
+    attributes = pd.DataFrame({field: values for field, values in zip(meta['fields'], field_data)})
+    return Layer(shapely.from_wkb(geometry), attributes, meta['crs'])
+
+
+def write_layer(layer, path):
+    """Write a Layer to path - the format is chosen from the file extension (e.g. .shp, .gpkg, .parquet)."""
+    if is_parquet(path):
+        types = sorted(set(geometry_types.get(type_id, 'Unknown') for type_id in
+                           shapely.get_type_id(layer.geometry[~shapely.is_missing(layer.geometry)]).tolist()))
+        return write_parquet(path, shapely.to_wkb(layer.geometry), shapely.bounds(layer.geometry), layer.attributes,
+                             layer.crs, types)
+
+    from pyogrio.raw import write
+
+    fields = [str(field) for field in layer.attributes.columns]
+    field_data = [layer.attributes[field].to_numpy() for field in layer.attributes.columns]
+    write(path, shapely.to_wkb(layer.geometry), field_data, fields, crs=layer.crs,
+          geometry_type=geometry_type(layer.geometry))
+    return path
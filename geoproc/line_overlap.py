@@ -0,0 +1,94 @@
+########################
+# Line overlap engine for the bike path step of CC_08.
+#
+# The bike path step used to Snap the bike paths to the roads (editing BikePaths_RISPft.shp in place with arcpy) and
+# count the bike paths sharing a line segment with each road in a ONE_TO_MANY SpatialJoin. LineOverlapIndex reads
+# the lines only, and measures how much of each road runs along them:
+#
+#     1. The indexed lines (bike paths) are broken into straight edges and put in one STRtree, built once statewide
+#     2. Every straight edge of the query lines (road segments) is matched to the indexed edges within tolerance that
+#        run in the same direction, within max_angle degrees - crossing paths are not counted
+#     3. Each match is clipped to the tolerance band around the road edge and projected onto it, and the projected
+#        intervals are merged per road edge, so a road with a bike path on both sides is not counted twice
+#
+# The result is the shared length of every road segment and the number of distinct lines it shares a length with.
+########################
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def line_edges(lines):
+    """Return the straight edges of an array of lines as (n x 2 x 2 coordinate array, index of the line)."""
+    parts, part_of = shapely.get_parts(lines, return_index=True)
+    coords, vertex_of = shapely.get_coordinates(parts, return_index=True)
+    same = vertex_of[1:] == vertex_of[:-1]
+    edges = np.stack([coords[:-1][same], coords[1:][same]], axis=1)
+    line_of = part_of[vertex_of[:-1][same]]
+    keep = np.any(edges[:, 0] != edges[:, 1], axis=1)
+    return edges[keep], line_of[keep]
+
+
+class LineOverlapIndex(object):
+    def __init__(self, lines, ids, tolerance=50, max_angle=20):
+        """Index lines (e.g. bike paths) identified by ids for measuring their overlap with other lines. Lines
+        overlap where they are within tolerance of each other and run within max_angle degrees of each other."""
+        self.ids = np.asarray(ids)
+        self.tolerance = tolerance
+        self.min_cosine = np.cos(np.radians(max_angle))
+        self.edges, self.line_of = line_edges(np.asarray(lines, dtype=object))
+        self.tree = shapely.STRtree(shapely.linestrings(self.edges))
+
+    def shared_length(self, lines):
+        """Return, for each of lines that overlaps the indexed lines, a dataframe row with IN_INDEX (position of the
+        line), SHARED_LEN (length of the line running along indexed lines) and OVERLAP_COUNT (number of distinct
+        indexed lines it runs along)."""
+        edges, edge_of = line_edges(np.asarray(lines, dtype=object))
+        columns = {'IN_INDEX': [], 'SHARED_LEN': [], 'OVERLAP_COUNT': []}
+        if not len(edges) or not len(self.edges):
+            return pd.DataFrame(columns)
+        edge_lines = shapely.linestrings(edges)
+        edge_index, match = self.tree.query(edge_lines, predicate='dwithin', distance=self.tolerance)
+
+        # Keep the matches running in the same direction (either way)
+        direction = edges[:, 1] - edges[:, 0]
+        direction /= np.hypot(*direction.T)[:, None]
+        other = self.edges[match, 1] - self.edges[match, 0]
+        cosine = np.abs(np.sum(direction[edge_index] * other, axis=1)) / np.hypot(*other.T)
+        edge_index, match = edge_index[cosine >= self.min_cosine], match[cosine >= self.min_cosine]
+
+        # Part of each matched edge within the tolerance band of the road edge, projected onto the road edge
+        bands = shapely.buffer(edge_lines, self.tolerance, cap_style='flat')
+        clipped = shapely.intersection(shapely.linestrings(self.edges[match]), bands[edge_index])
+        keep = ~shapely.is_empty(clipped) & (shapely.length(clipped) > 0)
+        edge_index, match, clipped = edge_index[keep], match[keep], clipped[keep]
+        if not len(clipped):
+            return pd.DataFrame(columns)
+        low = np.full(len(clipped), np.inf)
+        high = np.full(len(clipped), -np.inf)
+        points, point_of = shapely.get_coordinates(clipped, return_index=True)
+        station = np.sum((points - edges[edge_index[point_of], 0]) * direction[edge_index[point_of]], axis=1)
+        np.minimum.at(low, point_of, station)
+        np.maximum.at(high, point_of, station)
+        edge_length = np.hypot(*(edges[:, 1] - edges[:, 0]).T)
+        low = np.clip(low, 0, edge_length[edge_index])
+        high = np.clip(high, 0, edge_length[edge_index])
+
+        # Merge the intervals of each road edge - sorted by edge then start, with the edges spaced apart so one
+        # running maximum works for all of them
+        spacing = edge_length.max() + 1
+        start = edge_index * spacing + low
+        end = edge_index * spacing + high
+        order = np.lexsort((start, edge_index))
+        start, end = start[order], end[order]
+        covered = np.maximum.accumulate(end)
+        previous = np.r_[-np.inf, covered[:-1]]
+        length = np.maximum(end - np.maximum(start, previous), 0)
+
+        line_index = edge_of[edge_index[order]]
+        shared = np.bincount(line_index, weights=length, minlength=len(lines))
+        pairs = np.unique(line_index * len(self.ids) + self.line_of[match[order]])
+        count = np.bincount(pairs // len(self.ids), minlength=len(lines))
+        found = np.flatnonzero(shared > 0)
+        return pd.DataFrame({'IN_INDEX': found, 'SHARED_LEN': shared[found], 'OVERLAP_COUNT': count[found]})
@@ -0,0 +1,128 @@
+########################
+# Overlay engine for tabulating class polygons (land use, impervious, canopy, buildings) inside buffer zones.
+#
+# The road metrics are several TabulateIntersection runs of the same road buffer zones against large polygon layers.
+# ZoneOverlay indexes the zones once and reuses the index for every class layer:
+#
+#     1. Candidate pairs for all zones at once - a bulk query of the class polygons' bounding boxes against an
+#        STRtree (packed R-tree) of the zones, or against a uniform grid of the zones' bounding boxes
+#     2. Exact areas only where needed - a class polygon inside a zone counts its own (precomputed) area, a zone
+#        inside a class polygon counts the zone area, and only the pairs that partly overlap are intersected
+#     3. One grouped sum per (zone, class) for the AREA and PERCENTAGE table
+#
+# Class polygons are processed in chunks to bound memory, so the run time follows the number of zone/class pairs
+# that actually overlap rather than the size of the class layer.
+########################
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def grid_pairs(tree_bounds, query_bounds, cell_size):
+    """Return (query index, tree index) of every pair of bounding boxes (n x 4 arrays of xmin, ymin, xmax, ymax)
+    that intersect, using a uniform grid of cell_size."""
+    origin = np.minimum(tree_bounds[:, :2].min(axis=0), query_bounds[:, :2].min(axis=0))
+    width = int(np.ceil((max(tree_bounds[:, 2].max(), query_bounds[:, 2].max()) - origin[0]) / cell_size)) + 1
+
+    def cells(bounds):
+        """Return the grid cell key and the box index of every cell each box overlaps."""
+        col0, row0 = np.floor((bounds[:, :2] - origin) / cell_size).astype(np.int64).T
+        col1, row1 = np.floor((bounds[:, 2:] - origin) / cell_size).astype(np.int64).T
+        columns = col1 - col0 + 1
+        counts = columns * (row1 - row0 + 1)
+        box = np.repeat(np.arange(len(bounds)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return (row0[box] + offset // columns[box]) * width + col0[box] + offset % columns[box], box
+
+    tree_keys, tree_boxes = cells(tree_bounds)
+    order = np.argsort(tree_keys, kind='stable')
+    tree_keys, tree_boxes = tree_keys[order], tree_boxes[order]
+    query_keys, query_boxes = cells(query_bounds)
+    starts = np.searchsorted(tree_keys, query_keys, 'left')
+    counts = np.searchsorted(tree_keys, query_keys, 'right') - starts
+
+    query_index = np.repeat(query_boxes, counts)
+    tree_index = tree_boxes[np.repeat(starts, counts) + np.arange(counts.sum()) -
+                            np.repeat(np.cumsum(counts) - counts, counts)]
+
+    # Boxes sharing several cells are found once per cell - keep each pair once, if the boxes really intersect
+    pairs = np.unique(query_index * len(tree_bounds) + tree_index)
+    query_index, tree_index = pairs // len(tree_bounds), pairs % len(tree_bounds)
+    hit = ((query_bounds[query_index, 0] <= tree_bounds[tree_index, 2]) &
+           (query_bounds[query_index, 2] >= tree_bounds[tree_index, 0]) &
+           (query_bounds[query_index, 1] <= tree_bounds[tree_index, 3]) &
+           (query_bounds[query_index, 3] >= tree_bounds[tree_index, 1]))
+    return query_index[hit], tree_index[hit]
+
+
+class ZoneOverlay(object):
+    def __init__(self, zones, zone_ids, zone_field='ORIG_FID', index='strtree', cell_size=None, chunk_size=50000):
+        """Index an array of zone polygons (e.g. road buffer zones) identified by zone_ids for tabulating class
+        layers. index is 'strtree' or 'grid' (uniform grid, cell_size defaults to the median zone width)."""
+        self.zones = np.asarray(zones, dtype=object)
+        self.zone_ids = np.asarray(zone_ids)
+        self.zone_field = zone_field
+        self.zone_areas = shapely.area(self.zones)
+        self.index = index
+        self.chunk_size = chunk_size
+        shapely.prepare(self.zones)
+        if index == 'grid':
+            self.zone_bounds = shapely.bounds(self.zones)
+            widths = self.zone_bounds[:, 2:] - self.zone_bounds[:, :2]
+            self.cell_size = cell_size or float(np.median(widths.max(axis=1))) or 1.0
+        else:
+            self.tree = shapely.STRtree(self.zones)
+
+    def candidates(self, classes):
+        """Return (class index, zone index) of every class polygon and zone whose bounding boxes intersect."""
+        if self.index == 'grid':
+            return grid_pairs(self.zone_bounds, shapely.bounds(classes), self.cell_size)
+        return self.tree.query(classes)
+
+    def overlap_areas(self, classes):
+        """Return (class index, zone index, area of overlap) for every class polygon and zone that overlap."""
+        class_index, zone_index = self.candidates(classes)
+        zones = self.zones[zone_index]
+        parts = classes[class_index]
+        areas = np.zeros(len(class_index))
+
+        # Class polygon entirely inside the zone, or zone entirely inside the class polygon
+        inside = shapely.contains(zones, parts)
+        areas[inside] = shapely.area(parts[inside])
+        covered = ~inside & shapely.within(zones, parts)
+        areas[covered] = self.zone_areas[zone_index[covered]]
+
+        # Partial overlaps
+        partial = ~inside & ~covered & shapely.intersects(zones, parts)
+        areas[partial] = shapely.area(shapely.intersection(zones[partial], parts[partial]))
+        keep = areas > 0
+        return class_index[keep], zone_index[keep], areas[keep]
+
+    def tabulate(self, classes, class_values=None, class_field=None):
+        """Area of the class polygons inside each zone and its percentage of the zone area, the same table as
+        TabulateIntersection: zone_field, class_field (if class_values are given), AREA and PERCENTAGE. Zones with
+        no overlap are left out."""
+        classes = np.asarray(classes, dtype=object)
+        zone_parts = []
+        class_parts = []
+        area_parts = []
+        for start in range(0, len(classes), self.chunk_size):
+            class_index, zone_index, areas = self.overlap_areas(classes[start:start + self.chunk_size])
+            zone_parts.append(zone_index)
+            class_parts.append(class_index + start)
+            area_parts.append(areas)
+        zone_index = np.concatenate(zone_parts) if zone_parts else np.zeros(0, dtype=int)
+        class_index = np.concatenate(class_parts) if class_parts else np.zeros(0, dtype=int)
+
+        table = pd.DataFrame({self.zone_field: self.zone_ids[zone_index],
+                              'AREA': np.concatenate(area_parts) if area_parts else np.zeros(0),
+                              'ZONE_AREA': self.zone_areas[zone_index]})
+        keys = [self.zone_field]
+        if class_values is not None:
+            table.insert(1, class_field, np.asarray(class_values)[class_index])
+            keys.append(class_field)
+        table = table.groupby(keys, as_index=False, sort=True).agg(AREA=('AREA', 'sum'),
+                                                                   ZONE_AREA=('ZONE_AREA', 'first'))
+        table['PERCENTAGE'] = table['AREA'] / table.pop('ZONE_AREA') * 100
+        return table
@@ -0,0 +1,160 @@
+########################
+# GeoParquet output for the road metrics layers (Final_Roads).
+#
+# The road metrics used to be written as one shapefile per town: field names cut to 10 characters (AVG_CANOPY_HEIGHT
+# became AVG_CANOPY), slow to read back, and a statewide table meant merging 39 files. GeoParquet is a columnar
+# Parquet file with the geometry stored as WKB and described in the file's 'geo' metadata:
+#
+#     1. One row group per town (or per value of group_field), so reading some towns only reads their row groups
+#     2. A bbox column (xmin, ymin, xmax, ymax per feature) whose row group statistics let a bbox read skip the row
+#        groups outside it - filters and bboxes are pushed down to the Parquet reader
+#     3. Only the columns asked for are read, so scoring tools can read the metrics without the geometry
+#
+# Needs pyarrow (and pyproj to record the coordinate system as PROJJSON, as the GeoParquet specification asks).
+########################
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+geo_version = '1.1.0'
+
+
+def is_parquet(path):
+    """Return True if path is a (Geo)Parquet file, by its extension."""
+    return str(path).lower().endswith(('.parquet', '.geoparquet'))
+
+
+def projjson(crs):
+    """Return a coordinate system (WKT or 'EPSG:xxxx') as PROJJSON, or None if pyproj is missing or crs is None."""
+    try:
+        import pyproj
+    except ImportError:
+        return None
+    return pyproj.CRS.from_user_input(crs).to_json_dict() if crs else None
+
+
+def write_parquet(path, wkb, bounds, attributes, crs=None, geometry_types=(), group_field='TOWN',
+                  row_group_size=100000):
+    """Write features - WKB geometries, their bounds (n x 4 array) and a dataframe of attributes - to a GeoParquet
+    file, with one row group per value of group_field if the attributes have it. Returns path."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    wkb = np.asarray(wkb, dtype=object)
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    attributes = attributes.reset_index(drop=True)
+    grouped = group_field in attributes
+    if grouped:
+        order = np.argsort(attributes[group_field].to_numpy(), kind='stable')
+        attributes, wkb, bounds = attributes.iloc[order].reset_index(drop=True), wkb[order], bounds[order]
+
+    table = pa.Table.from_pandas(attributes, preserve_index=False)
+    table = table.append_column('geometry', pa.array(list(wkb), pa.binary()))
+    table = table.append_column('bbox', pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i]) for i in range(4)], names=['xmin', 'ymin', 'xmax', 'ymax']))
+    valid = ~np.isnan(bounds).any(axis=1)
+    extent = [float(bounds[valid, 0].min()), float(bounds[valid, 1].min()), float(bounds[valid, 2].max()),
+              float(bounds[valid, 3].max())] if valid.any() else []
+    geo = {'version': geo_version, 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': list(geometry_types), 'crs': projjson(crs),
+                                    'bbox': extent,
+                                    'covering': {'bbox': {name: ['bbox', name] for name in
+                                                          ['xmin', 'ymin', 'xmax', 'ymax']}}}}}
+    # The coordinate system is also kept as it was given, so it reads back the same even without pyproj. The pandas
+    # metadata is left out - update_parquet changes the columns
+    table = table.replace_schema_metadata({b'geo': json.dumps(geo).encode(), b'geoproc_crs': (crs or '').encode()})
+
+    with pq.ParquetWriter(path, table.schema, compression='zstd') as writer:
+        if grouped:
+            values = attributes[group_field].to_numpy()
+            starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else []
+            for start, end in zip(starts, list(starts[1:]) + [len(values)]):
+                writer.write_table(table.slice(start, end - start), row_group_size=end - start)
+        else:
+            writer.write_table(table, row_group_size=row_group_size)
+    return path
+
+
+def parquet_fields(path):
+    """Return the attribute field names of a GeoParquet file, without reading any rows."""
+    import pyarrow.parquet as pq
+
+    return [name for name in pq.read_schema(path).names if name not in ('geometry', 'bbox')]
+
+
+def read_parquet(path, bbox=None, filters=None, columns=None, geometry=True):
+    """Read a GeoParquet file. Returns (WKB geometries or None, dataframe of attributes, coordinate system).
+
+    Only the rows intersecting bbox (xmin, ymin, xmax, ymax) and matching filters (a dictionary of field -> list of
+    values, e.g. {'TOWN': ['NEWPORT']}) and only the attribute columns asked for are read - the row groups and
+    columns that are not needed are skipped."""
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(path)
+    columns = parquet_fields(path) if columns is None else list(columns)
+
+    expression = None
+    for field, values in (filters or {}).items():
+        condition = ds.field(field).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    if bbox is not None and 'bbox' in schema.names:
+        xmin, ymin, xmax, ymax = bbox
+        condition = ((ds.field('bbox', 'xmin') <= xmax) & (ds.field('bbox', 'xmax') >= xmin) &
+                     (ds.field('bbox', 'ymin') <= ymax) & (ds.field('bbox', 'ymax') >= ymin))
+        expression = condition if expression is None else expression & condition
+
+    table = ds.dataset(path, format='parquet').to_table(columns=columns + (['geometry'] if geometry else []),
+                                                        filter=expression)
+    wkb = np.asarray(table.column('geometry').to_pylist(), dtype=object) if geometry else None
+    attributes = table.select(columns).to_pandas()
+    crs = (schema.metadata or {}).get(b'geoproc_crs', b'').decode() or None
+    return wkb, attributes, crs
+
+
+def update_parquet(path, id_field, ids, columns):
+    """Add or replace columns of a GeoParquet file, matching each value to its row through id_field (rows whose ID
+    is not in ids keep their values, or get nulls in a new column). The row groups and metadata are kept. Returns
+    the number of rows matched."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    position = pd.Index(ids).get_indexer(parquet.read(columns=[id_field]).column(id_field).to_pandas())
+    found = position >= 0
+    groups = [parquet.read_row_group(i) for i in range(parquet.num_row_groups)]
+    schema = parquet.schema_arrow
+    parquet.close()
+    if not groups:
+        return 0
+
+    start = 0
+    tables = []
+    for table in groups:
+        rows = position[start:start + table.num_rows]
+        for field, values in columns.items():
+            values = np.asarray(values)
+            if values.dtype.kind in 'OUS':
+                column = pa.array(np.where(rows >= 0, values.astype(object)[np.maximum(rows, 0)], None), pa.string())
+            else:
+                column = pa.array(np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan).astype(float), pa.float64())
+            if field in table.column_names:
+                column = pc.if_else(pa.array(rows >= 0), column, table.column(field).cast(column.type))
+                table = table.set_column(table.column_names.index(field), field, column)
+            else:
+                table = table.add_column(table.column_names.index('geometry'), field, column)
+        tables.append(table)
+        start += table.num_rows
+
+    # Written next to the file and swapped in, so a failed write leaves the file as it was
+    metadata = schema.metadata
+    temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with pq.ParquetWriter(temp_path, tables[0].schema.with_metadata(metadata), compression='zstd') as writer:
+        for table in tables:
+            writer.write_table(table.replace_schema_metadata(metadata), row_group_size=max(table.num_rows, 1))
+    os.replace(temp_path, path)
+    return int(found.sum())
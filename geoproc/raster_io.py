@@ -0,0 +1,152 @@
+########################
+# Windowed raster input/output with bounded memory, for the canopy metrics and the CC_10 NDVI script.
+#
+# Rasters used to be loaded whole (through arcpy) for every town. RasterReader only reads the part of a raster a
+# town needs, in strips of rows lined up with the GeoTIFF's internal blocks, so memory stays at one strip no matter
+# how big the raster is. With a cache folder, the band is first copied once into an uncompressed memory-mapped .npy
+# file (rebuilt when the raster changes), and windows are then sliced straight out of the memory map without
+# decompressing anything - useful when many towns read the same statewide raster.
+#
+# map_blocks streams one or more aligned rasters through a function strip by strip, reading them with RasterReader (so
+# they can share its cache), and writes the result, e.g. NDVI from the red and near-infrared bands of a Landsat scene.
+# The strips are whole rows of the output's tiles, so every tile is compressed once, whatever the inputs' layout.
+########################
+
+import json
+import os
+
+import numpy as np
+
+from geoproc.extract_cache import fingerprint
+
+
+class RasterReader(object):
+    def __init__(self, path, band=1, cache_folder=None):
+        """Read windows of one band of a raster, optionally through a memory-mapped copy in cache_folder."""
+        import rasterio
+
+        self.path = path
+        self.band = band
+        self.src = rasterio.open(path)
+        self.transform = self.src.transform
+        self.nodata = self.src.nodata
+        self.height, self.width = self.src.height, self.src.width
+        self.block_height = self.src.block_shapes[band - 1][0]
+        self.cache = None
+        if cache_folder:
+            self.cache = self._memmap(cache_folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.cache = None
+        self.src.close()
+
+    def _memmap(self, cache_folder):
+        """Return the band as a read-only memory map, copying it into cache_folder first if it is missing or the
+        raster has changed since it was copied."""
+        os.makedirs(cache_folder, exist_ok=True)
+        name = '{0}_b{1}'.format(os.path.splitext(os.path.basename(self.path))[0], self.band)
+        array_path = os.path.join(cache_folder, name + '.npy')
+        info_path = os.path.join(cache_folder, name + '.json')
+        source = fingerprint(self.path)
+        if os.path.exists(array_path) and os.path.exists(info_path):
+            with open(info_path) as info:
+                if json.load(info) == source:
+                    return np.load(array_path, mmap_mode='r')
+
+        # Copy the band strip by strip into a temporary file, then move it into place - other processes never see a
+        # half written cache
+        temp_path = '{0}.{1}.tmp.npy'.format(os.path.join(cache_folder, name), os.getpid())
+        array = np.lib.format.open_memmap(temp_path, mode='w+', dtype=self.src.dtypes[self.band - 1],
+                                          shape=(self.height, self.width))
+        for window, data in self.strips(masked=False):
+            array[window.row_off:window.row_off + window.height, window.col_off:window.col_off + window.width] = data
+        array.flush()
+        del array
+        os.replace(temp_path, array_path)
+        with open(info_path, 'w') as info:
+            json.dump(source, info)
+        return np.load(array_path, mmap_mode='r')
+
+    def window(self, bounds=None):
+        """Return the window of whole cells covering bounds (xmin, ymin, xmax, ymax), clipped to the raster, or None
+        if bounds are outside the raster. Without bounds, the whole raster."""
+        from rasterio.windows import Window
+
+        if bounds is None:
+            return Window(0, 0, self.width, self.height)
+        xmin, ymin, xmax, ymax = bounds
+        col0 = max(int(np.floor((xmin - self.transform.c) / self.transform.a)), 0)
+        col1 = min(int(np.ceil((xmax - self.transform.c) / self.transform.a)), self.width)
+        row0 = max(int(np.floor((ymax - self.transform.f) / self.transform.e)), 0)
+        row1 = min(int(np.ceil((ymin - self.transform.f) / self.transform.e)), self.height)
+        if col1 <= col0 or row1 <= row0:
+            return None
+        return Window(col0, row0, col1 - col0, row1 - row0)
+
+    def read(self, window, masked=True):
+        """Return the cells of a window, as a masked array (NoData masked) unless masked is False."""
+        if self.cache is not None:
+            data = self.cache[window.row_off:window.row_off + window.height,
+                              window.col_off:window.col_off + window.width]
+            if not masked:
+                return data
+            invalid = np.isnan(data) if self.nodata is not None and np.isnan(self.nodata) else data == self.nodata
+            return np.ma.masked_array(data, mask=invalid if self.nodata is not None else False)
+        return self.src.read(self.band, window=window, masked=masked)
+
+    def strips(self, bounds=None, max_pixels=1 << 22, masked=True):
+        """Yield (window, cells) for strips of rows covering bounds (default: the whole raster). Strips are a whole
+        number of the raster's internal blocks high and at most max_pixels cells, so only one strip is in memory."""
+        from rasterio.windows import Window
+
+        window = self.window(bounds)
+        if window is None:
+            return
+        rows = max(max_pixels // max(window.width, 1) // self.block_height, 1) * self.block_height
+        # Start on a block boundary so every read lines up with the GeoTIFF blocks
+        start = window.row_off - window.row_off % self.block_height
+        end = window.row_off + window.height
+        for row in range(start, end, rows):
+            row0 = max(row, window.row_off)
+            row1 = min(row + rows, end)
+            strip = Window(window.col_off, row0, window.width, row1 - row0)
+            yield strip, self.read(strip, masked)
+
+
+def map_blocks(function, in_rasters, out_raster, dtype='float32', nodata=-9999, cache_folder=None,
+               max_pixels=1 << 22):
+    """Apply function to aligned strips of in_rasters (same grid) and write the result to out_raster as a tiled
+    GeoTIFF. function gets one masked array per input raster and returns a masked array; masked cells are written as
+    nodata. Inputs are read through RasterReader (memory-mapped copies in cache_folder, if given), in strips of at
+    most about max_pixels cells."""
+    import rasterio
+    from rasterio.windows import Window
+
+    readers = [RasterReader(path, cache_folder=cache_folder) for path in in_rasters]
+    try:
+        first = readers[0]
+        profile = first.src.profile.copy()
+        profile.update(driver='GTiff', count=1, dtype=dtype, nodata=nodata, tiled=True, blockxsize=256,
+                       blockysize=256, compress='deflate')
+        with rasterio.open(out_raster, 'w', **profile) as out:
+            # Strips a whole number of output tile rows high (and of input block rows, where that fits), so every
+            # output tile is written complete in one go
+            tile_height = out.block_shapes[0][0]
+            step = int(np.lcm(tile_height, first.block_height))
+            if step * first.width > max_pixels:
+                step = tile_height
+            rows = max(max_pixels // max(first.width, 1) // step, 1) * step
+            for row in range(0, first.height, rows):
+                window = Window(0, row, first.width, min(rows, first.height - row))
+                result = function(*[reader.read(window) for reader in readers])
+                out.write(np.ma.filled(np.ma.asarray(result).astype(dtype), nodata), 1, window=window)
+    finally:
+        for reader in readers:
+            reader.close()
+    return out_raster
@@ -0,0 +1,53 @@
+########################
+# Statewide runner for per-town pipelines such as road_prioritization_tool.
+#
+# Towns used to be run one after another in a single process, sharing arcpy.env.extent, one temporary_files folder
+# and the in_memory workspace, which is why only one town could be run at a time. Each town now gets its own
+# temporary folder and the towns run on a process pool: every worker process has its own backend and memory
+# workspace, so towns share nothing but the read-only input data and throughput grows with the number of workers.
+# merge_outputs then combines the per-town outputs into one statewide layer.
+########################
+
+import os
+import time
+import traceback
+from multiprocessing import Pool
+
+
+def run_town(args):
+    """Run tool for one town, returning (town, output, error message or None, run time in seconds)."""
+    tool, town = args
+    start_time = time.time()
+    try:
+        return town, tool(town), None, time.time() - start_time
+    except Exception:
+        return town, None, traceback.format_exc(), time.time() - start_time
+
+
+def run_towns(tool, towns, processes=None):
+    """Run tool(town) for every town on a pool of processes (default: one per CPU) and return a dictionary of
+    town -> output of the tool, in the order of towns. Towns that fail are reported and left out."""
+    processes = min(processes or os.cpu_count() or 1, len(towns))
+    jobs = [(tool, town) for town in towns]
+    if processes > 1:
+        with Pool(processes) as pool:
+            results = list(pool.imap_unordered(run_town, jobs, chunksize=1))
+    else:
+        results = [run_town(job) for job in jobs]
+
+    outputs = {}
+    for town, output, error, seconds in results:
+        if error is None:
+            outputs[town] = output
+            print('{0} finished in {1:.1f} seconds'.format(town, seconds))
+        else:
+            print('{0} failed:\n{1}'.format(town, error))
+    return {town: outputs[town] for town in towns if town in outputs}
+
+
+def merge_outputs(backend, outputs, out_path, town_field='TOWN'):
+    """Merge the per-town output datasets (dictionary of town -> path) into one layer with a town_field holding
+    the town of each feature, write it to out_path and return out_path."""
+    towns = list(outputs)
+    layers = [backend.read(outputs[town]) for town in towns]
+    return backend.write(backend.merge(layers, town_field, towns), out_path)
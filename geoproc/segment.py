@@ -0,0 +1,152 @@
+########################
+# Linear referencing road segmenter for road_prioritization_tool.
+#
+# Road segments used to be made with three geoprocessing passes: Dissolve, GeneratePointsAlongLines every 0.1 miles
+# and SplitLineAtPoint with a 50 ft search radius, which snapped cuts to whichever point was found first and numbered
+# the segments in FID order. segment_lines works on the coordinate arrays directly:
+#
+#     1. Connected road parts are merged into routes (line_merge of the union), and each route is oriented to start
+#        at its lowest (x, y) end, so cuts do not depend on the direction the roads were digitized in. Closed routes
+#        (loops) have no ends - they are rotated to start at their lowest (x, y) vertex and run towards the lower of
+#        its two neighbours
+#     2. The cumulative length along each route is computed with NumPy, and every route is cut at exact multiples of
+#        the segment length in one pass - the last segment of a route holds the remainder
+#     3. Each segment gets SEG_ID, a hash of its rounded end points and length, so it keeps its ID when other roads
+#        or the order of the input change, plus FROM_M and TO_M, its start and end measure along the route
+########################
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+def segment_id(x0, y0, x1, y1, length):
+    """Return the ID of a segment from its end points and length, rounded to whole units - the same whichever end
+    it starts at."""
+    ends = sorted([(int(round(x0)), int(round(y0))), (int(round(x1)), int(round(y1)))])
+    key = '{0},{1},{2},{3},{4}'.format(ends[0][0], ends[0][1], ends[1][0], ends[1][1], int(round(length)))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def normalize_ring(coords):
+    """Return the coordinates of a closed route starting (and ending) at its lowest (x, y) vertex, running towards
+    the lower of that vertex's two neighbours."""
+    ring = coords[:-1]
+    first = np.lexsort((ring[:, 1], ring[:, 0]))[0]
+    ring = np.roll(ring, -first, axis=0)
+    if tuple(ring[-1]) < tuple(ring[1]):
+        ring = np.r_[ring[:1], ring[:0:-1]]
+    return np.r_[ring, ring[:1]]
+
+
+def merge_routes(lines):
+    """Return the routes of an array of lines - connected parts merged, each starting at its lowest (x, y) end, or
+    at its lowest (x, y) vertex if it is closed."""
+    lines = np.asarray(lines, dtype=object)
+    if not len(lines):
+        return np.zeros(0, dtype=object)
+    merged = shapely.line_merge(shapely.union_all(lines))
+    routes = shapely.get_parts(merged)
+    routes = routes[shapely.get_type_id(routes) == 1]
+    starts = shapely.get_coordinates(shapely.get_point(routes, 0))
+    ends = shapely.get_coordinates(shapely.get_point(routes, -1))
+    backwards = (ends[:, 0] < starts[:, 0]) | ((ends[:, 0] == starts[:, 0]) & (ends[:, 1] < starts[:, 1]))
+    routes[backwards] = shapely.reverse(routes[backwards])
+
+    # Closed routes start wherever the merge left them - start them at a vertex that does not depend on the input
+    for i in np.flatnonzero(shapely.is_closed(routes) & (shapely.get_num_coordinates(routes) > 3)):
+        routes[i] = shapely.linestrings(normalize_ring(shapely.get_coordinates(routes[i])))
+    return routes
+
+
+def segment_lines(lines, length, tolerance=1e-6):
+    """Merge an array of lines into routes and cut every route into segments of length (the last one of a route is
+    shorter). Returns the segments, in order of route start point and measure, and a dataframe of their SEG_ID,
+    FROM_M and TO_M."""
+    routes = merge_routes(lines)
+    if not len(routes):
+        return np.zeros(0, dtype=object), pd.DataFrame({'SEG_ID': [], 'FROM_M': [], 'TO_M': []})
+    coords, route_of = shapely.get_coordinates(routes, return_index=True)
+    route_lengths = shapely.length(routes)
+    counts = np.ceil(route_lengths / length - tolerance).astype(np.int64)
+    counts[route_lengths <= tolerance] = 0
+
+    # Measure of every vertex along its route
+    step = np.zeros(len(coords))
+    step[1:] = np.hypot(*(coords[1:] - coords[:-1]).T)
+    step[np.r_[True, route_of[1:] != route_of[:-1]]] = 0
+    measure = np.cumsum(step)
+    route_start = np.searchsorted(route_of, np.arange(len(routes)))
+    measure -= measure[route_start][route_of]
+    # Global measure, increasing along all routes one after another, to find the cut vertices with one search
+    offsets = np.cumsum(route_lengths) - route_lengths
+    position = offsets[route_of] + measure
+
+    # Cut points at every multiple of length inside each route
+    cuts = counts - 1
+    cut_route = np.repeat(np.arange(len(routes)), np.maximum(cuts, 0))
+    cut_number = np.arange(len(cut_route)) - np.repeat(np.cumsum(np.maximum(cuts, 0)) - np.maximum(cuts, 0),
+                                                     np.maximum(cuts, 0)) + 1
+    cut_measure = cut_number * float(length)
+    cut_position = offsets[cut_route] + cut_measure
+    vertex = np.clip(np.searchsorted(position, cut_position, 'right') - 1, 0, max(len(coords) - 2, 0))
+    ratio = ((cut_position - position[vertex]) / np.maximum(position[vertex + 1] - position[vertex], tolerance))
+    cut_xy = coords[vertex] + (coords[vertex + 1] - coords[vertex]) * ratio[:, None]
+
+    # Segment of every vertex - vertices on a cut are replaced by the cut point
+    first_segment = np.cumsum(counts) - counts
+    number = np.minimum(np.floor(measure / length + tolerance).astype(np.int64), counts[route_of] - 1)
+    on_cut = (np.abs(measure - np.round(measure / length) * length) <= tolerance) & \
+             (measure > tolerance) & (measure < route_lengths[route_of] - tolerance)
+    keep = (counts[route_of] > 0) & ~on_cut
+    vertex_segment = first_segment[route_of] + number
+
+    # Every cut point ends one segment and starts the next one
+    cut_segment = first_segment[cut_route] + cut_number
+    segment = np.concatenate([vertex_segment[keep], cut_segment - 1, cut_segment])
+    point_measure = np.concatenate([measure[keep], cut_measure, cut_measure])
+    xy = np.concatenate([coords[keep], cut_xy, cut_xy])
+    order = np.lexsort((point_measure, segment))
+    segments = shapely.linestrings(xy[order], indices=segment[order])
+
+    segment_route = np.repeat(np.arange(len(routes)), counts)
+    from_m = (np.arange(len(segments)) - np.repeat(first_segment, counts)) * float(length)
+    to_m = np.minimum(from_m + length, route_lengths[segment_route])
+    start = shapely.get_coordinates(shapely.get_point(segments, 0))
+    end = shapely.get_coordinates(shapely.get_point(segments, -1))
+    seg_ids = [segment_id(x0, y0, x1, y1, to - fr) for (x0, y0), (x1, y1), fr, to in zip(start, end, from_m, to_m)]
+
+    # Routes in order of start point, so the row order does not depend on the input either
+    route_xy = shapely.get_coordinates(shapely.get_point(routes, 0))[segment_route]
+    order = np.lexsort((from_m, route_xy[:, 1], route_xy[:, 0]))
+    table = pd.DataFrame({'SEG_ID': seg_ids, 'FROM_M': from_m, 'TO_M': to_m})
+    return segments[order], table.iloc[order].reset_index(drop=True)
+
+
+def order_check(lines, length, seed=0):
+    """Segment lines as given and again shuffled with a random half of them reversed. Returns the SEG_IDs found by
+    only one of the two runs - empty if the IDs do not depend on the order or direction of the input."""
+    lines = np.asarray(lines, dtype=object)
+    rng = np.random.default_rng(seed)
+    shuffled = lines[rng.permutation(len(lines))]
+    flip = rng.random(len(shuffled)) < 0.5
+    shuffled[flip] = shapely.reverse(shuffled[flip])
+    return set(segment_lines(lines, length)[1]['SEG_ID']) ^ set(segment_lines(shuffled, length)[1]['SEG_ID'])
+
+
+if __name__ == '__main__':
+    # A 1000 ft square ring digitized from two corners, and a random network of crossing roads and loops
+    ring = shapely.linestrings([[(0, 0), (1000, 0), (1000, 1000), (0, 1000), (0, 0)],
+                                [(1000, 0), (1000, 1000), (0, 1000), (0, 0), (1000, 0)]])
+    assert set(segment_lines(ring[:1], 528)[1]['SEG_ID']) == set(segment_lines(ring[1:], 528)[1]['SEG_ID'])
+    rng = np.random.default_rng(1)
+    roads = [shapely.linestrings(rng.uniform(0, 20000, (rng.integers(2, 6), 2))) for _ in range(60)]
+    for _ in range(10):
+        centre, radius, angle = rng.uniform(0, 20000, 2), rng.uniform(300, 2000), np.sort(rng.uniform(0, 6.28, 7))
+        loop = np.c_[centre[0] + radius * np.cos(angle), centre[1] + radius * np.sin(angle)]
+        roads.append(shapely.linestrings(np.r_[loop, loop[:1]]))
+    changed = order_check(roads, 528)
+    print('{0} SEG_IDs change with the order of the input'.format(len(changed)))
+    assert not changed
@@ -0,0 +1,353 @@
+########################
+# Geoprocessing backend built on shapely, pyogrio and NumPy - runs anywhere, no ArcGIS license needed.
+#
+# Every operation takes Layers (see geoproc.layer) and returns a new Layer or a pandas DataFrame; inputs are never
+# modified and nothing is kept in a global environment, so a backend can be used from any number of processes at
+# once. Shapely 2 operations are vectorized over whole geometry arrays, spatial queries go through an STRtree and
+# intersections are tabulated with geoproc.overlay.
+# Distances are in the units of the layer's coordinate system (feet for the Rhode Island State Plane data).
+########################
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.ops import substring
+
+from geoproc.facilities import FacilityIndex
+from geoproc.layer import Layer, read_layer, write_layer
+from geoproc.line_overlap import LineOverlapIndex
+from geoproc.overlay import ZoneOverlay
+from geoproc.segment import segment_lines
+from geoproc.zonal import threshold_zonal_table
+
+
+class ShapelyBackend(object):
+    name = 'shapely'
+
+    def __init__(self, overlay_index='strtree', raster_cache=None):
+        """overlay_index is the spatial index used to tabulate intersections - 'strtree' or 'grid'. raster_cache is a
+        folder for memory-mapped copies of the rasters read by zonal_threshold (see geoproc.raster_io)."""
+        self.overlay_index = overlay_index
+        self.raster_cache = raster_cache
+        self.overlay = None
+
+    #### Input / output
+
+    def read(self, path, bbox=None):
+        """Read a vector dataset, optionally only the features intersecting bbox (xmin, ymin, xmax, ymax)."""
+        return read_layer(path, bbox=bbox)
+
+    def write(self, layer, path):
+        """Write a layer to path and return path."""
+        return write_layer(layer, path)
+
+    def cache_path(self, folder, name):
+        """Return the path of a spatially indexed dataset called name in folder (a GeoPackage)."""
+        return os.path.join(folder, name + '.gpkg')
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def delete(self, path):
+        """Delete a dataset - for a shapefile, with its sidecar files."""
+        base, extension = os.path.splitext(path)
+        for file in glob.glob(base + '.*') if extension.lower() == '.shp' else [path]:
+            if os.path.exists(file):
+                os.remove(file)
+
+    def copy(self, layer):
+        return Layer(layer.geometry.copy(), layer.attributes.copy(), layer.crs)
+
+    def table(self, layer, fields=None):
+        """Return the attributes of a layer as a dataframe indexed by feature ID."""
+        table = layer.attributes[fields] if fields is not None else layer.attributes.copy()
+        table.index = pd.Index(layer.values('FID'), name='FID')
+        return table
+
+    def count(self, layer):
+        return len(layer)
+
+    def extent(self, layer):
+        return layer.bounds()
+
+    def id_field(self, layer):
+        return 'FID'
+
+    def clear(self):
+        """Release intermediate data - layers are freed with the last reference to them, only the zone index of
+        tabulate_intersection is kept here."""
+        self.overlay = None
+
+    #### Feature operations
+
+    def select(self, layer, field, values):
+        """Features whose field value is one of values (Select with "field IN (values)")."""
+        return layer.take(np.isin(layer.values(field), list(values)))
+
+    def clip(self, layer, clip_layer):
+        """Parts of the features that fall inside clip_layer (Clip)."""
+        mask = shapely.union_all(clip_layer.geometry)
+        shapely.prepare(mask)
+        inside = layer.take(shapely.intersects(layer.geometry, mask))
+        inside.geometry = shapely.intersection(inside.geometry, mask)
+        return inside.take(~shapely.is_empty(inside.geometry))
+
+    def dissolve(self, layer):
+        """All features merged into one feature (Dissolve with no dissolve fields) - touching lines are merged into
+        continuous lines."""
+        merged = shapely.union_all(layer.geometry)
+        if shapely.get_dimensions(merged) == 1:
+            merged = shapely.line_merge(merged)
+        return Layer([merged], crs=layer.crs)
+
+    def buffer(self, layer, distance, end_type='ROUND'):
+        """A buffer polygon around each feature (Buffer with FULL sides and no dissolve). Buffers keep the input
+        attributes and get ORIG_FID, the ID of the input feature."""
+        buffers = Layer(shapely.buffer(layer.geometry, distance, cap_style=end_type.lower()), layer.attributes,
+                        layer.crs)
+        buffers.attributes['ORIG_FID'] = layer.values('FID')
+        return buffers
+
+    def generate_points_along_lines(self, layer, distance, include_end_points=True):
+        """Points every distance along each line part, starting at its first vertex (GeneratePointsAlongLines by
+        DISTANCE). Points get ORIG_FID, the ID of the line."""
+        parts, source = shapely.get_parts(layer.geometry, return_index=True)
+        lengths = shapely.length(parts)
+        counts = np.floor(lengths / distance).astype(int) + 1
+        part_of = np.repeat(np.arange(len(parts)), counts)
+        stations = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) * distance
+        if include_end_points:
+            ends = lengths > stations[np.cumsum(counts) - 1]
+            part_of = np.concatenate([part_of, np.flatnonzero(ends)])
+            stations = np.concatenate([stations, lengths[ends]])
+            order = np.lexsort((stations, part_of))
+            part_of, stations = part_of[order], stations[order]
+        points = shapely.line_interpolate_point(parts[part_of], stations)
+        return Layer(points, pd.DataFrame({'ORIG_FID': layer.values('FID')[source[part_of]]}), layer.crs)
+
+    def split_line_at_point(self, layer, points, search_radius):
+        """Lines split at every point within search_radius of them (SplitLineAtPoint). Segments keep the attributes
+        of the line they come from."""
+        parts, source = shapely.get_parts(layer.geometry, return_index=True)
+        part_index, point_index = shapely.STRtree(points.geometry).query(parts, predicate='dwithin',
+                                                                         distance=search_radius)
+        stations = shapely.line_locate_point(parts[part_index], points.geometry[point_index])
+
+        # Group the cut stations by line part
+        order = np.argsort(part_index, kind='stable')
+        part_index, stations = part_index[order], stations[order]
+        starts = np.searchsorted(part_index, np.arange(len(parts) + 1))
+
+        segments = []
+        segment_source = []
+        for i, part in enumerate(parts):
+            length = shapely.length(part)
+            stops = np.unique(np.concatenate([[0, length], np.clip(stations[starts[i]:starts[i + 1]], 0, length)]))
+            for start, end in zip(stops[:-1], stops[1:]):
+                segments.append(substring(part, start, end))
+                segment_source.append(source[i])
+        return Layer(segments, layer.attributes.iloc[segment_source], layer.crs)
+
+    def segment_lines(self, layer, length):
+        """Connected lines merged into routes and cut into segments of length along each route, with SEG_ID (a
+        stable ID), FROM_M and TO_M (Dissolve, GeneratePointsAlongLines and SplitLineAtPoint in one pass, see
+        geoproc.segment)."""
+        segments, table = segment_lines(layer.geometry, length)
+        return Layer(segments, table, layer.crs)
+
+    def snap(self, layer, snap_layer, distance):
+        """A copy of layer with its vertices snapped to snap_layer where they are within distance (Snap). The input
+        layer is not changed."""
+        snapped = Layer(layer.geometry, layer.attributes, layer.crs)
+        target = shapely.union_all(snap_layer.geometry)
+        snapped.geometry = shapely.snap(layer.geometry, target, distance)
+        return snapped
+
+    #### Overlay and proximity tables
+
+    def tabulate_intersection(self, zones, zone_field, classes, class_field=None):
+        """Area of classes inside each zone, and its percentage of the zone area (TabulateIntersection). Returns a
+        dataframe with zone_field, class_field (if given), AREA and PERCENTAGE - zones with no overlap are left
+        out. The zone index is kept and reused while the same zones are tabulated against other class layers."""
+        if self.overlay is None or self.overlay[0] is not zones or self.overlay[1].zone_field != zone_field:
+            self.overlay = (zones, ZoneOverlay(zones.geometry, zones.values(zone_field), zone_field,
+                                               index=self.overlay_index))
+        class_values = classes.values(class_field) if class_field else None
+        return self.overlay[1].tabulate(classes.geometry, class_values, class_field)
+
+    def spatial_join(self, target, join, join_operation='JOIN_ONE_TO_ONE', match_option='INTERSECT'):
+        """Target features with Join_Count, the number of join features matching them, and TARGET_FID
+        (SpatialJoin with KEEP_ALL). JOIN_ONE_TO_MANY gives one feature per match instead, with JOIN_FID.
+        match_option is INTERSECT, WITHIN, CONTAINS or SHARE_A_LINE_SEGMENT_WITH. Join feature attributes are not
+        carried over."""
+        predicate = {'INTERSECT': 'intersects', 'WITHIN': 'within', 'CONTAINS': 'contains',
+                     'SHARE_A_LINE_SEGMENT_WITH': 'intersects'}[match_option]
+        join_index, target_index = shapely.STRtree(join.geometry).query(target.geometry, predicate=predicate)[::-1]
+        if match_option == 'SHARE_A_LINE_SEGMENT_WITH':
+            shared = shapely.length(shapely.intersection(target.geometry[target_index], join.geometry[join_index]))
+            target_index, join_index = target_index[shared > 0], join_index[shared > 0]
+
+        target_ids = target.values('FID')
+        if join_operation == 'JOIN_ONE_TO_ONE':
+            joined = Layer(target.geometry, target.attributes, target.crs)
+            joined.attributes['Join_Count'] = np.bincount(target_index, minlength=len(target))
+            joined.attributes['TARGET_FID'] = target_ids
+            return joined
+
+        # One feature per match, plus the unmatched target features with a Join_Count of 0
+        unmatched = np.setdiff1d(np.arange(len(target)), target_index)
+        rows = np.concatenate([target_index, unmatched])
+        order = np.argsort(rows, kind='stable')
+        joined = target.take(rows[order])
+        joined.attributes['Join_Count'] = np.concatenate([np.ones(len(target_index), dtype=int),
+                                                          np.zeros(len(unmatched), dtype=int)])[order]
+        joined.attributes['TARGET_FID'] = target_ids[rows[order]]
+        joined.attributes['JOIN_FID'] = np.concatenate([join.values('FID')[join_index],
+                                                        np.full(len(unmatched), -1)])[order]
+        return joined
+
+    def near(self, layer, near_layer):
+        """Nearest near_layer feature to each feature and the distance to it (GenerateNearTable with CLOSEST).
+        Returns a dataframe with IN_FID, NEAR_FID and NEAR_DIST."""
+        (in_index, near_index), distance = shapely.STRtree(near_layer.geometry).query_nearest(
+            layer.geometry, return_distance=True, all_matches=False)
+        return pd.DataFrame({'IN_FID': layer.values('FID')[in_index],
+                             'NEAR_FID': near_layer.values('FID')[near_index],
+                             'NEAR_DIST': distance})
+
+    def facility_index(self, layers, types):
+        """One index over the point layers of several facility types (types holds the name of each layer's type),
+        for near_facilities - build it once and query it for every town."""
+        return FacilityIndex(np.concatenate([layer.geometry for layer in layers]),
+                             np.concatenate([layer.values('FID') for layer in layers]),
+                             np.repeat(types, [len(layer) for layer in layers]))
+
+    def near_facilities(self, layer, index, k=1, types=None):
+        """The k nearest facilities of a facility_index (of types, or of any type) to each feature, by distance to
+        its geometry (GenerateNearTable with several near features). Returns a dataframe with IN_FID, NEAR_RANK,
+        NEAR_FID, NEAR_TYPE and NEAR_DIST."""
+        table = index.nearest(layer.geometry, k, types)
+        table.insert(0, 'IN_FID', layer.values('FID')[table.pop('IN_INDEX').to_numpy(dtype=int)])
+        return table
+
+    def line_overlap_index(self, layer, tolerance=50, max_angle=20):
+        """Index of a line layer (e.g. bike paths) for shared_length - build it once and query it for every
+        town. The layer is only read, never edited."""
+        return LineOverlapIndex(layer.geometry, layer.values('FID'), tolerance, max_angle)
+
+    def shared_length(self, layer, index):
+        """Length of each line feature running along the lines of a line_overlap_index, within its tolerance and
+        angle, and the number of those lines (replaces Snap and a SpatialJoin with SHARE_A_LINE_SEGMENT_WITH).
+        Returns a dataframe with IN_FID, SHARED_LEN and OVERLAP_COUNT for every feature, 0 where there is no
+        overlap."""
+        overlap = index.shared_length(layer.geometry)
+        table = pd.DataFrame({'IN_FID': layer.values('FID'), 'SHARED_LEN': 0.0, 'OVERLAP_COUNT': 0})
+        rows = overlap['IN_INDEX'].to_numpy(dtype=int)
+        table.loc[rows, 'SHARED_LEN'] = overlap['SHARED_LEN'].to_numpy()
+        table.loc[rows, 'OVERLAP_COUNT'] = overlap['OVERLAP_COUNT'].to_numpy()
+        return table
+
+    def join_field(self, layer, key_field, table, table_key, fields):
+        """A copy of layer with fields from a dataframe joined on key_field = table_key (JoinField). Features with no
+        match get NaN."""
+        lookup = table.drop_duplicates(table_key).set_index(table_key)
+        joined = Layer(layer.geometry, layer.attributes, layer.crs)
+        for field in fields:
+            joined.attributes[field] = lookup[field].reindex(layer.values(key_field)).to_numpy()
+        return joined
+
+    def merge(self, layers, source_field=None, sources=None):
+        """All features of layers in one layer (Merge), optionally with source_field set to the matching entry of
+        sources for the features of each layer."""
+        attributes = []
+        for i, layer in enumerate(layers):
+            table = layer.attributes.copy()
+            if source_field:
+                table[source_field] = sources[i]
+            attributes.append(table)
+        return Layer(np.concatenate([layer.geometry for layer in layers]), pd.concat(attributes, ignore_index=True),
+                     layers[0].crs)
+
+    #### Creating features
+
+    def points_from_xy(self, x, y, crs=None):
+        """A point layer with X and Y fields from coordinate arrays (MakeXYEventLayer). crs is an EPSG code."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        return Layer(shapely.points(x, y), pd.DataFrame({'X': x, 'Y': y}),
+                     'EPSG:{0}'.format(crs) if crs is not None else None)
+
+    def create_fishnet(self, extent, cell_width, cell_height, crs=None):
+        """A grid of rectangular cells starting at the lower left corner of extent (xmin, ymin, xmax, ymax) and
+        covering it (CreateFishnet with POLYGON geometry)."""
+        xmin, ymin, xmax, ymax = extent
+        columns = max(1, int(np.ceil((xmax - xmin) / cell_width)))
+        rows = max(1, int(np.ceil((ymax - ymin) / cell_height)))
+        x, y = np.meshgrid(xmin + np.arange(columns) * cell_width, ymin + np.arange(rows) * cell_height)
+        cells = shapely.box(x.ravel(), y.ravel(), x.ravel() + cell_width, y.ravel() + cell_height)
+        return Layer(cells, crs='EPSG:{0}'.format(crs) if crs is not None else None)
+
+    #### Rasters
+
+    def raster_to_polygon(self, raster, min_value=None, bbox=None):
+        """Polygons of the raster cells with values >= min_value (SetNull + RasterToPolygon with NO_SIMPLIFY),
+        optionally only within bbox. Polygons get gridcode, the cell value."""
+        import rasterio
+        from rasterio.features import shapes
+        from shapely.geometry import shape
+
+        with rasterio.open(raster) as src:
+            window = raster_window(src, bbox or src.bounds)
+            data = src.read(1, window=window, masked=True, boundless=True)
+            transform = src.window_transform(window)
+            crs = src.crs.to_wkt() if src.crs else None
+        valid = ~np.ma.getmaskarray(data)
+        if min_value is not None:
+            valid &= data.filled(0) >= min_value
+        polygons = [(shape(geometry), value)
+                    for geometry, value in shapes(data.filled(0).astype(np.int32), mask=valid, transform=transform)]
+        return Layer([polygon for polygon, value in polygons],
+                     pd.DataFrame({'gridcode': [int(value) for polygon, value in polygons]}), crs)
+
+    def zonal_threshold(self, zones, zone_field, raster, min_value):
+        """COUNT and AREA of the raster cells >= min_value in each zone, their PERCENTAGE of the zone area and their
+        MEAN value, in one pass over the raster (see geoproc.zonal)."""
+        return threshold_zonal_table(zones.geometry, zones.values(zone_field), raster, min_value, zone_field,
+                                     self.raster_cache)
+
+    def zonal_statistics_as_table(self, zones, zone_field, raster, statistic='MEAN', min_value=None):
+        """A statistic of the raster cells whose centers fall in each zone, ignoring NoData and, optionally, values
+        under min_value (ZonalStatisticsAsTable). Returns a dataframe with zone_field, COUNT, AREA and the
+        statistic - zones with no cells are left out."""
+        import rasterio
+        from rasterio.features import geometry_mask
+
+        reducers = {'MEAN': np.mean, 'SUM': np.sum, 'MIN': np.min, 'MAX': np.max, 'STD': np.std}
+        rows = []
+        with rasterio.open(raster) as src:
+            cell_area = abs(src.transform.a * src.transform.e)
+            for zone_id, zone in zip(zones.values(zone_field), zones.geometry):
+                window = raster_window(src, shapely.bounds(zone))
+                data = src.read(1, window=window, masked=True, boundless=True)
+                inside = geometry_mask([zone], data.shape, src.window_transform(window), invert=True)
+                values = np.asarray(data[inside & ~np.ma.getmaskarray(data)], dtype=float)
+                if min_value is not None:
+                    values = values[values >= min_value]
+                if values.size:
+                    rows.append((zone_id, values.size, values.size * cell_area, reducers[statistic](values)))
+        return pd.DataFrame(rows, columns=[zone_field, 'COUNT', 'AREA', statistic])
+
+
+def raster_window(src, bounds):
+    """Return the window of whole raster cells of an open rasterio dataset covering bounds (xmin, ymin, xmax,
+    ymax)."""
+    from rasterio.windows import Window, from_bounds
+
+    window = from_bounds(*bounds, transform=src.transform)
+    col_off = int(np.floor(window.col_off))
+    row_off = int(np.floor(window.row_off))
+    return Window(col_off, row_off, int(np.ceil(window.col_off + window.width)) - col_off,
+                  int(np.ceil(window.row_off + window.height)) - row_off)
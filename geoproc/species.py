@@ -0,0 +1,44 @@
+########################
+# Species splitter for the species heatmaps (CC_05 and CC_07).
+#
+# The heatmap scripts used to read the combined species csv with csv.reader and split its rows into two hardcoded
+# lists with a substring test (row[0] in 'Emperor Goose'), so every row of any other species went into the second
+# list. The coordinates were kept as strings, put into dataframes column by column and written to one csv per species,
+# only to be read back for MakeXYEventLayer. split_species reads the csv once, in chunks, and partitions the rows by
+# their exact species name into float coordinate arrays, for any number of species, that go straight to
+# backend.points_from_xy.
+########################
+
+import numpy as np
+import pandas as pd
+
+
+def split_species(path, species=None, name_field='Animal_Name', x_field='Longitude', y_field='Latitude',
+                  chunksize=1000000):
+    """Read a csv of species sightings in chunks of chunksize rows and split it by exact species name. Returns a
+    dictionary of species name -> (x, y) float64 coordinate arrays, for the names in species (in that order, empty
+    arrays for species not in the csv) or every species in the csv, in order of first appearance. Rows without
+    coordinates are left out."""
+    parts = {name: [] for name in species} if species is not None else {}
+    chunks = pd.read_csv(path, usecols=[name_field, x_field, y_field], chunksize=chunksize,
+                         dtype={name_field: str, x_field: float, y_field: float})
+    for chunk in chunks:
+        chunk = chunk.dropna(subset=[x_field, y_field])
+        codes, names = pd.factorize(chunk[name_field])
+        if not len(names):
+            continue
+
+        # One stable sort by species, then each species is a contiguous slice of the coordinates
+        order = np.argsort(codes, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(codes[codes >= 0], minlength=len(names)))] + np.sum(codes < 0)
+        x = chunk[x_field].to_numpy(dtype=np.float64)[order]
+        y = chunk[y_field].to_numpy(dtype=np.float64)[order]
+        for i, name in enumerate(names):
+            if species is None:
+                parts.setdefault(name, [])
+            if name in parts:
+                parts[name].append((x[bounds[i]:bounds[i + 1]], y[bounds[i]:bounds[i + 1]]))
+
+    return {name: (np.concatenate([x for x, y in found]) if found else np.array([]),
+                   np.concatenate([y for x, y in found]) if found else np.array([]))
+            for name, found in parts.items()}
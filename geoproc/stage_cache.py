@@ -0,0 +1,97 @@
+########################
+# Content-addressed cache of the intermediate results of road_prioritization_tool.
+#
+# Every stage of a town (study area, clipped roads, segments, buffer zones, each metric table) used to be recomputed
+# on every run. StageCache stores the result of a stage under a key that is a hash of everything it depends on:
+#
+#     1. the stage name and its parameters (town, segment length, buffer distance, ...)
+#     2. the keys of the stages it is computed from, so changing one parameter changes the key of that stage and of
+#        every stage downstream of it, and only those are recomputed
+#     3. the fingerprints (sizes and modification times) of the source files it reads
+#
+# Layers are stored with the backend (backend.cache_path), tables as pickled dataframes, one folder per key. An
+# entry is only used once its entry.json is written, so an interrupted run never leaves a half written result. The
+# cache is kept under max_size bytes by deleting the least recently used entries.
+########################
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from geoproc.extract_cache import fingerprint
+
+
+class StageCache(object):
+    def __init__(self, folder, backend, max_size=4 * 1024 ** 3):
+        """Cache of stage results in folder, at most max_size bytes (default 4 GB)."""
+        self.folder = folder
+        self.backend = backend
+        self.max_size = max_size
+
+    def key(self, name, inputs=(), sources=(), **params):
+        """Return the key of a stage - a hash of its name, inputs (keys of upstream stages or anything JSON
+        serializable), the fingerprints of its source files and its parameters."""
+        description = [name, list(inputs), [[os.path.abspath(source), fingerprint(source)] for source in sources],
+                       params]
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def run(self, name, function, inputs=(), sources=(), **params):
+        """Return (result of function(), key of the stage), from the cache if the stage was already run with the same
+        inputs, sources and parameters. function returns a layer or a dataframe."""
+        key = self.key(name, inputs, sources, **params)
+        entry = os.path.join(self.folder, key)
+        info_path = os.path.join(entry, 'entry.json')
+        if os.path.exists(info_path):
+            # Another process may evict the entry while it is read - it is then computed again
+            try:
+                with open(info_path) as info:
+                    kind = json.load(info)['kind']
+                os.utime(info_path)
+                if kind == 'table':
+                    return pd.read_pickle(os.path.join(entry, 'table.pkl')), key
+                return self.backend.copy(self.backend.read(self.backend.cache_path(entry, 'layer'))), key
+            except OSError:
+                pass
+
+        result = function()
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry, exist_ok=True)
+        if isinstance(result, pd.DataFrame):
+            kind = 'table'
+            result.to_pickle(os.path.join(entry, 'table.pkl'))
+        else:
+            kind = 'layer'
+            self.backend.write(result, self.backend.cache_path(entry, 'layer'))
+
+        # entry.json last - the entry is complete once it exists
+        temp_path = '{0}.{1}.tmp'.format(info_path, os.getpid())
+        with open(temp_path, 'w') as info:
+            json.dump({'name': name, 'kind': kind, 'params': params, 'created': time.time()}, info, default=str)
+        os.replace(temp_path, info_path)
+        self.evict(keep=key)
+        return result, key
+
+    def evict(self, keep=None):
+        """Delete the least recently used entries until the cache is under max_size, never the entry keep. Entries
+        another process deletes while they are measured are skipped."""
+        entries = []
+        for key in os.listdir(self.folder):
+            info_path = os.path.join(self.folder, key, 'entry.json')
+            try:
+                used = os.path.getmtime(info_path)
+                size = sum(os.path.getsize(os.path.join(root, file))
+                           for root, folders, files in os.walk(os.path.join(self.folder, key)) for file in files)
+            except OSError:
+                continue
+            entries.append((used, key, size))
+        total = sum(size for used, key, size in entries)
+        for used, key, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if key != keep:
+                shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+                total -= size
@@ -0,0 +1,86 @@
+########################
+# Raster-native zonal statistics for the canopy metrics of road_prioritization_tool.
+#
+# The canopy metrics used to be SetNull(VALUE < 8) on Canopy_RISPft.tif, RasterToPolygon of the result,
+# TabulateIntersection of the polygons (PCT_CANOPY) and a separate ZonalStatisticsAsTable MEAN (AVG_CANOPY_HEIGHT).
+# Polygonizing the canopy raster was the slowest and most memory hungry step. threshold_zonal_table skips it:
+#
+#     1. zone_cells finds the raster cells whose centers fall in each zone, for all zones at once (zones can overlap,
+#        as road buffer zones do, so each zone keeps its own list of cells instead of one zone raster)
+#     2. The raster is read once, one strip of rows at a time over the zones' extent (see geoproc.raster_io), and
+#        the cells at or above min_value are summed per zone with np.bincount
+#
+# The percentage is the area of those cells over the zone area, as TabulateIntersection gives for the polygons, and
+# the mean is over the same cells, as ZonalStatisticsAsTable gives on the SetNull raster.
+########################
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from geoproc.raster_io import RasterReader
+
+
+def zone_cells(zones, transform, chunk_size=5000):
+    """Return (zone index, row, column) of every raster cell whose center falls inside each zone, for a north-up
+    raster with an affine transform."""
+    zones = np.asarray(zones, dtype=object)
+    zone_parts, row_parts, col_parts = [], [], []
+    for start in range(0, len(zones), chunk_size):
+        chunk = zones[start:start + chunk_size]
+        xmin, ymin, xmax, ymax = shapely.bounds(chunk).T
+
+        # Range of cells whose centers fall in each zone's bounding box
+        col0 = np.ceil((xmin - transform.c) / transform.a - 0.5).astype(np.int64)
+        col1 = np.floor((xmax - transform.c) / transform.a - 0.5).astype(np.int64)
+        row0 = np.ceil((ymax - transform.f) / transform.e - 0.5).astype(np.int64)
+        row1 = np.floor((ymin - transform.f) / transform.e - 0.5).astype(np.int64)
+        columns = np.maximum(col1 - col0 + 1, 0)
+        counts = columns * np.maximum(row1 - row0 + 1, 0)
+
+        zone = np.repeat(np.arange(len(chunk)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        row = row0[zone] + offset // np.maximum(columns[zone], 1)
+        col = col0[zone] + offset % np.maximum(columns[zone], 1)
+        inside = shapely.contains_xy(chunk[zone], transform.c + transform.a * (col + 0.5),
+                                     transform.f + transform.e * (row + 0.5))
+        zone_parts.append(zone[inside] + start)
+        row_parts.append(row[inside])
+        col_parts.append(col[inside])
+    return np.concatenate(zone_parts), np.concatenate(row_parts), np.concatenate(col_parts)
+
+
+def threshold_zonal_table(zones, zone_ids, raster, min_value, zone_field='ORIG_FID', cache_folder=None,
+                          max_pixels=1 << 22):
+    """Return a dataframe with zone_field, COUNT and AREA of the cells >= min_value in each zone, their PERCENTAGE
+    of the zone area and their MEAN value. Zones with no such cells are left out. The raster is streamed in strips of
+    at most max_pixels cells, through a memory-mapped copy in cache_folder if given (see geoproc.raster_io)."""
+    zones = np.asarray(zones, dtype=object)
+    zone_ids = np.asarray(zone_ids)
+    count = np.zeros(len(zones))
+    total = np.zeros(len(zones))
+    with RasterReader(raster, cache_folder=cache_folder) as reader:
+        cell_area = abs(reader.transform.a * reader.transform.e)
+        zone, row, col = zone_cells(zones, reader.transform)
+        order = np.argsort(row, kind='stable')
+        zone, row, col = zone[order], row[order], col[order]
+        bounds = shapely.total_bounds(zones) if len(zones) else None
+
+        # One pass over the strips of the raster covered by the zones
+        for window, data in reader.strips(bounds, max_pixels) if len(zone) else []:
+            first, last = np.searchsorted(row, [window.row_off, window.row_off + window.height])
+            cells = slice(first, last)
+            in_strip = (col[cells] >= window.col_off) & (col[cells] < window.col_off + window.width)
+            values = data[row[cells][in_strip] - window.row_off, col[cells][in_strip] - window.col_off]
+            keep = ~np.ma.getmaskarray(values) & (np.asarray(values.filled(0), dtype=float) >= min_value)
+            strip_zones = zone[cells][in_strip][keep]
+            count += np.bincount(strip_zones, minlength=len(zones))
+            total += np.bincount(strip_zones, weights=np.asarray(values.filled(0), dtype=float)[keep],
+                                 minlength=len(zones))
+
+    found = count > 0
+    table = pd.DataFrame({zone_field: zone_ids[found], 'COUNT': count[found].astype(np.int64),
+                          'AREA': count[found] * cell_area})
+    table['PERCENTAGE'] = table['AREA'] / shapely.area(zones[found]) * 100
+    table['MEAN'] = total[found] / count[found]
+    return table